@@ -7,6 +7,8 @@ export async function POST({ request }: { request: Request }) {
         const images = formData.getAll('images') as File[];
         const format = formData.get('format') as string || 'base64';
         const include_info = formData.get('include_info') === 'true';
+        // Stream NDJSON results through as each image finishes instead of buffering them
+        const stream = formData.get('stream') === 'true' || (request.headers.get('accept') || '').includes('application/x-ndjson');
         
         if (!images || images.length === 0) {
             return Response.json({ error: 'No images provided' }, { status: 400 });
@@ -19,6 +21,7 @@ export async function POST({ request }: { request: Request }) {
         });
         pythonFormData.append('format', format);
         pythonFormData.append('include_info', include_info.toString());
+        pythonFormData.append('stream', stream.toString());
 
         // Forward to Python API
         const response = await fetch('http://localhost:5000/api/remove-background-batch', {
@@ -31,6 +34,15 @@ export async function POST({ request }: { request: Request }) {
             return Response.json(errorResult, { status: response.status });
         }
         
+        if (stream && response.body) {
+            return new Response(response.body, {
+                headers: {
+                    'Content-Type': 'application/x-ndjson',
+                    'Cache-Control': 'no-cache'
+                }
+            });
+        }
+        
         const result = await response.json();
         fs.writeFileSync('image.png', JSON.stringify(result.images, null, 2)); // Debugging line
         return Response.json(result);
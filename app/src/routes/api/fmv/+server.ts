@@ -138,16 +138,22 @@ class ComicPricingDetails {
 
             // Call comparison API
             try {
+                // Send images as multipart file parts instead of JSON arrays of ints
+                const compareForm = new FormData();
+                compareForm.append('target_image', Buffer.from(imageBuffer), { filename: 'target' });
+                imageBuffers.forEach((buf, index) => {
+                    compareForm.append('comparison_images', Buffer.from(buf), { filename: `comparison_${index}` });
+                });
+                // Only the best match is used below
+                compareForm.append('top_k', '1');
+
                 const compareResponse = await fetch('http://localhost:5000/api/compare', {
                     method: 'POST',
                     headers: { 
-                        'Content-Type': 'application/json',
+                        ...compareForm.getHeaders(),
                         'Accept': 'application/json'
                     },
-                    body: JSON.stringify({
-                        target_image: Array.from(new Uint8Array(imageBuffer)),
-                        comparison_images: imageBuffers.map(buf => Array.from(new Uint8Array(buf)))
-                    })
+                    body: compareForm
                 });
 
                 if (!compareResponse.ok) {
@@ -188,12 +194,10 @@ class ComicPricingDetails {
                 const response = await fetch('http://localhost:5000/api/detect-grade', {
                     method: "POST",
                     headers: {
-                        'Content-Type': 'application/json',
+                        'Content-Type': 'application/octet-stream',
                         'Accept': 'application/json'
                     },
-                    body: JSON.stringify({
-                        image: Array.from(new Uint8Array(imageBuffer)),
-                    })
+                    body: Buffer.from(imageBuffer)
                 })
                 let cgcGrade = false;
                 let cgcIssue = false
@@ -0,0 +1,211 @@
+"""
+Accuracy and latency of the ONNX Runtime backends against the eager PyTorch path.
+
+RMBG and the CLIP vision tower are exported to ONNX (fp32, and int8 with
+dynamic quantization) when the exports are missing, then run on the same
+synthetic inputs as the eager models:
+
+    rmbg  mask IoU at a 0.5 threshold and mean absolute mask error, per image
+    clip  cosine drift (1 - cosine similarity) of each embedding
+
+Latency is measured per batch size over repeated passes. For RMBG it covers
+the forward pass on prepared inputs. For CLIP it runs from resized images to
+embeddings, so sentence-transformers' own preprocessing is included on both
+sides.
+
+Usage:
+    python bench/bench_backends.py [--models stub|local] [--targets rmbg,clip] [--variants onnx,onnx-int8]
+                                   [--images 8] [--batch-sizes 1,4] [--repeats 10]
+                                   [--onnx-dir DIR] [--output results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import synthetic  # noqa: E402
+
+TARGETS = ('rmbg', 'clip')
+VARIANTS = ('onnx', 'onnx-int8')
+
+
+def latency(call, repeats):
+    """Median and p95 milliseconds of call() after one untimed pass"""
+    call()
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'p50': round(samples[len(samples) // 2], 1),
+        'p95': round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 1)
+    }
+
+
+def mask_agreement(expected, actual):
+    """IoU of the thresholded masks and mean absolute error, per image"""
+    expected = expected.flatten(1)
+    actual = actual.flatten(1)
+    expected_mask, actual_mask = expected > 0.5, actual > 0.5
+    union = (expected_mask | actual_mask).sum(dim=1).clamp(min=1)
+    iou = (expected_mask & actual_mask).sum(dim=1) / union
+    error = (expected - actual).abs().mean(dim=1)
+    return {
+        'mask_iou_mean': round(iou.mean().item(), 5),
+        'mask_iou_min': round(iou.min().item(), 5),
+        'mask_mae_mean': round(error.mean().item(), 6)
+    }
+
+
+def embedding_drift(expected, actual):
+    """1 - cosine similarity of each embedding with its eager counterpart"""
+    import torch
+
+    drift = 1 - torch.nn.functional.cosine_similarity(expected.float(), actual.float(), dim=-1)
+    return {
+        'cosine_drift_mean': round(drift.mean().item(), 6),
+        'cosine_drift_max': round(drift.max().item(), 6)
+    }
+
+
+def bench_rmbg(args, batch_sizes):
+    from python.backgroundRemover import BackgroundRemover, prepare_model_input
+    import torch
+
+    remover = BackgroundRemover()
+    inputs = torch.stack([
+        prepare_model_input(synthetic.photo(1200, 1600, seed))[0] for seed in range(args.images)
+    ])
+    eager = remover.build_backend('torch')
+    expected = eager(inputs)
+
+    results = []
+    for variant in ('torch',) + tuple(args.variants):
+        backend = eager if variant == 'torch' else remover.build_backend('onnx', int8=variant == 'onnx-int8')
+        result = {'target': 'rmbg', 'backend': variant}
+        if variant != 'torch':
+            result['accuracy'] = mask_agreement(expected, backend(inputs))
+        result['latency_ms'] = {
+            f'batch_{n}': latency(lambda: backend(inputs[:n]), args.repeats) for n in batch_sizes
+        }
+        results.append(result)
+    return results
+
+
+def bench_clip(args, batch_sizes):
+    from python.compareImages import EmbeddingCache, ImageSimilarityComparer
+
+    comparer = ImageSimilarityComparer(cache=EmbeddingCache('clip-ViT-B-32', max_entries=0))
+    # Images as the comparer hands them to the encoder: shortest side at CLIP's input size
+    images = [synthetic.photo(298, 224, seed) for seed in range(args.images)]
+
+    def eager(batch):
+        return comparer.model.encode(batch, batch_size=len(batch), convert_to_tensor=True,
+                                     show_progress_bar=False, device=comparer.device).cpu()
+
+    expected = eager(images)
+
+    results = []
+    for variant in ('torch',) + tuple(args.variants):
+        if variant == 'torch':
+            encode = eager
+        else:
+            backend = comparer.build_vision_backend('onnx', int8=variant == 'onnx-int8')
+
+            def encode(batch, backend=backend):
+                return backend(comparer.pixel_values(batch))
+        result = {'target': 'clip', 'backend': variant}
+        if variant != 'torch':
+            result['accuracy'] = embedding_drift(expected, encode(images))
+        result['latency_ms'] = {
+            f'batch_{n}': latency(lambda: encode(images[:n]), args.repeats) for n in batch_sizes
+        }
+        results.append(result)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', choices=('stub', 'local'), default='stub')
+    parser.add_argument('--targets', default=','.join(TARGETS))
+    parser.add_argument('--variants', default=','.join(VARIANTS))
+    parser.add_argument('--images', type=int, default=8, help='Synthetic images compared per target')
+    parser.add_argument('--batch-sizes', default='1,4')
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--onnx-dir', help='Where exports are kept. Defaults to ONNX_MODEL_DIR, '
+                                           'or a temporary directory with --models stub')
+    parser.add_argument('--output', help='Write the JSON results here as well as to stdout')
+    args = parser.parse_args(argv)
+    args.variants = [v for v in args.variants.split(',') if v]
+    targets = [t for t in args.targets.split(',') if t]
+    for name, values, allowed in (('targets', targets, TARGETS), ('variants', args.variants, VARIANTS)):
+        unknown = set(values) - set(allowed)
+        if unknown:
+            parser.error(f"Unknown {name}: {', '.join(sorted(unknown))}")
+    batch_sizes = [min(int(v), args.images) for v in args.batch_sizes.split(',') if v]
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    with tempfile.TemporaryDirectory(prefix='onnx-') as scratch_dir:
+        # The services read these when python.config is first imported
+        os.environ.update(RMBG_BACKEND='torch', CLIP_BACKEND='torch', CLIP_CACHE_SIZE='0')
+        if args.onnx_dir or args.models == 'stub':
+            os.environ['ONNX_MODEL_DIR'] = args.onnx_dir or scratch_dir
+        if args.models == 'stub':
+            import stub_models
+
+            stub_models.install()
+        else:
+            os.environ.update(HF_HUB_OFFLINE='1', TRANSFORMERS_OFFLINE='1')
+        sys.path.insert(0, SERVER_DIR)
+        os.chdir(SERVER_DIR)
+
+        results = []
+        for target in targets:
+            results.extend(bench_rmbg(args, batch_sizes) if target == 'rmbg' else bench_clip(args, batch_sizes))
+
+    for result in results:
+        eager = next(r for r in results if r['target'] == result['target'] and r['backend'] == 'torch')
+        speedups = {
+            batch: round(eager['latency_ms'][batch]['p50'] / timing['p50'], 2) if timing['p50'] else None
+            for batch, timing in result['latency_ms'].items()
+        }
+        result['speedup_vs_torch'] = speedups
+        timings = ' '.join(
+            f"{batch} p50 {timing['p50']}ms ({speedups[batch]}x)" for batch, timing in result['latency_ms'].items()
+        )
+        print(f"{result['target']:<5} {result['backend']:<10} {timings}  {result.get('accuracy', '')}", file=sys.stderr)
+
+    import torch
+
+    report = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'models': args.models,
+            'images': args.images,
+            'repeats': args.repeats,
+            'torch_threads': torch.get_num_threads(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results
+    }
+    output = json.dumps(report, indent=2)
+    if output_path:
+        with open(output_path, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
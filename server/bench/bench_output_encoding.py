@@ -0,0 +1,94 @@
+"""
+Encode time and output size of each background removal output codec.
+
+Builds a synthetic photo-like RGBA image (smooth gradients, sensor-like noise
+and a soft-edged foreground mask) per resolution and encodes it with every
+OutputEncoding preset.
+
+Usage:
+    python bench/bench_output_encoding.py [--repeat 3] [--sizes 1200x1600,3024x4032]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from PIL import Image, ImageChops, ImageDraw, ImageFilter
+
+from python.imageEncoding import OutputEncoding
+
+DEFAULT_SIZES = '1200x1600,2448x3264'
+
+PRESETS = {
+    'png-default': dict(codec='png', compress_level=6),
+    'png-fast': dict(codec='png', compress_level=1),
+    'png-small': dict(codec='png', compress_level=9),
+    'webp-lossless': dict(codec='webp', lossless=True, quality=50),
+    'webp-q90': dict(codec='webp', quality=90),
+    'webp-q75': dict(codec='webp', quality=75),
+    'mask-png': dict(codec='mask', compress_level=6),
+    'png-fast-2048': dict(codec='png', compress_level=1, max_dimension=2048),
+    'webp-q85-2048': dict(codec='webp', quality=85, max_dimension=2048),
+}
+
+
+def synthetic_rgba(width, height):
+    """Photo-like RGBA test image: gradients plus noise, with a soft elliptical cutout"""
+    gradient = Image.linear_gradient('L').resize((width, height))
+    radial = Image.radial_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 24)
+    rgb = Image.merge('RGB', (gradient, radial, ImageChops.add(gradient, noise, scale=2.0)))
+
+    mask = Image.new('L', (width, height), 0)
+    ImageDraw.Draw(mask).ellipse((width * 0.15, height * 0.1, width * 0.85, height * 0.9), fill=255)
+    rgb.putalpha(mask.filter(ImageFilter.GaussianBlur(max(2, width // 200))))
+    return rgb
+
+
+def bench_size(width, height, repeat):
+    source = synthetic_rgba(width, height)
+    results = []
+    for name, options in PRESETS.items():
+        encoding = OutputEncoding(**options)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            image = source
+            target_size = encoding.target_size(source.size)
+            if target_size != source.size:
+                image = source.resize(target_size, Image.BILINEAR, reducing_gap=2.0)
+            data = encoding.encode(image)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results.append({
+            'resolution': f'{width}x{height}',
+            'preset': name,
+            'options': options,
+            'mimetype': encoding.mimetype,
+            'encode_ms_median': round(timings[len(timings) // 2], 2),
+            'size_kb': round(len(data) / 1024, 1),
+        })
+        print(f"{width}x{height} {name:>14}: {results[-1]['encode_ms_median']:8.1f} ms "
+              f"{results[-1]['size_kb']:9.1f} KB", file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma separated WIDTHxHEIGHT list')
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes.split(','):
+        width, height = (int(v) for v in size.lower().split('x'))
+        results.extend(bench_size(width, height, args.repeat))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Latency and peak memory of the RMBG pre/postprocessing pipeline, before and after
+the single-resize rewrite, for several input resolutions.
+
+The model forward pass is replaced by a random mask so only the image work is
+measured. Each (pipeline, resolution) case runs in a fresh subprocess so its
+peak RSS is not polluted by earlier cases.
+
+Usage:
+    python bench/bench_rmbg_postprocess.py [--repeat 5] [--sizes 1200x1600,3024x4032]
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+DEFAULT_SIZES = '640x480,1200x1600,3024x4032,4000x6000'
+
+
+def legacy_pipeline(original_image, pred_model_space):
+    """The original pad -> Resize -> LANCZOS full-size mask -> NumPy copy pipeline"""
+    import numpy as np
+    import torchvision.transforms as transforms
+    from PIL import Image
+
+    transform_image = transforms.Compose([
+        transforms.Resize((1024, 1024)),
+        transforms.ToTensor(),
+        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+    ])
+    width, height = original_image.size
+    max_dim = max(width, height)
+    square_image = Image.new('RGB', (max_dim, max_dim), (0, 0, 0))
+    left = (max_dim - width) // 2
+    top = (max_dim - height) // 2
+    square_image.paste(original_image, (left, top))
+    transform_image(square_image).unsqueeze(0)
+
+    pred_pil = transforms.ToPILImage()(pred_model_space.squeeze())
+    padded_mask = pred_pil.resize((max_dim, max_dim), Image.LANCZOS)
+    mask = padded_mask.crop((left, top, left + width, top + height))
+    rgba = original_image.convert('RGBA')
+    output_array = np.array(rgba).copy()
+    output_array[:, :, 3] = np.array(mask)
+    return Image.fromarray(output_array, 'RGBA')
+
+
+def current_pipeline(original_image, pred_model_space):
+    """The pipeline used by BackgroundRemover"""
+    from python.backgroundRemover import prepare_model_input, apply_mask_alpha
+
+    _, padding_info = prepare_model_input(original_image)
+    return apply_mask_alpha(original_image, pred_model_space, padding_info)
+
+
+PIPELINES = {
+    'legacy': legacy_pipeline,
+    'current': current_pipeline,
+}
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_case(pipeline_name, width, height, repeat):
+    """Run one case in this process and print a JSON result line"""
+    import torch
+    from PIL import Image
+
+    pipeline = PIPELINES[pipeline_name]
+    buffer = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert('RGB').save(buffer, format='JPEG', quality=90)
+    jpeg = buffer.getvalue()
+    pred = torch.rand((1, 1024, 1024))
+
+    # Warm up imports and allocator before taking the memory baseline
+    pipeline(Image.open(io.BytesIO(jpeg)).convert('RGB'), pred)
+    baseline_mb = _peak_rss_mb()
+
+    latencies = []
+    for _ in range(repeat):
+        image = Image.open(io.BytesIO(jpeg)).convert('RGB')
+        started = time.perf_counter()
+        pipeline(image, pred)
+        latencies.append((time.perf_counter() - started) * 1000)
+        del image
+
+    latencies.sort()
+    print(json.dumps({
+        'pipeline': pipeline_name,
+        'resolution': f'{width}x{height}',
+        'megapixels': round(width * height / 1e6, 2),
+        'latency_ms_median': round(latencies[len(latencies) // 2], 2),
+        'latency_ms_min': round(latencies[0], 2),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'peak_rss_over_warm_mb': round(_peak_rss_mb() - baseline_mb, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma separated WIDTHxHEIGHT list')
+    parser.add_argument('--case', nargs=3, metavar=('PIPELINE', 'WIDTH', 'HEIGHT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        run_case(args.case[0], int(args.case[1]), int(args.case[2]), args.repeat)
+        return
+
+    results = []
+    for size in args.sizes.split(','):
+        width, height = (int(v) for v in size.lower().split('x'))
+        for pipeline_name in PIPELINES:
+            output = subprocess.run(
+                [sys.executable, __file__, '--repeat', str(args.repeat), '--case', pipeline_name, str(width), str(height)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            results.append(result)
+            print(f"{result['resolution']:>10} {pipeline_name:>8}: "
+                  f"{result['latency_ms_median']:8.1f} ms  peak {result['peak_rss_mb']:7.1f} MB "
+                  f"(+{result['peak_rss_over_warm_mb']:.1f} MB)", file=sys.stderr)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
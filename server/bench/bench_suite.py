@@ -0,0 +1,402 @@
+"""
+Offline benchmark suite: throughput, tail latency and peak memory of the image services.
+
+Synthetic JPEG, PNG and WebP images (0.3 to 24 megapixels by default) are
+pushed through ImageSimilarityComparer, BackgroundRemover and GrabcgcGrading,
+either by calling the services in-process (--mode direct) or through the
+HTTP endpoints of serve.py (--mode http), at each requested concurrency.
+Result caches are disabled so every request reaches the models.
+
+Direct cases each run in a fresh subprocess so peak RSS belongs to that case
+alone. HTTP cases share one server; its peak RSS (summed over the server and
+its worker processes) is reset between cases where the kernel allows it.
+
+Everything runs on CPU without network access. --models stub (the default)
+uses the small stand-in networks in stub_models.py; --models local uses the
+real models from the local Hugging Face cache and weights directory.
+
+Results are written as JSON. Pass an earlier results file with --baseline to
+print the change in throughput and p95 latency per case.
+
+Usage:
+    python bench/bench_suite.py [--mode direct|http|both] [--targets compare,remove-background,detect-grade]
+                                [--formats jpeg,png,webp] [--sizes 640x480,4000x6000] [--concurrency 1,4]
+                                [--requests 20] [--models stub|local] [--output results.json]
+                                [--baseline previous.json]
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import synthetic  # noqa: E402
+
+TARGETS = ('compare', 'remove-background', 'detect-grade')
+MODES = ('direct', 'http')
+
+
+def service_env(models, scratch_dir):
+    """Environment for a benchmarked process: no caches, scratch state, no network for local models"""
+    env = dict(
+        os.environ,
+        CLIP_CACHE_SIZE='0', CLIP_CACHE_PATH='',
+        GRADE_CACHE_SIZE='0', GRADE_CACHE_PATH='',
+        JOB_STORE_DIR=os.path.join(scratch_dir, 'jobs'),
+        CATALOG_INDEX_DIR=os.path.join(scratch_dir, 'catalog_index'),
+    )
+    if models == 'local':
+        env.update(HF_HUB_OFFLINE='1', TRANSFORMERS_OFFLINE='1')
+    return env
+
+
+def case_inputs(target, fmt, width, height, comparisons):
+    """Encoded images for one case: the target image, plus comparison images for compare"""
+    image = synthetic.image_bytes(width, height, fmt, seed=0, slab=target == 'detect-grade')
+    if target != 'compare':
+        return image, []
+    return image, [synthetic.image_bytes(width, height, fmt, seed=i) for i in range(1, comparisons + 1)]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))]
+
+
+def measure(call, concurrency, requests, warmup):
+    """
+    Run call() `requests` times from `concurrency` threads
+
+    Returns:
+        dict: requests, errors, throughput_rps and latency_ms percentiles
+    """
+    for _ in range(warmup):
+        call()
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def timed(_):
+        started = time.perf_counter()
+        try:
+            call()
+        except Exception:
+            with lock:
+                errors[0] += 1
+            return
+        with lock:
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput_rps': round(len(latencies) / elapsed, 3) if elapsed else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50), 1) if latencies else None,
+            'p95': round(percentile(latencies, 0.95), 1) if latencies else None,
+            'p99': round(percentile(latencies, 0.99), 1) if latencies else None,
+            'mean': round(sum(latencies) / len(latencies), 1) if latencies else None,
+        }
+    }
+
+
+# --- Direct mode --------------------------------------------------------------
+
+def _direct_call(target, image, comparisons):
+    """Build a no-argument callable that runs one request against the service objects"""
+    if target == 'compare':
+        from python.compareImages import EmbeddingCache, ImageSimilarityComparer
+
+        comparer = ImageSimilarityComparer(cache=EmbeddingCache('clip-ViT-B-32', max_entries=0))
+        return lambda: comparer.compare_images(image, comparisons)
+    if target == 'remove-background':
+        from python.backgroundRemover import BackgroundRemover
+
+        remover = BackgroundRemover()
+        return lambda: remover.remove_background(image)
+
+    from python.cgc_identifier.cgc_controller import GrabcgcGrading
+    from python.resultCache import ResultCache
+
+    grading = GrabcgcGrading(cache=ResultCache('cgc', max_entries=0))
+
+    def call():
+        result = grading.process_image(image)
+        if isinstance(result, str):
+            raise RuntimeError(result)
+        return result
+    return call
+
+
+def run_direct_case(case):
+    """Child process entry point: benchmark one case in-process and print its result as JSON"""
+    if case['models'] == 'stub':
+        import stub_models
+
+        stub_models.install()
+    sys.path.insert(0, SERVER_DIR)
+    os.chdir(SERVER_DIR)
+
+    image, comparisons = case_inputs(case['target'], case['format'], case['width'], case['height'],
+                                     case['comparisons'])
+    call = _direct_call(case['target'], image, comparisons)
+    result = measure(call, case['concurrency'], case['requests'], case['warmup'])
+    # ru_maxrss is in kilobytes on Linux
+    result['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    print(json.dumps(result))
+
+
+def direct_case(case, args, scratch_dir):
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--run-case', json.dumps(case)],
+        cwd=SERVER_DIR, env=service_env(args.models, scratch_dir),
+        stdout=subprocess.PIPE, stderr=None if args.verbose else subprocess.DEVNULL,
+        timeout=args.case_timeout
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Case {case} exited with status {process.returncode}")
+    return json.loads(process.stdout.decode().strip().splitlines()[-1])
+
+
+# --- HTTP mode ----------------------------------------------------------------
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _server_pids(pid):
+    """The server process and its forked workers"""
+    pids = [pid]
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    return pids
+
+
+def _reset_peak_rss(pid):
+    # Writing 5 to clear_refs resets VmHWM (Linux 4.0+); best effort elsewhere
+    for server_pid in _server_pids(pid):
+        try:
+            with open(f'/proc/{server_pid}/clear_refs', 'w') as f:
+                f.write('5')
+        except OSError:
+            pass
+
+
+def _peak_rss_mb(pid):
+    total_kb = 0
+    for server_pid in _server_pids(pid):
+        try:
+            with open(f'/proc/{server_pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            pass
+    return round(total_kb / 1024, 1) if total_kb else None
+
+
+class BenchServer:
+    """serve.py in a subprocess, with stub or local models"""
+
+    def __init__(self, args, scratch_dir):
+        self.port = _free_port()
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        script = os.path.join(BENCH_DIR, 'stub_models.py') if args.models == 'stub' else os.path.join(SERVER_DIR, 'serve.py')
+        command = [sys.executable, script] + (['--serve'] if args.models == 'stub' else []) + [
+            '--host', '127.0.0.1', '--port', str(self.port), '--workers', str(args.workers)]
+        self.process = subprocess.Popen(
+            command, cwd=SERVER_DIR, env=service_env(args.models, scratch_dir),
+            stdout=None if args.verbose else subprocess.DEVNULL,
+            stderr=None if args.verbose else subprocess.DEVNULL
+        )
+        self._wait_ready(args.startup_timeout)
+
+    def _wait_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with status {self.process.returncode}")
+            try:
+                urllib.request.urlopen(f'{self.base_url}/readyz', timeout=2).read()
+                return
+            except (urllib.error.URLError, ConnectionError, OSError):
+                time.sleep(0.5)
+        raise RuntimeError(f"Server not ready after {timeout}s")
+
+    def call(self, target, image, comparisons):
+        """Build a no-argument callable that sends one request to the endpoint"""
+        if target == 'compare':
+            url = f'{self.base_url}/api/compare'
+            body = json.dumps({
+                'target_image': base64.b64encode(image).decode(),
+                'comparison_images': [base64.b64encode(c).decode() for c in comparisons]
+            }).encode()
+            headers = {'Content-Type': 'application/json'}
+        else:
+            url = f'{self.base_url}/api/{target}' + ('?format=binary' if target == 'remove-background' else '')
+            body = image
+            headers = {'Content-Type': 'application/octet-stream'}
+
+        def call():
+            request = urllib.request.Request(url, data=body, headers=headers, method='POST')
+            with urllib.request.urlopen(request, timeout=600) as response:
+                response.read()
+        return call
+
+    def run_case(self, case):
+        image, comparisons = case_inputs(case['target'], case['format'], case['width'], case['height'],
+                                         case['comparisons'])
+        _reset_peak_rss(self.process.pid)
+        result = measure(self.call(case['target'], image, comparisons),
+                         case['concurrency'], case['requests'], case['warmup'])
+        result['peak_rss_mb'] = _peak_rss_mb(self.process.pid)
+        return result
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+# --- Reporting ----------------------------------------------------------------
+
+def _case_key(result):
+    return (result['mode'], result['target'], result['format'], result['size'], result['concurrency'])
+
+
+def print_baseline_diff(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {_case_key(result): result for result in json.load(f)['results']}
+    print(f"\nChange against {baseline_path}:", file=sys.stderr)
+    for result in results:
+        before = baseline.get(_case_key(result))
+        if before is None or not before.get('throughput_rps') or not result.get('throughput_rps'):
+            continue
+        throughput = result['throughput_rps'] / before['throughput_rps'] - 1
+        p95_before, p95_after = before['latency_ms']['p95'], result['latency_ms']['p95']
+        p95 = p95_after / p95_before - 1 if p95_before and p95_after else 0
+        print(f"  {' '.join(str(v) for v in _case_key(result)):<48} throughput {throughput:+7.1%}  p95 {p95:+7.1%}",
+              file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=MODES + ('both',), default='both')
+    parser.add_argument('--targets', default=','.join(TARGETS))
+    parser.add_argument('--formats', default=','.join(synthetic.FORMATS))
+    parser.add_argument('--sizes', default=synthetic.DEFAULT_SIZES, help='Comma separated WIDTHxHEIGHT')
+    parser.add_argument('--concurrency', default='1,4', help='Comma separated client concurrency levels')
+    parser.add_argument('--requests', type=int, default=20, help='Timed requests per case')
+    parser.add_argument('--warmup', type=int, default=1, help='Untimed requests per case')
+    parser.add_argument('--comparisons', type=int, default=4, help='Comparison images per compare request')
+    parser.add_argument('--models', choices=('stub', 'local'), default='stub')
+    parser.add_argument('--workers', type=int, default=1, help='serve.py worker processes in http mode')
+    parser.add_argument('--startup-timeout', type=float, default=300.0)
+    parser.add_argument('--case-timeout', type=float, default=3600.0)
+    parser.add_argument('--output', help='Write the JSON results here as well as to stdout')
+    parser.add_argument('--baseline', help='Earlier results file to compare against')
+    parser.add_argument('--verbose', action='store_true', help='Show service logs')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        run_direct_case(json.loads(args.run_case))
+        return 0
+
+    targets = [t for t in args.targets.split(',') if t]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"Unknown targets: {', '.join(sorted(unknown))}")
+    formats = [f for f in args.formats.split(',') if f]
+    sizes = synthetic.parse_sizes(args.sizes)
+    levels = [int(v) for v in args.concurrency.split(',') if v]
+    modes = MODES if args.mode == 'both' else (args.mode,)
+
+    cases = [
+        {'target': target, 'format': fmt, 'width': width, 'height': height, 'concurrency': concurrency,
+         'requests': args.requests, 'warmup': args.warmup, 'comparisons': args.comparisons, 'models': args.models}
+        for target in targets for fmt in formats for width, height in sizes for concurrency in levels
+    ]
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='bench-') as scratch_dir:
+        for mode in modes:
+            server = BenchServer(args, scratch_dir) if mode == 'http' else None
+            try:
+                for case in cases:
+                    measured = server.run_case(case) if server else direct_case(case, args, scratch_dir)
+                    result = {
+                        'mode': mode,
+                        'target': case['target'],
+                        'format': case['format'],
+                        'size': f"{case['width']}x{case['height']}",
+                        'megapixels': synthetic.megapixels(case['width'], case['height']),
+                        'concurrency': case['concurrency'],
+                        **measured
+                    }
+                    results.append(result)
+                    print(f"{mode:<6} {case['target']:<17} {case['format']:<4} {result['size']:>9} "
+                          f"c={case['concurrency']:<3} {result['throughput_rps']:>8} req/s  "
+                          f"p50 {result['latency_ms']['p50']} p95 {result['latency_ms']['p95']} "
+                          f"p99 {result['latency_ms']['p99']} ms  rss {result['peak_rss_mb']} MB  "
+                          f"errors {result['errors']}", file=sys.stderr)
+            finally:
+                if server:
+                    server.close()
+
+    report = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'models': args.models,
+            'workers': args.workers,
+            'requests_per_case': args.requests,
+            'comparisons': args.comparisons,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+    if args.baseline:
+        print_baseline_diff(results, args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Load test of the pre-fork server: throughput and latency as the worker count grows.
+
+For each worker count serve.py is started on a free port, a fixed number of
+client threads send requests for --duration seconds, and the server is shut
+down again. The embedding cache is disabled in the server so repeated images
+still reach the model.
+
+Usage:
+    python bench/bench_workers.py [--workers 1,2,4] [--concurrency 16] [--duration 20]
+                                  [--endpoint compare|remove-background|detect-grade]
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = ('compare', 'remove-background', 'detect-grade')
+
+
+def _jpeg(width, height, seed):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    image = Image.effect_noise((width, height), 32 + seed % 64).convert('RGB')
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def build_request(endpoint, base_url):
+    """(url, body, headers) for one request to the endpoint"""
+    if endpoint == 'compare':
+        target = _jpeg(800, 600, 0)
+        comparisons = [_jpeg(800, 600, i) for i in range(1, 9)]
+        body = json.dumps({
+            'target_image': base64.b64encode(target).decode(),
+            'comparison_images': [base64.b64encode(c).decode() for c in comparisons]
+        }).encode()
+        return f'{base_url}/api/compare', body, {'Content-Type': 'application/json'}
+    if endpoint == 'remove-background':
+        return (f'{base_url}/api/remove-background?format=binary', _jpeg(1200, 1600, 1),
+                {'Content-Type': 'application/octet-stream'})
+    return f'{base_url}/api/detect-grade', _jpeg(1200, 1600, 2), {'Content-Type': 'application/octet-stream'}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(base_url, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"serve.py exited with status {process.returncode}")
+        try:
+            urllib.request.urlopen(f'{base_url}/readyz', timeout=2).read()
+            return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.5)
+    raise RuntimeError(f"Server not ready after {timeout}s")
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def load(url, body, headers, concurrency, duration):
+    """Send requests from `concurrency` threads for `duration` seconds"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client():
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                request = urllib.request.Request(url, data=body, headers=headers, method='POST')
+                urllib.request.urlopen(request, timeout=300).read()
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+            with lock:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'latency_ms_p50': round(_percentile(latencies, 0.50), 1) if latencies else None,
+        'latency_ms_p95': round(_percentile(latencies, 0.95), 1) if latencies else None,
+    }
+
+
+def run_workers(workers, args):
+    port = _free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, CLIP_CACHE_SIZE='0', CLIP_CACHE_PATH='')
+    command = [sys.executable, os.path.join(SERVER_DIR, 'serve.py'), '--host', '127.0.0.1',
+               '--port', str(port), '--workers', str(workers)]
+    if args.threads_per_worker:
+        command += ['--threads-per-worker', str(args.threads_per_worker)]
+    process = subprocess.Popen(command, cwd=SERVER_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_ready(base_url, process, args.startup_timeout)
+        url, body, headers = build_request(args.endpoint, base_url)
+        # One untimed pass so lazy allocations and first-request work are excluded
+        load(url, body, headers, workers, 0.1)
+        result = load(url, body, headers, args.concurrency, args.duration)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    result.update({'workers': workers, 'endpoint': args.endpoint, 'concurrency': args.concurrency})
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4', help='Comma separated worker counts')
+    parser.add_argument('--threads-per-worker', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--endpoint', choices=ENDPOINTS, default='compare')
+    parser.add_argument('--startup-timeout', type=float, default=300.0)
+    args = parser.parse_args()
+
+    results = []
+    for workers in (int(v) for v in args.workers.split(',')):
+        result = run_workers(workers, args)
+        results.append(result)
+        scaling = result['throughput_rps'] / results[0]['throughput_rps'] if results[0]['throughput_rps'] else 0
+        print(f"{workers:>3} workers: {result['throughput_rps']:8.2f} req/s ({scaling:.2f}x)  "
+              f"p50 {result['latency_ms_p50']} ms  p95 {result['latency_ms_p95']} ms  "
+              f"errors {result['errors']}", file=sys.stderr)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+"""
+Offline stand-ins for the model libraries, for benchmarking without network access.
+
+install() registers small modules under the names the services import
+(sentence_transformers, transformers, ultralytics, easyocr). Each stand-in
+keeps the real call signature and output layout, and runs a small randomly
+initialized torch network at the real input resolution, so decoding,
+preprocessing, batching and postprocessing are measured as in production
+while the forward passes stay cheap. Weights are seeded, so runs repeat.
+
+Latencies measured with stubs are not model latencies; compare runs made
+with the same --models setting only.
+
+Usage:
+    python bench/stub_models.py --serve [serve.py arguments]   # serve.py with stub models
+"""
+import os
+import sys
+import types
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CLIP_DIM = 512
+CLIP_MEAN = torch.tensor([0.4815, 0.4578, 0.4082]).view(3, 1, 1)
+CLIP_STD = torch.tensor([0.2686, 0.2613, 0.2758]).view(3, 1, 1)
+
+
+class _StubVisionOutput:
+    def __init__(self, pooler_output):
+        self.pooler_output = pooler_output
+
+
+class _StubVisionModel(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.net = torch.nn.Sequential(
+            torch.nn.Conv2d(3, 32, 7, stride=4, padding=3), torch.nn.ReLU(),
+            torch.nn.Conv2d(32, 64, 3, stride=2, padding=1), torch.nn.ReLU(),
+            torch.nn.AdaptiveAvgPool2d(1), torch.nn.Flatten()
+        )
+
+    def forward(self, pixel_values):
+        return _StubVisionOutput(self.net(pixel_values))
+
+
+class _StubCLIPModel(torch.nn.Module):
+    """The parts of transformers.CLIPModel the comparer uses"""
+
+    def __init__(self):
+        super().__init__()
+        self.vision_model = _StubVisionModel()
+        self.visual_projection = torch.nn.Linear(64, CLIP_DIM, bias=False)
+
+    def get_image_features(self, pixel_values):
+        return self.visual_projection(self.vision_model(pixel_values=pixel_values).pooler_output)
+
+
+class _StubImageProcessor:
+    """CLIP preprocessing: shortest side to 224, center crop, normalize"""
+
+    crop_size = {'height': 224, 'width': 224}
+
+    def _preprocess(self, image):
+        width, height = image.size
+        scale = 224 / min(width, height)
+        image = image.convert('RGB').resize((max(224, round(width * scale)), max(224, round(height * scale))))
+        left, top = (image.width - 224) // 2, (image.height - 224) // 2
+        image = image.crop((left, top, left + 224, top + 224))
+        tensor = torch.from_numpy(np.array(image)).permute(2, 0, 1).float().div_(255)
+        return (tensor - CLIP_MEAN) / CLIP_STD
+
+    def __call__(self, images, return_tensors='pt'):
+        return {'pixel_values': torch.stack([self._preprocess(image) for image in images])}
+
+
+class _StubCLIPModule(torch.nn.Module):
+    """sentence_transformers.models.CLIPModel stand-in"""
+
+    def __init__(self):
+        super().__init__()
+        self.model = _StubCLIPModel().eval()
+        self.processor = types.SimpleNamespace(image_processor=_StubImageProcessor())
+
+
+class StubSentenceTransformer(torch.nn.Sequential):
+    """CLIP image encoder stand-in: shortest side to 224, center crop, conv net, 512-d embedding"""
+
+    def __init__(self, model_name, device=None):
+        torch.manual_seed(0)
+        super().__init__(_StubCLIPModule())
+        self.model_name = model_name
+
+    def encode(self, images, batch_size=32, convert_to_tensor=False, show_progress_bar=False, device=None, **kwargs):
+        clip_module = self[0]
+        with torch.inference_mode():
+            pixel_values = clip_module.processor.image_processor(images)['pixel_values']
+            embeddings = clip_module.model.get_image_features(pixel_values)
+        return embeddings if convert_to_tensor else embeddings.numpy()
+
+
+def cos_sim(a, b):
+    a = torch.as_tensor(a)
+    b = torch.as_tensor(b)
+    if a.dim() == 1:
+        a = a.unsqueeze(0)
+    if b.dim() == 1:
+        b = b.unsqueeze(0)
+    return F.normalize(a, dim=-1) @ F.normalize(b, dim=-1).T
+
+
+class StubSegmentationModel(torch.nn.Module):
+    """RMBG-1.4 stand-in: [N, 3, 1024, 1024] in, nested side outputs like the real model"""
+
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.encoder = torch.nn.Sequential(
+            torch.nn.Conv2d(3, 16, 3, stride=2, padding=1), torch.nn.ReLU(),
+            torch.nn.Conv2d(16, 16, 3, stride=2, padding=1), torch.nn.ReLU(),
+        )
+        self.head = torch.nn.Conv2d(16, 1, 3, padding=1)
+
+    def forward(self, x):
+        features = self.encoder(x)
+        mask = F.interpolate(self.head(features), size=x.shape[-2:], mode='bilinear', align_corners=False)
+        return [[mask, F.avg_pool2d(mask, 2)], [features]]
+
+
+class AutoModelForImageSegmentation:
+    @staticmethod
+    def from_pretrained(model_name, **kwargs):
+        return StubSegmentationModel()
+
+
+class _Boxes:
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+
+    def __len__(self):
+        return len(self.conf)
+
+    def __iter__(self):
+        for i in range(len(self.conf)):
+            yield _Boxes(self.xyxy[i:i + 1], self.conf[i:i + 1], self.cls[i:i + 1])
+
+
+class _Result:
+    def __init__(self, boxes, orig_shape):
+        self.boxes = boxes
+        self.orig_shape = orig_shape
+
+
+class StubYOLO:
+    """
+    Ultralytics YOLO stand-in with the CGC label set
+
+    Letterboxes each image to imgsz and runs a conv net over the batch. An
+    image whose top band is mostly bright (synthetic.photo(slab=True)) gets a
+    slab, a grade label and an issue label; anything else gets no boxes.
+    """
+
+    names = {0: 'cgc_grade', 1: 'comic_issue', 2: 'cgc_slab', 3: 'cgc_authentication'}
+
+    def __init__(self, model_path):
+        torch.manual_seed(0)
+        self.net = torch.nn.Sequential(
+            torch.nn.Conv2d(3, 16, 3, stride=2, padding=1), torch.nn.ReLU(),
+            torch.nn.Conv2d(16, 32, 3, stride=2, padding=1), torch.nn.ReLU(),
+            torch.nn.Conv2d(32, 8, 1)
+        ).eval()
+
+    def _letterbox(self, image, imgsz):
+        import cv2
+
+        height, width = image.shape[:2]
+        scale = imgsz / max(height, width)
+        resized = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))))
+        canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+        canvas[:resized.shape[0], :resized.shape[1]] = resized
+        return torch.from_numpy(canvas).permute(2, 0, 1).float().div_(255)
+
+    def _boxes(self, image):
+        height, width = image.shape[:2]
+        band = image[int(height * 0.07):int(height * 0.15), int(width * 0.3):int(width * 0.9)]
+        if band.size == 0 or (band > 200).mean() < 0.3:
+            return _Boxes(torch.zeros((0, 4)), torch.zeros(0), torch.zeros(0))
+        xyxy = torch.tensor([
+            [width * 0.12, height * 0.065, width * 0.26, height * 0.155],
+            [width * 0.28, height * 0.065, width * 0.88, height * 0.155],
+            [width * 0.07, height * 0.03, width * 0.93, height * 0.97],
+        ], dtype=torch.float32)
+        return _Boxes(xyxy, torch.tensor([0.91, 0.87, 0.95]), torch.tensor([0.0, 1.0, 2.0]))
+
+    def __call__(self, source, imgsz=640, verbose=True, **kwargs):
+        images = source if isinstance(source, list) else [source]
+        with torch.inference_mode():
+            self.net(torch.stack([self._letterbox(image, imgsz) for image in images]))
+        return [_Result(self._boxes(image), image.shape[:2]) for image in images]
+
+    predict = __call__
+
+
+class StubReader:
+    """EasyOCR Reader stand-in: two text lines per crop, a small conv net per recognized line"""
+
+    def __init__(self, languages, gpu=False, **kwargs):
+        torch.manual_seed(0)
+        self.device = 'cuda' if gpu else 'cpu'
+        self.net = torch.nn.Sequential(
+            torch.nn.Conv2d(1, 16, 3, padding=1), torch.nn.ReLU(), torch.nn.AdaptiveAvgPool2d((1, 8))
+        ).eval()
+
+    def _grey(self, image):
+        import cv2
+
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+    def detect(self, image, **kwargs):
+        height, width = image.shape[:2]
+        return [[[0, width, 0, height // 2], [0, width, height // 2, height]]], [[]]
+
+    def recognize(self, image, horizontal_list=None, free_list=None, batch_size=1, detail=1, **kwargs):
+        import cv2
+
+        grey = self._grey(image)
+        if horizontal_list is None and free_list is None:
+            horizontal_list = [[0, grey.shape[1], 0, grey.shape[0]]]
+        lines = []
+        for x1, x2, y1, y2 in horizontal_list or []:
+            crop = grey[max(0, y1):y2, max(0, x1):x2]
+            if crop.size == 0:
+                continue
+            width = max(1, round(crop.shape[1] * 64 / crop.shape[0]))
+            lines.append(([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], cv2.resize(crop, (width, 64))))
+        if lines:
+            with torch.inference_mode():
+                for _, crop in lines:
+                    self.net(torch.from_numpy(crop).float().div_(255)[None, None])
+        results = [(box, '9.8' if i % 2 == 0 else 'AMAZING SPIDER-MAN #300', 0.9) for i, (box, _) in enumerate(lines)]
+        return sorted(results, key=lambda result: result[0][0][1])
+
+    def readtext(self, image, **kwargs):
+        horizontal_list, free_list = self.detect(image)
+        return self.recognize(image, horizontal_list[0], free_list[0])
+
+
+def install():
+    """Register the stand-ins under the real module names; call before importing the services"""
+    sentence_transformers = types.ModuleType('sentence_transformers')
+    sentence_transformers.SentenceTransformer = StubSentenceTransformer
+    util = types.ModuleType('sentence_transformers.util')
+    util.cos_sim = cos_sim
+    sentence_transformers.util = util
+
+    transformers = types.ModuleType('transformers')
+    transformers.AutoModelForImageSegmentation = AutoModelForImageSegmentation
+
+    ultralytics = types.ModuleType('ultralytics')
+    ultralytics.YOLO = StubYOLO
+
+    easyocr = types.ModuleType('easyocr')
+    easyocr.Reader = StubReader
+
+    sys.modules.update({
+        'sentence_transformers': sentence_transformers,
+        'sentence_transformers.util': util,
+        'transformers': transformers,
+        'ultralytics': ultralytics,
+        'easyocr': easyocr,
+    })
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != '--serve':
+        sys.exit(__doc__)
+    install()
+    sys.path.insert(0, SERVER_DIR)
+    os.chdir(SERVER_DIR)
+    import serve
+
+    sys.exit(serve.main(sys.argv[2:]))
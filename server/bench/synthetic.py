@@ -0,0 +1,78 @@
+"""
+Deterministic synthetic test images for the benchmarks.
+
+Images are photo-like (smooth gradients plus sensor-like noise) so codecs and
+resamplers do realistic work. A slab variant adds a light case border and a
+white label band with dark text-like bars, which the stub YOLO model in
+stub_models.py detects as a graded slab.
+"""
+import io
+import random
+
+from PIL import Image, ImageChops, ImageDraw
+
+FORMATS = ('jpeg', 'png', 'webp')
+
+# 0.3, 1.9, 12.2 and 24 megapixels
+DEFAULT_SIZES = '640x480,1200x1600,3024x4032,4000x6000'
+
+
+def parse_sizes(sizes):
+    """'640x480,1200x1600' -> [(640, 480), (1200, 1600)]"""
+    return [tuple(int(v) for v in size.lower().split('x')) for size in sizes.split(',') if size]
+
+
+def megapixels(width, height):
+    return round(width * height / 1e6, 1)
+
+
+def photo(width, height, seed=0, slab=False):
+    """
+    Photo-like RGB test image
+
+    Args:
+        width, height: Size in pixels
+        seed: Varies the colors and noise so images differ in content
+        slab: Draw a graded slab case and label
+    """
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient('L').resize((width, height)).rotate(rng.choice((0, 90, 180, 270)), expand=False)
+    radial = Image.radial_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 16 + seed % 24)
+    rgb = Image.merge('RGB', (
+        ImageChops.add(gradient, noise, scale=2.0, offset=rng.randint(0, 64)),
+        radial,
+        ImageChops.add(radial, gradient, scale=2.0, offset=rng.randint(0, 64)),
+    ))
+
+    if slab:
+        draw = ImageDraw.Draw(rgb)
+        border = max(4, width // 40)
+        draw.rectangle((width * 0.08, height * 0.04, width * 0.92, height * 0.96), outline=(225, 225, 225), width=border)
+        # Label band across the top with a grade box and two lines of "text"
+        top, bottom = height * 0.06, height * 0.16
+        draw.rectangle((width * 0.1, top, width * 0.9, bottom), fill=(250, 250, 250))
+        draw.rectangle((width * 0.12, top + 4, width * 0.26, bottom - 4), outline=(20, 20, 20), width=max(2, width // 300))
+        line_height = (bottom - top) / 5
+        for line in (1, 3):
+            y = top + line * line_height
+            draw.rectangle((width * 0.3, y, width * 0.86, y + line_height * 0.6), fill=(30, 30, 30))
+    return rgb
+
+
+def encode(image, fmt):
+    """Encode with the settings a phone or browser upload typically uses"""
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        image.save(buffer, format='JPEG', quality=90)
+    elif fmt == 'png':
+        image.save(buffer, format='PNG', compress_level=6)
+    elif fmt == 'webp':
+        image.save(buffer, format='WEBP', quality=90)
+    else:
+        raise ValueError(f"Unknown format {fmt}")
+    return buffer.getvalue()
+
+
+def image_bytes(width, height, fmt, seed=0, slab=False):
+    return encode(photo(width, height, seed, slab), fmt)
@@ -0,0 +1,40 @@
+"""
+gunicorn settings matching serve.py: models load once in the master and are
+shared copy-on-write by the forked workers.
+
+Usage:
+    gunicorn -c gunicorn.conf.py server:app
+"""
+import gc
+
+from python import config
+from python import torchRuntime
+from python.modelRegistry import model_registry
+from serve import fail_orphaned_jobs, init_worker, threads_per_worker
+
+# The config is read before the app is preloaded; keep torch single threaded in the
+# master while the models load, and warm up in the workers (see serve.preload_app)
+torchRuntime.prepare_prefork()
+
+bind = f"{config.SERVER_HOST}:{config.SERVER_PORT}"
+workers = max(1, config.SERVER_WORKERS)
+# Request threads per worker; inference itself is serialized by the batch schedulers
+worker_class = 'gthread'
+threads = 8
+preload_app = True
+# Model inference on large uploads can take a while on CPU
+timeout = 120
+
+
+def pre_fork(server, worker):
+    # The preloaded app loads its eager models on a thread that does not survive fork
+    model_registry.wait_until_loaded()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    init_worker(threads_per_worker(workers, config.TORCH_THREADS_PER_WORKER))
+
+
+def child_exit(server, worker):
+    fail_orphaned_jobs(worker.pid)
@@ -1,26 +1,137 @@
 import torch
-import torchvision.transforms as transforms
 from transformers import AutoModelForImageSegmentation
 from PIL import Image
 import numpy as np
-import io
 import logging
+from . import config
+from . import metrics
+from .batchScheduler import BatchScheduler
+from . import torchRuntime
+from .inferenceBackend import load_backend
+from .imageEncoding import DEFAULT_ENCODING
+from .imageDecoding import DecodedImage, as_decoded, open_image
 
 logger = logging.getLogger(__name__)
 
+# Square input resolution expected by RMBG-1.4
+MODEL_INPUT_SIZE = 1024
+NORMALIZE_MEAN = torch.tensor([0.485, 0.456, 0.406]).view(3, 1, 1)
+NORMALIZE_STD = torch.tensor([0.229, 0.224, 0.225]).view(3, 1, 1)
+
+
+def prepare_model_input(original_image, input_size=MODEL_INPUT_SIZE):
+    """
+    Letterbox an image into a normalized square model input
+    
+    The image is resized once, straight to its final size inside the square,
+    then copied into a zero (black) uint8 canvas that is converted and
+    normalized in a single tensor pass.
+    
+    Args:
+        original_image (PIL.Image): RGB input image
+        input_size (int): Side of the square model input
+        
+    Returns:
+        tuple: (input tensor of shape [3, input_size, input_size], padding info dict)
+    """
+    width, height = original_image.size
+    scale = input_size / max(width, height)
+    scaled_width = max(1, min(input_size, round(width * scale)))
+    scaled_height = max(1, min(input_size, round(height * scale)))
+    
+    # reducing_gap lets PIL shrink large photos with a fast integer reduce first
+    resized = original_image.resize((scaled_width, scaled_height), Image.BILINEAR, reducing_gap=2.0)
+    
+    left = (input_size - scaled_width) // 2
+    top = (input_size - scaled_height) // 2
+    
+    canvas = torch.zeros((3, input_size, input_size), dtype=torch.uint8)
+    canvas[:, top:top + scaled_height, left:left + scaled_width] = torch.from_numpy(np.array(resized)).permute(2, 0, 1)
+    input_tensor = canvas.float().div_(255).sub_(NORMALIZE_MEAN).div_(NORMALIZE_STD)
+    
+    # Store the letterbox region (in model input pixels) for cropping the mask
+    padding_info = {
+        'left': left,
+        'top': top,
+        'scaled_width': scaled_width,
+        'scaled_height': scaled_height,
+        'original_width': width,
+        'original_height': height
+    }
+    
+    return input_tensor, padding_info
+
+
+def apply_mask_alpha(original_image, pred, padding_info):
+    """
+    Crop the predicted mask to the letterbox region and write it as the image's alpha
+    
+    The mask is cropped in model space and resized once, directly to the
+    image's resolution. The alpha channel is written in place with putalpha,
+    so no full-frame NumPy copies of the photo are made.
+    
+    Args:
+        original_image (PIL.Image): RGB input image, at its original size or
+                                    downscaled with the same aspect ratio;
+                                    converted to RGBA in place
+        pred (torch.Tensor): Mask probabilities of shape [1, H, W] or [H, W]
+        padding_info (dict): Letterbox info from prepare_model_input
+        
+    Returns:
+        PIL.Image: The RGBA image
+    """
+    pred = pred.squeeze()
+    left, top = padding_info['left'], padding_info['top']
+    region = pred[top:top + padding_info['scaled_height'], left:left + padding_info['scaled_width']]
+    region = region.mul(255).clamp_(0, 255).to(torch.uint8).contiguous()
+    
+    mask = Image.fromarray(region.numpy(), 'L').resize(original_image.size, Image.BILINEAR)
+    
+    original_image.putalpha(mask)
+    return original_image
+
+
+class MaskOutput(torch.nn.Module):
+    """Segmentation model reduced to its mask output, as sigmoid probabilities"""
+    
+    def __init__(self, model, mask_path):
+        """
+        Args:
+            model (torch.nn.Module): RMBG segmentation model
+            mask_path (tuple): Index path to the mask in the model output
+        """
+        super().__init__()
+        self.model = model
+        self.mask_path = tuple(mask_path)
+    
+    def forward(self, input_images):
+        pred_tensor = self.model(input_images)
+        for index in self.mask_path:
+            pred_tensor = pred_tensor[index]
+        return torch.sigmoid(pred_tensor)
+
+
 class BackgroundRemover:
     """Background removal using RMBG-1.4 model"""
     
-    def __init__(self, model_name='briaai/RMBG-1.4'):
+    def __init__(self, model_name='briaai/RMBG-1.4', max_batch_size=None):
         """
         Initialize the background remover
         
         Args:
             model_name (str): Hugging Face model name
+            max_batch_size (int, optional): Maximum images per forward pass in
+                                            process_multiple_images. Defaults to
+                                            config.RMBG_MAX_BATCH_SIZE.
         """
         self.model_name = model_name
+        self.max_batch_size = max(1, max_batch_size or config.RMBG_MAX_BATCH_SIZE)
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         
+        # Per-image shape logging is only emitted at DEBUG level
+        if config.RMBG_DEBUG_LOGGING:
+            logger.setLevel(logging.DEBUG)
+        
         logger.info(f"Loading background removal model: {model_name}")
         logger.info(f"Using device: {self.device}")
         
@@ -33,12 +144,21 @@ class BackgroundRemover:
             self.model.to(self.device)
             self.model.eval()
             
-            # Define image transforms
-            self.transform_image = transforms.Compose([
-                transforms.Resize((1024, 1024)),
-                transforms.ToTensor(),
-                transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-            ])
+            # Work out once which model output holds the mask
+            self._mask_path = self._resolve_mask_path()
+            logger.info(f"Using model output {self._mask_path or 'tensor'} as the segmentation mask")
+            
+            self.backend = self.build_backend(config.RMBG_BACKEND, config.RMBG_ONNX_INT8)
+            logger.info(f"Using the {self.backend.name} inference backend")
+            torchRuntime.register_warm_up('rmbg', self.warm_up)
+            
+            # Forward passes from concurrent requests are merged into shared batches
+            self.scheduler = BatchScheduler(
+                'rmbg',
+                self._forward_batch,
+                max_batch_size=self.max_batch_size,
+                max_wait_ms=config.RMBG_BATCH_WAIT_MS
+            )
             
             logger.info("Background removal model loaded successfully!")
             
@@ -46,212 +166,322 @@ class BackgroundRemover:
             logger.error(f"Failed to load background removal model: {e}")
             raise
     
-    def preprocess_image(self, image_data):
+    def preprocess_image(self, image_data, long_side=None):
         """
         Convert image data to PIL Image
         
         Args:
-            image_data (bytes or PIL.Image): Input image data
+            image_data (bytes, DecodedImage or PIL.Image): Input image data
+            long_side (int, optional): Smallest longest side the caller needs. JPEGs
+                                       are decoded at the smallest scale that keeps it.
+                                       Defaults to full resolution.
             
         Returns:
-            PIL.Image: Preprocessed image
+            PIL.Image: Preprocessed image, owned by the caller
         """
         try:
-            if isinstance(image_data, bytes):
-                image = Image.open(io.BytesIO(image_data)).convert('RGB')
-            elif isinstance(image_data, Image.Image):
-                image = image.convert('RGB')
-            else:
-                raise ValueError(f"Unsupported image data type: {type(image_data)}")
+            with metrics.stage('decode'):
+                if isinstance(image_data, DecodedImage):
+                    # The mask is written into these pixels, so take ownership of them
+                    image = image_data.pil('RGB', long_side=long_side, take=True)
+                elif isinstance(image_data, bytes):
+                    image = open_image(image_data, 'RGB', long_side=long_side)
+                elif isinstance(image_data, Image.Image):
+                    image = image_data.convert('RGB')
+                else:
+                    raise ValueError(f"Unsupported image data type: {type(image_data)}")
             
             return image
             
+        except ValueError as e:
+            # Decoder errors already carry the "Invalid image data" prefix
+            logger.error(f"Failed to preprocess image: {e}")
+            raise
         except Exception as e:
             logger.error(f"Failed to preprocess image: {e}")
             raise ValueError(f"Invalid image data: {str(e)}")
     
-    def remove_background(self, image_data, return_format='bytes'):
+    def _prepare_input(self, original_image):
         """
-        Remove background from image
+        Letterbox an image onto a square canvas and transform it for the model
         
         Args:
-            image_data (bytes or PIL.Image): Input image
-            return_format (str): 'bytes', 'pil', or 'base64'
+            original_image (PIL.Image): RGB input image
             
         Returns:
-            bytes, PIL.Image, or str: Image with background removed
+            tuple: (input tensor of shape [3, 1024, 1024], padding info dict)
         """
-        try:
-            # Preprocess image
-            original_image = self.preprocess_image(image_data)
-            original_size = original_image.size
-            
-            # Calculate padding to make image square while preserving aspect ratio
-            width, height = original_size
-            max_dim = max(width, height)
-            
-            # Create a square canvas and paste the image centered
-            square_image = Image.new('RGB', (max_dim, max_dim), (0, 0, 0))
-            
-            # Calculate position to center the image
-            left = (max_dim - width) // 2
-            top = (max_dim - height) // 2
-            square_image.paste(original_image, (left, top))
-            
-            # Store the padding info for later cropping
-            padding_info = {
-                'left': left,
-                'top': top,
-                'original_width': width,
-                'original_height': height,
-                'padded_size': max_dim
-            }
-            
-            # Transform the square image for model
-            input_images = self.transform_image(square_image).unsqueeze(0).to(self.device)
+        with metrics.stage('preprocess'):
+            return prepare_model_input(original_image, MODEL_INPUT_SIZE)
+    
+    def _predict_masks(self, input_images):
+        """
+        Predict masks for prepared inputs through the batching scheduler
+        
+        Args:
+            input_images (list): Tensors of shape [3, 1024, 1024]
             
-            # Predict mask
-            with torch.no_grad():
-                preds = self.model(input_images)
+        Returns:
+            list: Sigmoid mask probabilities of shape [1, H, W] on the CPU, one per input
+        """
+        with metrics.stage('model_wait'):
+            return self.scheduler.run_many(input_images)
     
-                # Handle different return types from the model
-                if isinstance(preds, (list, tuple)):
-                    # Debug: Print shapes of all outputs to find the right one
-                    logger.info(f"Model returned {len(preds)} outputs")
-                    for i, pred in enumerate(preds):
-                        if isinstance(pred, torch.Tensor):
-                            logger.info(f"Output {i}: shape {pred.shape}")
-                        elif isinstance(pred, list):
-                            logger.info(f"Output {i}: list with {len(pred)} items")
-                            if len(pred) > 0 and isinstance(pred[0], torch.Tensor):
-                                logger.info(f"  First item shape: {pred[0].shape}")
-                    
-                    # Try to find the segmentation mask output
-                    # Usually it's a tensor with shape [batch_size, 1, height, width]
-                    pred_tensor = None
-                    for pred in preds:
-                        if isinstance(pred, torch.Tensor):
-                            # Look for tensor with 1 channel (segmentation mask)
-                            if len(pred.shape) == 4 and pred.shape[1] == 1:
-                                pred_tensor = pred
-                                break
-                        elif isinstance(pred, list) and len(pred) > 0:
-                            for item in pred:
-                                if isinstance(item, torch.Tensor) and len(item.shape) == 4 and item.shape[1] == 1:
-                                    pred_tensor = item
-                                    break
-                            if pred_tensor is not None:
-                                break
-                            
-                    # If we still don't have it, try the first tensor output
-                    if pred_tensor is None:
-                        for pred in preds:
-                            if isinstance(pred, torch.Tensor):
-                                pred_tensor = pred
-                                break
-                            elif isinstance(pred, list) and len(pred) > 0 and isinstance(pred[0], torch.Tensor):
-                                pred_tensor = pred[0]
-                                break
-                            
-                    if pred_tensor is None:
-                        raise RuntimeError("Could not find valid prediction tensor in model output")
+    def _forward_batch(self, input_images):
+        """
+        Run the segmentation model on one batch; called only from the scheduler worker
+        
+        Args:
+            input_images (list): Tensors of shape [3, 1024, 1024]
+            
+        Returns:
+            list: Sigmoid mask probabilities of shape [1, H, W] on the CPU, one per input
+        """
+        return list(self._run_model(torch.stack(input_images)))
     
-                    # Apply sigmoid and move to CPU
-                    pred_tensor = torch.sigmoid(pred_tensor).cpu()
-                else:
-                    # If it's already a tensor
-                    pred_tensor = torch.sigmoid(preds).cpu()
+    def _resolve_mask_path(self):
+        """
+        Find where the segmentation mask sits in the model output
+        
+        Runs one probe forward pass and records the index path to the mask
+        tensor, so per-image calls can read it directly instead of searching
+        the outputs every time.
+        
+        Returns:
+            tuple: Index path into the model output; empty if the output is the mask itself
+        """
+        probe = torch.zeros((1, 3, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), device=self.device)
+        with torch.inference_mode():
+            preds = self.model(probe)
+        
+        if isinstance(preds, torch.Tensor):
+            return ()
+        
+        # Flatten the output into (path, tensor) pairs, one level of nesting deep
+        candidates = []
+        for i, pred in enumerate(preds):
+            if isinstance(pred, torch.Tensor):
+                candidates.append(((i,), pred))
+            elif isinstance(pred, (list, tuple)):
+                for j, item in enumerate(pred):
+                    if isinstance(item, torch.Tensor):
+                        candidates.append(((i, j), item))
+        
+        for path, pred in candidates:
+            logger.debug(f"Model output {path}: shape {tuple(pred.shape)}")
+        
+        # Usually it's a tensor with shape [batch_size, 1, height, width]
+        for path, pred in candidates:
+            if pred.dim() == 4 and pred.shape[1] == 1:
+                return path
+        
+        # If we still don't have it, use the first tensor output
+        if candidates:
+            return candidates[0][0]
+        
+        raise RuntimeError("Could not find valid prediction tensor in model output")
     
-            # Process mask - handle the padding we added
-            pred = pred_tensor[0].squeeze()
-            
-            # Debug logging
-            logger.info(f"Original image size: {original_size}")
-            logger.info(f"Prediction tensor shape: {pred.shape}")
-            
-            pred_pil = transforms.ToPILImage()(pred)
-            logger.info(f"Prediction PIL size: {pred_pil.size}")
-            
-            # Resize the square mask to the padded size
-            padded_mask = pred_pil.resize((padding_info['padded_size'], padding_info['padded_size']), Image.LANCZOS)
-            
-            # Crop out the padding to get back to original aspect ratio
-            mask = padded_mask.crop((
-                padding_info['left'],
-                padding_info['top'],
-                padding_info['left'] + padding_info['original_width'],
-                padding_info['top'] + padding_info['original_height']
-            ))
-            
-            logger.info(f"Final mask size: {mask.size}")
+    def build_backend(self, backend, int8=False):
+        """
+        Inference backend running the mask output of the loaded model
+        
+        Args:
+            backend (str): 'torch' or 'onnx'
+            int8 (bool): Use the int8 quantized ONNX export
             
-            # Verify the mask is the right size
-            assert mask.size == original_size, f"Mask size {mask.size} doesn't match original {original_size}"
+        Returns:
+            Callable from a [N, 3, 1024, 1024] batch to [N, 1, H, W] mask probabilities on the CPU
+        """
+        return load_backend(
+            f"rmbg-{self.model_name}",
+            MaskOutput(self.model, self._mask_path),
+            torch.zeros((1, 3, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE)),
+            backend,
+            device=self.device,
+            int8=int8,
+            channels_last=True
+        )
+    
+    def warm_up(self):
+        """One forward pass on a blank input, so the first request runs at steady-state speed"""
+        self._run_model(torch.zeros((1, 3, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE)))
+    
+    def _run_model(self, input_images):
+        """
+        Run the segmentation model on a batch of prepared inputs
+        
+        Args:
+            input_images (torch.Tensor): Batch of shape [N, 3, 1024, 1024]
             
-            # Create output image with transparent background
-            output_image = Image.new("RGBA", original_size, (0, 0, 0, 0))
+        Returns:
+            torch.Tensor: Sigmoid mask probabilities of shape [N, 1, H, W] on the CPU
+        """
+        return self.backend(input_images)
+    
+    def _apply_mask(self, original_image, pred, padding_info, return_format, encoding=None):
+        """
+        Crop the predicted mask back to the original image and apply it as alpha
+        
+        Args:
+            original_image (PIL.Image): RGB input image
+            pred (torch.Tensor): Mask probabilities for this image
+            padding_info (dict): Letterbox info from _prepare_input
+            return_format (str): 'bytes', 'pil', or 'base64'
+            encoding (OutputEncoding, optional): Codec and output size for 'bytes'
+                                                 and 'base64'. Defaults to RGBA PNG.
             
-            # Convert original to RGBA if needed
-            if original_image.mode != 'RGBA':
-                original_image = original_image.convert('RGBA')
+        Returns:
+            bytes, PIL.Image, or str: Image with background removed
+        """
+        encoding = encoding or DEFAULT_ENCODING
+        
+        with metrics.stage('postprocess'):
+            # Shrink before compositing so the mask is only resized to the output size
+            target_size = encoding.target_size(original_image.size)
+            if target_size != original_image.size:
+                original_image = original_image.resize(target_size, Image.BILINEAR, reducing_gap=2.0)
             
-            # Apply mask
-            mask_array = np.array(mask)
-            original_array = np.array(original_image)
-            output_array = original_array.copy()
+            original_size = original_image.size
+            output_image = apply_mask_alpha(original_image, pred, padding_info)
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Original size {original_size}, prediction shape {tuple(pred.shape)}, "
+                         f"final mask size {output_image.size}")
+        
+        # Verify the mask is the right size
+        assert output_image.size == original_size, f"Mask size {output_image.size} doesn't match original {original_size}"
+        
+        # Return in requested format
+        if return_format == 'pil':
+            return output_image
+        with metrics.stage('encode'):
+            if return_format == 'base64':
+                import base64
+                return base64.b64encode(encoding.encode(output_image)).decode('utf-8')
+            else:  # return_format == 'bytes'
+                return encoding.encode(output_image)
+    
+    def _decode_side(self, encoding):
+        """
+        Longest side an input must be decoded at for a given output encoding
+        
+        The output is composited on the decoded image, so full resolution is
+        needed unless max_dimension caps the output size.
+        """
+        encoding = encoding or DEFAULT_ENCODING
+        if encoding.max_dimension is None:
+            return None
+        return max(MODEL_INPUT_SIZE, encoding.max_dimension)
+    
+    def remove_background(self, image_data, return_format='bytes', encoding=None):
+        """
+        Remove background from image
+        
+        Args:
+            image_data (bytes, DecodedImage or PIL.Image): Input image
+            return_format (str): 'bytes', 'pil', or 'base64'
+            encoding (OutputEncoding, optional): Output codec, quality and max size.
+                                                 Defaults to RGBA PNG at full size.
             
-            # Set alpha channel based on mask
-            output_array[:, :, 3] = mask_array
+        Returns:
+            bytes, PIL.Image, or str: Image with background removed
+        """
+        try:
+            # Preprocess image
+            original_image = self.preprocess_image(image_data, self._decode_side(encoding))
+            input_image, padding_info = self._prepare_input(original_image)
             
-            output_image = Image.fromarray(output_array, 'RGBA')
+            # Predict mask
+            pred = self._predict_masks([input_image])[0]
             
-            # Return in requested format
-            if return_format == 'pil':
-                return output_image
-            elif return_format == 'base64':
-                import base64
-                buffer = io.BytesIO()
-                output_image.save(buffer, format='PNG')
-                buffer.seek(0)
-                return base64.b64encode(buffer.getvalue()).decode('utf-8')
-            else:  # return_format == 'bytes'
-                buffer = io.BytesIO()
-                output_image.save(buffer, format='PNG')
-                buffer.seek(0)
-                return buffer.getvalue()
+            return self._apply_mask(original_image, pred, padding_info, return_format, encoding)
                 
         except Exception as e:
             logger.error(f"Failed to remove background: {e}")
             raise RuntimeError(f"Background removal failed: {str(e)}")
-    def process_multiple_images(self, image_list, return_format='bytes'):
+    
+    def iter_multiple_images(self, image_list, return_format='bytes', batch_size=None, encoding=None):
         """
-        Remove background from multiple images
+        Remove background from multiple images, yielding each result as soon as it is ready
+        
+        Images are letterboxed and handed to the scheduler in micro-batches so
+        the model runs one forward pass per batch instead of one per image.
+        Only one micro-batch of decoded images is held in memory at a time.
         
         Args:
-            image_list (list): List of image data
+            image_list (list): List of image data (bytes, DecodedImage or PIL.Image)
             return_format (str): 'bytes', 'pil', or 'base64'
+            batch_size (int, optional): Maximum images per forward pass.
+                                        Defaults to self.max_batch_size.
+            encoding (OutputEncoding, optional): Output codec, quality and max size
             
-        Returns:
-            list: List of processed images
+        Yields:
+            dict: {'index', 'success', 'image'} or {'index', 'success', 'error'}.
+                  Within a micro-batch, failures may be yielded before earlier indices.
         """
-        results = []
+        batch_size = max(1, batch_size or self.max_batch_size)
         
-        for i, image_data in enumerate(image_list):
+        def failure(i, e):
+            logger.error(f"Failed to process image {i}: {e}")
+            return {
+                'index': i,
+                'success': False,
+                'error': str(e)
+            }
+        
+        for start in range(0, len(image_list), batch_size):
+            # Decode and letterbox the batch; bad images drop out individually
+            prepared = []
+            for i in range(start, min(start + batch_size, len(image_list))):
+                try:
+                    original_image = self.preprocess_image(image_list[i], self._decode_side(encoding))
+                    input_image, padding_info = self._prepare_input(original_image)
+                    prepared.append((i, original_image, input_image, padding_info))
+                except Exception as e:
+                    yield failure(i, e)
+            
+            if not prepared:
+                continue
+            
+            # One forward pass for the whole micro-batch
             try:
-                result = self.remove_background(image_data, return_format)
-                results.append({
+                preds = self._predict_masks([item[2] for item in prepared])
+            except Exception as e:
+                for item in prepared:
+                    yield failure(item[0], RuntimeError(f"Background removal failed: {str(e)}"))
+                continue
+            
+            for batch_index, (i, original_image, _, padding_info) in enumerate(prepared):
+                try:
+                    result = self._apply_mask(original_image, preds[batch_index], padding_info, return_format, encoding)
+                except Exception as e:
+                    yield failure(i, RuntimeError(f"Background removal failed: {str(e)}"))
+                    continue
+                yield {
                     'index': i,
                     'success': True,
                     'image': result
-                })
-            except Exception as e:
-                logger.error(f"Failed to process image {i}: {e}")
-                results.append({
-                    'index': i,
-                    'success': False,
-                    'error': str(e)
-                })
+                }
+            
+            # Let the decoded images of this micro-batch be freed before the next
+            del prepared, preds
+    
+    def process_multiple_images(self, image_list, return_format='bytes', batch_size=None, encoding=None):
+        """
+        Remove background from multiple images
         
+        Args:
+            image_list (list): List of image data
+            return_format (str): 'bytes', 'pil', or 'base64'
+            batch_size (int, optional): Maximum images per forward pass.
+                                        Defaults to self.max_batch_size.
+            encoding (OutputEncoding, optional): Output codec, quality and max size
+            
+        Returns:
+            list: List of processed images, in input order
+        """
+        results = list(self.iter_multiple_images(image_list, return_format, batch_size, encoding))
+        results.sort(key=lambda result: result['index'])
         return results
     
     def get_model_info(self):
@@ -262,24 +492,12 @@ class BackgroundRemover:
             'model_type': 'background_removal'
         }
     
-    def detect_image_format(self, image_bytes):
-        """Detect the format of the image from bytes"""
-        try:
-            image = Image.open(io.BytesIO(image_bytes))
-            return image.format.lower() if image.format else 'unknown'
-        except Exception:
-            return 'unknown'
+    @staticmethod
+    def detect_image_format(image_bytes):
+        """Detect the format of the image from bytes or a DecodedImage (header only)"""
+        return as_decoded(image_bytes).format
     
-    def get_image_info(self, image_bytes):
-        """Get information about the image"""
-        try:
-            image = Image.open(io.BytesIO(image_bytes))
-            return {
-                'width': image.width,
-                'height': image.height,
-                'mode': image.mode,
-                'format': image.format,
-                'size_bytes': len(image_bytes)
-            }
-        except Exception as e:
-            return {'error': str(e)}
\ No newline at end of file
+    @staticmethod
+    def get_image_info(image_bytes):
+        """Get information about the image from bytes or a DecodedImage (header only)"""
+        return as_decoded(image_bytes).info()
\ No newline at end of file
@@ -0,0 +1,120 @@
+import os
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, List, Sequence
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class BatchScheduler:
+    """
+    Collects single inference items from many request threads and runs them
+    through the model in batches.
+
+    A worker thread takes the first queued item, then keeps collecting until it
+    has max_batch_size items or max_wait_ms has passed, runs one batched call
+    and hands each result back through its Future. Only the worker thread ever
+    touches the model, so callers need no extra locking.
+    """
+
+    def __init__(self,
+                 name: str,
+                 process_batch: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int = 8,
+                 max_wait_ms: float = 5.0):
+        """
+        Args:
+            name (str): Model name, used for the worker thread and logs
+            process_batch (callable): Takes a list of items and returns one result per item.
+                                      A result that is an Exception fails only that item.
+            max_batch_size (int): Maximum items per batched call
+            max_wait_ms (float): How long to wait for more items after the first one arrives
+        """
+        self.name = name
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._pid = None
+        metrics.QUEUE_DEPTH.set_function(self.queue_depth, name)
+
+    def _ensure_worker(self) -> None:
+        # Threads do not survive fork, so a forked child starts its own worker
+        if self._worker is not None and self._worker.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name=f"batch-{self.name}", daemon=True)
+            self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        """Queue one item and return a Future for its result"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def run(self, item: Any) -> Any:
+        """Run one item through the model and wait for its result"""
+        return self.submit(item).result()
+
+    def run_many(self, items: Sequence[Any]) -> List[Any]:
+        """Run several items through the model and wait for all results, in order"""
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def queue_depth(self) -> int:
+        """Number of items waiting for the worker"""
+        return self._queue.qsize()
+
+    def _collect(self) -> List:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            # Skip items whose caller cancelled them while they were queued
+            batch = [(item, future) for item, future in self._collect() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            started = time.perf_counter()
+            try:
+                results = self.process_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name} returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                logger.error(f"Batch of {len(items)} failed in {self.name}: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                metrics.BATCH_SECONDS.observe(time.perf_counter() - started, self.name)
+                metrics.BATCH_SIZE.observe(len(items), self.name)
+
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
@@ -0,0 +1,346 @@
+import os
+import json
+import threading
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per matrix multiply when scanning the catalog
+SCAN_CHUNK_ROWS = 65536
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, highest first, without a full sort"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def _spherical_kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 10,
+                      seed: int = 0) -> np.ndarray:
+    """
+    k-means on the unit sphere (cosine similarity), returning normalized centroids
+
+    Args:
+        vectors: float32 array of normalized rows
+        n_clusters: Number of centroids
+        iterations: Lloyd iterations
+        seed: Seed for the initial centroid sample
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        # Empty clusters are reseeded from random rows
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+    return centroids.astype(np.float32)
+
+
+class CatalogIndex:
+    """
+    Persistent vector index of catalog image embeddings.
+
+    Normalized CLIP embeddings are stored as a memory-mapped float16 matrix,
+    with catalog ids kept alongside in the same directory. Small catalogs are
+    searched exactly. Once a catalog passes exact_threshold rows an inverted
+    file (IVF) index is built: rows are grouped under k-means centroids and a
+    query only scores the rows of its nprobe closest lists, plus any rows
+    added since the lists were built.
+
+    Every server worker process opens the same directory. A worker reloads
+    the index when it sees another one has written it; ingestion itself is
+    not coordinated across processes and should come from one client at a time.
+
+    Files in the index directory:
+        meta.json       - model name, dimension, row count and capacity
+        ids.json        - catalog id of each row
+        embeddings.f16  - float16 matrix of shape [capacity, dim]
+        ivf.npz         - IVF centroids and lists, when built
+    """
+
+    def __init__(self, comparer, directory: str,
+                 exact_threshold: Optional[int] = None,
+                 n_lists: Optional[int] = None,
+                 n_probe: Optional[int] = None):
+        """
+        Args:
+            comparer (ImageSimilarityComparer): Used to embed catalog and query images
+            directory (str): Where the index files live; created if missing
+            exact_threshold (int, optional): Largest catalog searched exactly.
+                                             Defaults to config.CATALOG_EXACT_THRESHOLD.
+            n_lists (int, optional): IVF lists; 0 or None picks about 4 * sqrt(rows).
+            n_probe (int, optional): IVF lists scored per query.
+                                     Defaults to config.CATALOG_IVF_PROBES.
+        """
+        self.comparer = comparer
+        self.directory = directory
+        self.exact_threshold = exact_threshold if exact_threshold is not None else config.CATALOG_EXACT_THRESHOLD
+        self.n_lists = n_lists if n_lists is not None else config.CATALOG_IVF_LISTS
+        self.n_probe = max(1, n_probe or config.CATALOG_IVF_PROBES)
+
+        self._lock = threading.RLock()
+        self.model_name = comparer.model_name
+        self.dim = None
+        self.count = 0
+        self.capacity = 0
+        self.ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._matrix = None
+        self._ivf = None
+        self._signature = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # Persistence
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _file_signature(self) -> Tuple:
+        """Modification times of the files other processes rewrite"""
+        signature = []
+        for name in ('meta.json', 'ivf.npz'):
+            try:
+                signature.append(os.stat(self._path(name)).st_mtime_ns)
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _refresh(self) -> None:
+        """Reload if another worker process has written the index since it was read"""
+        if self._file_signature() != self._signature:
+            self._load()
+
+    def _load(self) -> None:
+        self._signature = self._file_signature()
+        if not os.path.exists(self._path('meta.json')):
+            return
+        with open(self._path('meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('model_name') != self.model_name:
+            raise ValueError(
+                f"Catalog index in {self.directory} was built with {meta.get('model_name')}, "
+                f"not {self.model_name}"
+            )
+        with open(self._path('ids.json')) as f:
+            self.ids = json.load(f)
+        self.dim = meta['dim']
+        self.count = meta['count']
+        self.capacity = meta['capacity']
+        self._rows = {catalog_id: row for row, catalog_id in enumerate(self.ids)}
+        self._matrix = np.memmap(self._path('embeddings.f16'), dtype=np.float16, mode='r+',
+                                 shape=(self.capacity, self.dim))
+        self._ivf = None
+        if os.path.exists(self._path('ivf.npz')):
+            with np.load(self._path('ivf.npz')) as data:
+                self._ivf = {key: data[key] for key in data.files}
+        logger.info(f"Loaded catalog index with {self.count} images from {self.directory}")
+
+    def _save_meta(self) -> None:
+        with open(self._path('ids.json.tmp'), 'w') as f:
+            json.dump(self.ids, f)
+        os.replace(self._path('ids.json.tmp'), self._path('ids.json'))
+        with open(self._path('meta.json.tmp'), 'w') as f:
+            json.dump({
+                'model_name': self.model_name,
+                'dim': self.dim,
+                'count': self.count,
+                'capacity': self.capacity
+            }, f)
+        os.replace(self._path('meta.json.tmp'), self._path('meta.json'))
+        self._signature = self._file_signature()
+
+    def _reserve(self, rows: int) -> None:
+        """Grow the memory-mapped matrix so it can hold at least `rows` rows"""
+        if rows <= self.capacity:
+            return
+        capacity = max(1024, self.capacity * 2, rows)
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        # Extending the file keeps existing rows and zero fills the rest
+        with open(self._path('embeddings.f16'), 'ab') as f:
+            f.truncate(capacity * self.dim * 2)
+        self.capacity = capacity
+        self._matrix = np.memmap(self._path('embeddings.f16'), dtype=np.float16, mode='r+',
+                                 shape=(self.capacity, self.dim))
+
+    # Ingestion
+
+    def add(self, items: Sequence[Tuple[str, object]], batch_size: int = 64) -> Dict:
+        """
+        Embed and store catalog images; an existing id has its embedding replaced
+
+        Args:
+            items: (catalog id, image bytes or DecodedImage) pairs
+            batch_size: Images embedded per call to the comparer
+
+        Returns:
+            Dict with 'added', 'updated' and 'total' counts
+        """
+        added = updated = 0
+        for start in range(0, len(items), batch_size):
+            chunk = items[start:start + batch_size]
+            embeddings = self.comparer.embed([image for _, image in chunk]).astype(np.float16)
+            with self._lock:
+                self._refresh()
+                if self.dim is None:
+                    self.dim = embeddings.shape[1]
+                self._reserve(self.count + len(chunk))
+                for (catalog_id, _), embedding in zip(chunk, embeddings):
+                    catalog_id = str(catalog_id)
+                    row = self._rows.get(catalog_id)
+                    if row is None:
+                        row = self.count
+                        self._rows[catalog_id] = row
+                        self.ids.append(catalog_id)
+                        self.count += 1
+                        added += 1
+                    else:
+                        updated += 1
+                    self._matrix[row] = embedding
+                self._matrix.flush()
+                self._save_meta()
+
+        with self._lock:
+            if self._needs_ivf_rebuild():
+                self.build_ivf()
+            return {'added': added, 'updated': updated, 'total': self.count}
+
+    # IVF
+
+    def _needs_ivf_rebuild(self) -> bool:
+        if self.count <= self.exact_threshold:
+            return False
+        if self._ivf is None:
+            return True
+        # Rows added since the build are scanned exactly; rebuild once they dominate
+        return self.count > 2 * int(self._ivf['built_count'])
+
+    def build_ivf(self, n_lists: Optional[int] = None) -> Dict:
+        """
+        (Re)build the IVF lists over every row currently stored
+
+        Args:
+            n_lists (int, optional): Number of lists. Defaults to self.n_lists, or about 4 * sqrt(rows).
+        """
+        with self._lock:
+            self._refresh()
+            count = self.count
+            if count == 0:
+                raise ValueError("Catalog index is empty")
+            n_lists = n_lists or self.n_lists or int(4 * np.sqrt(count))
+            n_lists = max(1, min(n_lists, count))
+
+            # Train on a sample, then assign every row in chunks
+            rng = np.random.default_rng(0)
+            sample_rows = np.sort(rng.choice(count, min(count, n_lists * 64), replace=False))
+            centroids = _spherical_kmeans(np.asarray(self._matrix[sample_rows], dtype=np.float32), n_lists)
+
+            assignments = np.empty(count, dtype=np.int32)
+            for start in range(0, count, SCAN_CHUNK_ROWS):
+                block = np.asarray(self._matrix[start:min(count, start + SCAN_CHUNK_ROWS)], dtype=np.float32)
+                assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+
+            # Lists as CSR: rows of list i are list_rows[list_offsets[i]:list_offsets[i + 1]]
+            order = np.argsort(assignments, kind='stable').astype(np.int64)
+            list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+            np.cumsum(np.bincount(assignments, minlength=n_lists), out=list_offsets[1:])
+
+            self._ivf = {
+                'centroids': centroids,
+                'list_offsets': list_offsets,
+                'list_rows': order,
+                'built_count': np.array(count)
+            }
+            np.savez(self._path('ivf.npz.tmp.npz'), **self._ivf)
+            os.replace(self._path('ivf.npz.tmp.npz'), self._path('ivf.npz'))
+            self._signature = self._file_signature()
+            logger.info(f"Built IVF index with {n_lists} lists over {count} catalog images")
+            return {'lists': n_lists, 'rows': count}
+
+    # Search
+
+    def _score_rows(self, query: np.ndarray, rows: Optional[np.ndarray], count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Score either the given rows or all of the first `count` rows, chunked"""
+        if rows is None:
+            scores = np.empty(count, dtype=np.float32)
+            for start in range(0, count, SCAN_CHUNK_ROWS):
+                stop = min(count, start + SCAN_CHUNK_ROWS)
+                scores[start:stop] = np.asarray(self._matrix[start:stop], dtype=np.float32) @ query
+            return np.arange(count), scores
+        rows = np.sort(rows)
+        return rows, np.asarray(self._matrix[rows], dtype=np.float32) @ query
+
+    def search(self, image, top_k: int = 10, exact: Optional[bool] = None) -> Dict:
+        """
+        Find the catalog images most similar to a query image
+
+        Args:
+            image: Query image bytes or DecodedImage
+            top_k: Number of matches to return
+            exact: Force exact (True) or IVF (False) search. Defaults to exact
+                   until the catalog passes exact_threshold.
+
+        Returns:
+            Dict with 'matches' ([{'id', 'score'}], best first) and 'method'
+        """
+        query = self.comparer.embed([image])[0].astype(np.float32)
+        with self._lock:
+            self._refresh()
+            count = self.count
+            if count == 0:
+                return {'matches': [], 'method': 'exact', 'candidates': 0}
+
+            use_ivf = self._ivf is not None and (not exact if exact is not None else count > self.exact_threshold)
+            if use_ivf:
+                ivf = self._ivf
+                centroid_scores = ivf['centroids'] @ query
+                probes = _top_k(centroid_scores, self.n_probe)
+                offsets, list_rows = ivf['list_offsets'], ivf['list_rows']
+                parts = [list_rows[offsets[i]:offsets[i + 1]] for i in probes]
+                # Rows added after the lists were built are always scanned
+                parts.append(np.arange(int(ivf['built_count']), count))
+                rows, scores = self._score_rows(query, np.concatenate(parts), count)
+                method = 'ivf'
+            else:
+                rows, scores = self._score_rows(query, None, count)
+                method = 'exact'
+
+            best = _top_k(scores, top_k)
+            return {
+                'matches': [{'id': self.ids[rows[i]], 'score': float(scores[i])} for i in best],
+                'method': method,
+                'candidates': int(len(rows))
+            }
+
+    def stats(self) -> Dict:
+        """Size and layout of the index"""
+        with self._lock:
+            self._refresh()
+            return {
+                'model_name': self.model_name,
+                'count': self.count,
+                'dim': self.dim,
+                'capacity': self.capacity,
+                'exact_threshold': self.exact_threshold,
+                'ivf_lists': int(len(self._ivf['centroids'])) if self._ivf is not None else 0,
+                'ivf_built_count': int(self._ivf['built_count']) if self._ivf is not None else 0,
+                'ivf_probes': self.n_probe
+            }
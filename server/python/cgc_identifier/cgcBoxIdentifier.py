@@ -1,7 +1,11 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from ultralytics import YOLO
-import cv2
 import numpy as np
+import torch
+from .. import config
+from .. import torchRuntime
+from ..batchScheduler import BatchScheduler
+from ..imageDecoding import DecodedImage, DecodePool, imdecode
 
 class CGCIdentifier:
     """
@@ -19,10 +23,104 @@ class CGCIdentifier:
             self.model = YOLO(model_path)
             # Store class names for easy lookup
             self.class_names = self.model.names
+            # The Ultralytics predictor keeps per-call state, so every call goes
+            # through the scheduler's single worker, batched with other requests
+            self.scheduler = BatchScheduler(
+                'cgc',
+                self._predict_batch,
+                max_batch_size=config.CGC_BATCH_SIZE,
+                max_wait_ms=config.CGC_BATCH_WAIT_MS
+            )
+            # OpenCV decodes of batch uploads run in parallel
+            self.decode_pool = DecodePool(config.CGC_DECODE_WORKERS, 'cgc-decode')
+            torchRuntime.register_warm_up('cgc_identifier', self.warm_up)
         except Exception as e:
             print(f"Error loading model from {model_path}: {e}")
             raise
 
+    def _decode(self, binary_image) -> Tuple[Optional[np.ndarray], float]:
+        """Decode bytes, a DecodedImage or an array to (BGR array, scale to full resolution)"""
+        if isinstance(binary_image, np.ndarray):
+            return binary_image, 1
+        if isinstance(binary_image, DecodedImage):
+            return binary_image.bgr(long_side=config.CGC_IMAGE_SIZE)
+        return imdecode(binary_image, long_side=config.CGC_IMAGE_SIZE)
+
+    def _to_detections(self, result, conf_threshold: float, target_classes: Optional[List[str]],
+                       scale: float = 1, offset: Tuple[int, int] = (0, 0)) -> List[Dict]:
+        """
+        Filter one Ultralytics result into detection dicts
+
+        Confidence and class filtering run as tensor masks over all boxes at
+        once, and the kept boxes are copied off the device in one transfer.
+        """
+        boxes = result.boxes
+        conf = torch.as_tensor(boxes.conf)
+        cls = torch.as_tensor(boxes.cls)
+        keep = conf >= conf_threshold
+        if target_classes is not None:
+            wanted = [class_id for class_id, name in self.class_names.items() if name in target_classes]
+            keep &= torch.isin(cls, torch.tensor(wanted, dtype=cls.dtype, device=cls.device))
+
+        x_offset, y_offset = offset
+        shift = torch.tensor([x_offset, y_offset, x_offset, y_offset], dtype=torch.float32)
+        xyxy = (torch.as_tensor(boxes.xyxy)[keep].float().cpu() + shift) * scale
+        return [
+            {'box': box, 'confidence': confidence, 'label': self.class_names[class_id]}
+            for box, confidence, class_id in zip(xyxy.tolist(), conf[keep].tolist(), cls[keep].int().tolist())
+        ]
+
+    def _predict_batch(self, items: List[Tuple[np.ndarray, Optional[int]]]) -> List:
+        """
+        Run YOLO on a list of (decoded image, inference size) items; called only from the scheduler worker
+
+        Items asking for the same inference size share one call. A size of None
+        uses the model's default.
+        """
+        results = [None] * len(items)
+        by_size = {}
+        for i, (_, imgsz) in enumerate(items):
+            by_size.setdefault(imgsz, []).append(i)
+        for imgsz, indices in by_size.items():
+            kwargs = {'verbose': False}  # Set verbose=False for cleaner output
+            if imgsz:
+                kwargs['imgsz'] = imgsz
+            for i, result in zip(indices, self.model([items[i][0] for i in indices], **kwargs)):
+                results[i] = result
+        return results
+
+    def warm_up(self) -> None:
+        """Run YOLO on a blank image at each inference size the grading pipeline uses"""
+        sizes = {config.CGC_IMAGE_SIZE}
+        if config.CGC_STAGED_PIPELINE:
+            sizes.add(config.CGC_SCREEN_SIZE)
+        self._predict_batch([(np.zeros((size, size, 3), dtype=np.uint8), size) for size in sorted(sizes)])
+
+    def detect_array(self,
+                     image: np.ndarray,
+                     conf_threshold: float = 0.5,
+                     target_classes: Optional[List[str]] = None,
+                     scale: float = 1,
+                     offset: Tuple[int, int] = (0, 0),
+                     imgsz: Optional[int] = None) -> List[Dict]:
+        """
+        Identifies objects in an already decoded BGR array.
+
+        Args:
+            image (np.ndarray): BGR image, possibly a reduced decode or a region of one
+            conf_threshold (float): The minimum confidence score to include a detection.
+            target_classes (Optional[List[str]]): Class names to keep, or None for all.
+            scale (float): Factor from the decoded image to full resolution coordinates
+            offset (Tuple[int, int]): (x, y) of the array within the decoded image
+            imgsz (Optional[int]): YOLO inference size. Defaults to the model's own.
+
+        Returns:
+            List[Dict]: Detections with boxes in full resolution coordinates,
+                        ((coord + offset) * scale).
+        """
+        result = self.scheduler.run((image, imgsz))
+        return self._to_detections(result, conf_threshold, target_classes, scale=scale, offset=offset)
+
     def identify_cgc(self, 
                      binary_image: bytes, 
                      conf_threshold: float = 0.5, 
@@ -30,8 +128,13 @@ class CGCIdentifier:
         """
         Identifies objects in the provided binary image data, with filtering options.
         
+        YOLO letterboxes its input to CGC_IMAGE_SIZE, so JPEGs are decoded at the
+        smallest power-of-two reduction that still covers it. Boxes are scaled
+        back to full resolution coordinates.
+        
         Args:
-            binary_image (bytes): Image data in bytes.
+            binary_image (bytes): Image data in bytes, a DecodedImage, or an already decoded
+                                  full resolution BGR array.
             conf_threshold (float): The minimum confidence score to include a detection. Defaults to 0.5.
             target_classes (Optional[List[str]]): A list of class names to filter by. 
                                                   If None, all classes are considered. Defaults to None.
@@ -42,40 +145,63 @@ class CGCIdentifier:
         """
         try:
             # Decode the binary image data into a NumPy array
-            nparr = np.frombuffer(binary_image, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            image, scale = self._decode(binary_image)
 
             if image is None:
                 print("Error: Could not decode binary image data.")
                 return []
 
             # Run prediction
-            results = self.model(image, verbose=False) # Set verbose=False for cleaner output
-            
-            detections = []
-            for r in results:
-                for box in r.boxes:
-                    confidence = box.conf[0].item()
-                    
-                    # Apply confidence threshold filtering
-                    if confidence >= conf_threshold:
-                        class_id = int(box.cls[0].item())
-                        label = self.class_names[class_id]
-                        
-                        # Apply class name filtering
-                        if target_classes is None or label in target_classes:
-                            x1, y1, x2, y2 = box.xyxy[0].tolist()
-                            
-                            detections.append({
-                                'box': [x1, y1, x2, y2],
-                                'confidence': confidence,
-                                'label': label
-                            })
-                            
-            return detections
+            return self.detect_array(image, conf_threshold, target_classes, scale=scale)
         except Exception as e:
             print(f"Error during CGC identification: {e}")
             return [] # Return empty list on error instead of raising
+
+    def identify_cgc_batch(self,
+                           binary_images: List,
+                           conf_threshold: float = 0.5,
+                           target_classes: Optional[List[str]] = None) -> List[List[Dict]]:
+        """
+        Identifies objects in several images.
+
+        Images are decoded in parallel on the decode pool and each one is queued
+        for YOLO as soon as it is decoded, so Ultralytics receives them as lists
+        of up to CGC_BATCH_SIZE images per call while the rest still decode.
+
+        Args:
+            binary_images (List): Image bytes, DecodedImages or decoded BGR arrays
+            conf_threshold (float): The minimum confidence score to include a detection.
+            target_classes (Optional[List[str]]): Class names to keep, or None for all.
+
+        Returns:
+            List[List[Dict]]: Detections per image, in input order. An image that
+                              cannot be decoded or fails gets an empty list.
+        """
+        decoded = [self.decode_pool.submit(self._decode, image) for image in binary_images]
+        pending = []
+        for future in decoded:
+            try:
+                image, scale = future.result()
+            except Exception as e:
+                print(f"Error decoding image for CGC identification: {e}")
+                image, scale = None, 1
+            if image is None:
+                pending.append(None)
+            else:
+                pending.append((self.scheduler.submit((image, None)), scale))
+
+        detections = []
+        for item in pending:
+            if item is None:
+                detections.append([])
+                continue
+            future, scale = item
+            try:
+                detections.append(self._to_detections(future.result(), conf_threshold, target_classes, scale=scale))
+            except Exception as e:
+                print(f"Error during CGC identification: {e}")
+                detections.append([])
+        return detections
         
 
 if __name__ == "__main__":
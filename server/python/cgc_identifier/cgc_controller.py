@@ -1,21 +1,219 @@
 from .cgcBoxIdentifier import CGCIdentifier
 from .image_to_text import ImageToText
+from .. import config
+from ..modelRegistry import model_registry
+from ..imageDecoding import as_decoded
+from ..resultCache import ResultCache
+from .. import metrics
 import cv2
 import io
+import os
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Models are loaded once per process and shared by every GrabcgcGrading instance
+model_registry.register('cgc_identifier', lambda: CGCIdentifier(model_path=config.CGC_MODEL_PATH))
+model_registry.register('image_to_text', lambda: ImageToText(languages=config.OCR_LANGUAGES, gpu=config.OCR_GPU))
+
+# Labels that only appear on a graded slab
+SLAB_LABELS = ['cgc_grade', 'cgc_authentication', 'cgc_slab']
+
+# Minimum YOLO confidence of the detections process_image grades from
+GRADE_CONFIDENCE = 0.6
+
+
+def _add_timing(timings, name, started):
+    seconds = time.perf_counter() - started
+    metrics.record_stage(name[:-len('_ms')], seconds)
+    # Per-call stage timings are only collected when the caller asked for them
+    if timings is not None:
+        timings[name] = round(timings.get(name, 0) + seconds * 1000, 2)
+
 
 # Load an example image file as binary data
 # with open('1.jpg', 'rb') as img_file:
 #     image_bytes = img_file.read()
 class GrabcgcGrading: 
-    def __init__(self):
-        pass
+    def __init__(self, identifier=None, image_to_text=None, cache=None):
+        """
+        Args:
+            identifier (CGCIdentifier, optional): Detector to use. Defaults to the shared registry instance.
+            image_to_text (ImageToText, optional): OCR reader to use. Defaults to the shared registry instance.
+            cache (ResultCache, optional): Cache of detections and results by image hash.
+                                           Defaults to one built from the GRADE_CACHE_* settings.
+        """
+        self._identifier = identifier
+        self._image_to_text = image_to_text
+        self.cache = cache or ResultCache(
+            'cgc',
+            max_entries=config.GRADE_CACHE_SIZE,
+            max_bytes=config.GRADE_CACHE_MAX_BYTES,
+            ttl_seconds=config.GRADE_CACHE_TTL_SECONDS,
+            disk_path=config.GRADE_CACHE_PATH or None
+        )
+        # Cached entries are only valid for the models that produced them
+        self._model_tag = f"{os.path.basename(config.CGC_MODEL_PATH)}:{'+'.join(config.OCR_LANGUAGES)}"
+
+    @property
+    def identifier(self):
+        return self._identifier or model_registry.get('cgc_identifier')
+
+    @property
+    def image_to_text(self):
+        return self._image_to_text or model_registry.get('image_to_text')
+
+    def detect(self, image_bytes, confidence_threshold=0.6, timings=None):
+        """
+        YOLO detections for an image, cached by image hash
+
+        Returns:
+            dict: {'detections': [...], 'slab': bool or None when not screened,
+                   'decode_long_side': decode the detections were made on, or None for full size}
+        """
+        image_bytes = as_decoded(image_bytes)
+        key = self.cache.key_for(image_bytes.data, f"detections:{self._settings_tag(confidence_threshold)}")
+        if config.CGC_STAGED_PIPELINE:
+            compute = lambda: self._detect_staged(image_bytes, confidence_threshold, timings)
+        else:
+            compute = lambda: {
+                'detections': self.identifier.identify_cgc(image_bytes, confidence_threshold),
+                'slab': None,
+                'decode_long_side': None
+            }
+        return self.cache.get_or_compute(key, compute)
+
+    def _settings_tag(self, confidence_threshold):
+        """Models, pipeline mode and threshold a cached entry was computed with"""
+        mode = 'staged' if config.CGC_STAGED_PIPELINE else 'full'
+        return f"{self._model_tag}:{mode}:{confidence_threshold}"
+
+    def _detect_staged(self, image, confidence_threshold, timings=None):
+        """
+        Two pass detection: screen for a slab at low resolution, then detect on the slab region
+
+        Raw comics, most of the traffic, stop after the cheap screening pass.
+        For slabs the second pass sees the region of interest at up to
+        CGC_ROI_DECODE_SIZE pixels instead of the whole frame at CGC_IMAGE_SIZE.
+        """
+        no_slab = {'detections': [], 'slab': False, 'decode_long_side': None}
+        if not image.valid:
+            print("Error: Could not decode binary image data.")
+            return no_slab
+        identifier = self.identifier
+        width, height = image.size
+
+        started = time.perf_counter()
+        screen, factor = image.bgr(long_side=config.CGC_SCREEN_SIZE)
+        _add_timing(timings, 'decode_ms', started)
+        if screen is None:
+            print("Error: Could not decode binary image data.")
+            return no_slab
+
+        started = time.perf_counter()
+        found = identifier.detect_array(screen, config.CGC_SCREEN_CONFIDENCE, SLAB_LABELS,
+                                        scale=factor, imgsz=config.CGC_SCREEN_SIZE)
+        _add_timing(timings, 'screen_ms', started)
+        if not found:
+            return no_slab
+
+        # Region of interest: every slab box plus a margin, in full resolution coordinates
+        x1 = min(d['box'][0] for d in found)
+        y1 = min(d['box'][1] for d in found)
+        x2 = max(d['box'][2] for d in found)
+        y2 = max(d['box'][3] for d in found)
+        margin_x, margin_y = (x2 - x1) * config.CGC_ROI_MARGIN, (y2 - y1) * config.CGC_ROI_MARGIN
+        x1, y1 = max(0, x1 - margin_x), max(0, y1 - margin_y)
+        x2, y2 = min(width, x2 + margin_x), min(height, y2 + margin_y)
 
-    def process_image(self, image_bytes):
-        identifier = CGCIdentifier(model_path='/root/generalLister/server/python/cgc_identifier/cgc_identifier_model2/weights/best.pt')
+        # Decode so the region, not the whole frame, gets CGC_ROI_DECODE_SIZE pixels
+        longest = max(width, height)
+        roi_longest = max(1, x2 - x1, y2 - y1)
+        decode_long_side = min(longest, math.ceil(longest * config.CGC_ROI_DECODE_SIZE / roi_longest))
+
+        started = time.perf_counter()
+        decoded, factor = image.bgr(long_side=decode_long_side)
+        _add_timing(timings, 'decode_ms', started)
+        if decoded is None:
+            return no_slab
+        left, top = int(x1 / factor), int(y1 / factor)
+        region = decoded[top:math.ceil(y2 / factor), left:math.ceil(x2 / factor)]
+
+        started = time.perf_counter()
+        detections = identifier.detect_array(region, confidence_threshold, scale=factor,
+                                              offset=(left, top), imgsz=config.CGC_IMAGE_SIZE)
+        _add_timing(timings, 'roi_ms', started)
+        return {'detections': detections, 'slab': True, 'decode_long_side': decode_long_side}
+
+    def process_image(self, image_bytes, timings=None):
+        """
+        Grade and issue text of a CGC slab photo, cached by image hash
+
+        Repeated uploads of the same image are served from the cache, and
+        concurrent requests for one image share a single computation.
+
+        Args:
+            image_bytes: Image bytes or DecodedImage
+            timings (dict, optional): Filled with per-stage milliseconds, the total,
+                                      and whether the result was computed or cached
+        """
+        started = time.perf_counter()
+        # Detection and cropping share one DecodedImage so each scale is decoded once
+        image_bytes = as_decoded(image_bytes)
+        stage_timings = {} if timings is not None else None
+        computed = []
+
+        def compute():
+            computed.append(True)
+            return self._process_image(image_bytes, stage_timings)
+
+        key = self.cache.key_for(image_bytes.data, f"grade:{self._settings_tag(GRADE_CONFIDENCE)}")
+        structured_info = self.cache.get_or_compute(key, compute)
+        if timings is not None:
+            timings.update(stage_timings)
+            timings['result'] = 'computed' if computed else 'cached'
+            timings['total_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return structured_info
+
+    def process_images(self, images, timings=None):
+        """
+        Grade several images at once
+
+        Each image runs through process_image on its own thread, so their YOLO
+        passes and OCR crops are merged into shared batches by the schedulers.
+
+        Args:
+            images (list): Image bytes or DecodedImages
+            timings (list, optional): Filled with one timings dict per image
+
+        Returns:
+            list: structured_info per image, in input order, or {'error': ...} for an image that failed
+        """
+        images = [as_decoded(image) for image in images]
+        image_timings = [{} if timings is not None else None for _ in images]
+
+        def grade(i):
+            try:
+                return self.process_image(images[i], timings=image_timings[i])
+            except Exception as e:
+                print(f"Error grading image {i}: {e}")
+                return {'error': str(e)}
+
+        if not images:
+            return []
+        with ThreadPoolExecutor(max_workers=min(len(images), max(1, config.CGC_BATCH_SIZE))) as pool:
+            futures = [pool.submit(metrics.in_current_context(grade), i) for i in range(len(images))]
+            results = [future.result() for future in futures]
+        if timings is not None:
+            timings.extend(image_timings)
+        return results
+
+    def _process_image(self, image_bytes, timings=None):
         graded=False
-        confidence_threshold = 0.6
+        confidence_threshold = GRADE_CONFIDENCE
 
-        results = identifier.identify_cgc(image_bytes, confidence_threshold)
+        detected = self.detect(image_bytes, confidence_threshold, timings)
+        results = detected['detections']
 
         for detection in results:
             if detection['label'] == 'cgc_grade' or detection['label'] == 'cgc_authentication' or detection['label'] == 'cgc_slab' and detection['confidence'] > confidence_threshold:
@@ -23,11 +221,21 @@ class GrabcgcGrading:
 
         structured_info = {}
         if graded: 
-            image_to_text = ImageToText()
+            image_to_text = self.image_to_text
             items_to_process = [detection for detection in results if detection['label'] in ['cgc_grade', 'comic_issue']]
 
-            cropped_objects = image_to_text.crop_objects(image_bytes, items_to_process)
+            started = time.perf_counter()
+            if detected['decode_long_side']:
+                # Crop from the decode the region pass already made
+                decoded, factor = image_bytes.bgr(long_side=detected['decode_long_side'])
+                cropped_objects = image_to_text.crop_objects(decoded, items_to_process, scale=factor)
+            else:
+                cropped_objects = image_to_text.crop_objects(image_bytes, items_to_process)
+            _add_timing(timings, 'crop_ms', started)
+
+            started = time.perf_counter()
             summary = image_to_text.summarize_text(cropped_objects)
+            _add_timing(timings, 'ocr_ms', started)
             structured_info = {}
             for item in summary:
                 # Get the key (e.g., 'cgc_grade') and the full string value
@@ -1,24 +1,79 @@
 import cv2
 import numpy as np
 import easyocr
-from typing import Dict, List
+from typing import Dict, List, Optional
+from .. import config
+from .. import torchRuntime
+from ..batchScheduler import BatchScheduler
+from ..imageDecoding import DecodedImage
+
+# Blank rows between crops on the recognition canvas
+CANVAS_GAP = 8
+
+
+def _box_key(points) -> tuple:
+    """Bounding rectangle of a line box's points, to match a recognize result to its input box"""
+    xs = [int(round(point[0])) for point in points]
+    ys = [int(round(point[1])) for point in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
 
 class ImageToText:
-    def __init__(self):
+    def __init__(self, languages: Optional[List[str]] = None, gpu: bool = False,
+                 recognize_only_labels: Optional[List[str]] = None):
         """
         Initializes the ImageToText class using EasyOCR.
         This will download the necessary model files on the first run.
+
+        Args:
+            languages (Optional[List[str]]): EasyOCR language codes. Defaults to ['en'].
+            gpu (bool): Run the reader on the GPU. Defaults to False (CPU is fine for this task).
+            recognize_only_labels (Optional[List[str]]): Labels whose crop is a single text line,
+                                                         read without text detection.
+                                                         Defaults to config.OCR_RECOGNIZE_ONLY_LABELS.
         """
-        # Initialize the EasyOCR reader for English.
-        # gpu=False ensures it runs on the CPU, which is fine for this task.
-        self.reader = easyocr.Reader(['en'], gpu=False)
+        self.reader = easyocr.Reader(languages or ['en'], gpu=gpu)
+        self.recognize_only_labels = set(
+            recognize_only_labels if recognize_only_labels is not None else config.OCR_RECOGNIZE_ONLY_LABELS
+        )
+        # EasyOCR only batches line recognition on the GPU; on the CPU it reads one
+        # line at a time, so stacking crops onto a shared canvas would gain nothing
+        self.batch_recognition = self.reader.device != 'cpu'
+        # OCR runs on its own worker thread, apart from YOLO's, and picks up the
+        # crops of concurrent requests together. That worker is the only thread
+        # using the reader, which is not thread safe.
+        self.scheduler = BatchScheduler(
+            'ocr',
+            self._read_batch,
+            max_batch_size=config.OCR_BATCH_SIZE,
+            max_wait_ms=config.OCR_BATCH_WAIT_MS
+        )
+        torchRuntime.register_warm_up('image_to_text', self.warm_up)
+
+    def warm_up(self) -> None:
+        """OCR a blank crop through text detection and, if configured, a recognize-only label"""
+        blank = np.full((48, 160, 3), 255, dtype=np.uint8)
+        image_objects = [{'label': 'warm_up', 'image': blank}]
+        image_objects += [{'label': label, 'image': blank} for label in sorted(self.recognize_only_labels)[:1]]
+        # Through the scheduler, whose worker is the only thread using the reader
+        self.scheduler.run(image_objects)
 
-    def crop_objects(self, binaryImage: bytearray, detections: List[Dict]) -> List[Dict]:
+    def crop_objects(self, binaryImage: bytearray, detections: List[Dict], scale: float = 1) -> List[Dict]:
         """
         Crops all detected objects from an image based on a list of bounding boxes.
+        
+        Bytes and DecodedImage inputs are cropped from a full resolution decode so
+        small label text stays legible, even when detection ran on a reduced image.
+        An already decoded BGR array can be passed instead, with the scale from
+        its pixels to the full resolution coordinates of the boxes.
         """
-        numPyArray = np.frombuffer(binaryImage, np.uint8)
-        original_image = cv2.imdecode(numPyArray, cv2.IMREAD_COLOR)
+        if isinstance(binaryImage, np.ndarray):
+            original_image = binaryImage
+        elif isinstance(binaryImage, DecodedImage):
+            original_image, _ = binaryImage.bgr()
+        else:
+            numPyArray = np.frombuffer(binaryImage, np.uint8)
+            original_image = cv2.imdecode(numPyArray, cv2.IMREAD_COLOR)
 
         if original_image is None:
             print("Error: Could not decode image from binary data.")
@@ -28,7 +83,7 @@ class ImageToText:
         for detection in detections:
             coords = detection['box']
             label = detection['label']
-            x1, y1, x2, y2 = map(int, coords)
+            x1, y1, x2, y2 = (int(coord / scale) for coord in coords)
             cropped_image_data = original_image[y1:y2, x1:x2]
 
             if cropped_image_data.size > 0:
@@ -42,29 +97,133 @@ class ImageToText:
     def summarize_text(self, image_objects: List[Dict]) -> List[Dict] | str:
         """
         Performs OCR on a list of cropped image objects using EasyOCR.
+
+        The crops are queued for the OCR worker, which takes them together with
+        the crops of any other waiting requests (see _read_batch).
         """
-        summary_list = []
-        for obj in image_objects:
-            label = obj['label']
-            image_data = obj['image']
-            
-            try:
-                # EasyOCR reads the image data (NumPy array) directly.
-                # It automatically handles the necessary color conversions.
-                results = self.reader.readtext(image_data)
-                
-                # EasyOCR returns a list of (bbox, text, confidence). We just need the text.
-                # We'll join all detected text fragments with a newline character for consistency.
-                extracted_text = "\n".join([text for _, text, _ in results])
-
-                clean_text = extracted_text.strip()
-                
-                if clean_text:
-                    summary_list.append({label: clean_text})
+        try:
+            return self.scheduler.run(image_objects)
+        except Exception as e:
+            print(f"An error occurred during EasyOCR: {e}")
+            return f"EasyOCR Error: An unexpected error occurred: {e}"
+
+    def _text_lines(self, crop: np.ndarray, label: str):
+        """Text line boxes within a crop, as EasyOCR (horizontal_list, free_list)"""
+        height, width = crop.shape[:2]
+        if label in self.recognize_only_labels:
+            # The YOLO box already is the text line; skip CRAFT detection
+            return [[0, width, 0, height]], []
+        horizontal_list, free_list = self.reader.detect(crop)
+        # EasyOCR pads the boxes it groups by a margin that can reach past the crop;
+        # clamp them so a line never reads pixels from outside its own crop
+        horizontal = []
+        for x1, x2, y1, y2 in horizontal_list[0]:
+            x1, x2, y1, y2 = max(0, x1), min(width, x2), max(0, y1), min(height, y2)
+            if x2 > x1 and y2 > y1:
+                horizontal.append([x1, x2, y1, y2])
+        free = [
+            [[min(max(0, x), width), min(max(0, y), height)] for x, y in box]
+            for box in free_list[0]
+        ]
+        return horizontal, free
 
+    def _read_batch(self, batch: List[List[Dict]]) -> List[List[Dict] | Exception]:
+        """
+        OCR the crops of several images; called only from the scheduler worker
+
+        On the GPU all crops share one recognize call (see _recognize_canvas).
+        On the CPU EasyOCR recognizes one line at a time whatever the batch
+        size, so each crop is recognized on its own. An image whose crops fail
+        gets its exception as its result, so the other requests in the batch
+        still get theirs.
+        """
+        summaries = [[] for _ in batch]
+        crops = []  # (item index, label, grey crop, horizontal lines, free lines)
+        for item_index, image_objects in enumerate(batch):
+            try:
+                item_crops = []
+                for obj in image_objects:
+                    image = obj['image']
+                    grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+                    horizontal, free = self._text_lines(image, obj['label'])
+                    item_crops.append((item_index, obj['label'], grey, horizontal, free))
             except Exception as e:
-                print(f"An error occurred during EasyOCR for label '{label}': {e}")
-                return f"EasyOCR Error: An unexpected error occurred: {e}"
-        
-        return summary_list
+                summaries[item_index] = e
+                continue
+            crops.extend(item_crops)
+
+        lines = None
+        if self.batch_recognition:
+            try:
+                lines = self._recognize_canvas(crops)
+            except Exception:
+                # Fall back to one crop at a time so only the image at fault fails
+                pass
+        if lines is None:
+            lines = []
+            for item_index, _, grey, horizontal, free in crops:
+                try:
+                    lines.append(self._recognize_crop(grey, horizontal, free))
+                except Exception as e:
+                    summaries[item_index] = e
+                    lines.append([])
+
+        for (item_index, label, _, _, _), texts in zip(crops, lines):
+            if isinstance(summaries[item_index], Exception):
+                continue
+            # EasyOCR returns a list of (bbox, text, confidence). We just need the text.
+            # We'll join all detected text fragments with a newline character for consistency.
+            clean_text = "\n".join(texts).strip()
+            if clean_text:
+                summaries[item_index].append({label: clean_text})
+        return summaries
+
+    def _recognize_crop(self, grey: np.ndarray, horizontal: List, free: List) -> List[str]:
+        """Text of the lines of one crop"""
+        if not horizontal and not free:
+            return []
+        results = self.reader.recognize(grey, horizontal_list=horizontal, free_list=free)
+        return [text for _, text, _ in results]
+
+    def _recognize_canvas(self, crops: List[tuple]) -> List[List[str]]:
+        """
+        Text of the lines of every crop, from a single recognize call
+
+        Every crop is stacked onto one grey canvas and its text lines are passed
+        to one recognize call, so the recognizer runs over all lines of all
+        crops in shared batches. Lines are mapped back to the crop whose box
+        they were read from.
+        """
+        horizontal_list, free_list = [], []
+        owners = {}  # line box on the canvas -> index of its crop
+        tops = []
+        top = 0
+        for crop_index, (_, _, grey, horizontal, free) in enumerate(crops):
+            for x1, x2, y1, y2 in horizontal:
+                horizontal_list.append([x1, x2, y1 + top, y2 + top])
+                owners[_box_key([[x1, y1 + top], [x2, y2 + top]])] = crop_index
+            for points in free:
+                box = [[x, y + top] for x, y in points]
+                free_list.append(box)
+                owners[_box_key(box)] = crop_index
+            tops.append(top)
+            top += grey.shape[0] + CANVAS_GAP
+
+        lines = [[] for _ in crops]
+        if not horizontal_list and not free_list:
+            return lines
+        canvas = np.zeros((top, max(grey.shape[1] for _, _, grey, _, _ in crops)), dtype=np.uint8)
+        for (_, _, grey, _, _), crop_top in zip(crops, tops):
+            canvas[crop_top:crop_top + grey.shape[0], :grey.shape[1]] = grey
+
+        results = self.reader.recognize(
+            canvas,
+            horizontal_list=horizontal_list,
+            free_list=free_list,
+            batch_size=len(horizontal_list) + len(free_list)
+        )
 
+        # Results come back sorted by position, each with the box it was read from
+        for box, text, _ in results:
+            lines[owners[_box_key(box)]].append(text)
+        return lines
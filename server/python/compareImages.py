@@ -1,15 +1,136 @@
 from PIL import Image
-from io import BytesIO
-from typing import List, Dict
+from collections import OrderedDict
+from typing import List, Dict, Optional, Union
 from sentence_transformers import SentenceTransformer, util
+import numpy as np
 import torch
+import hashlib
+import threading
 import logging
+from . import config
+from . import metrics
+from .batchScheduler import BatchScheduler
+from . import torchRuntime
+from .inferenceBackend import load_backend
+from .imageDecoding import DecodedImage, DecodePool, open_image
+from .resultCache import SqliteStore
+
+
+class EmbeddingCache:
+    """
+    Two tier cache of image embeddings keyed by a hash of the raw image bytes.
+
+    Entries live in an in-memory LRU and, when a path is given, in a sqlite
+    file that survives restarts and is shared by every server worker process.
+    Keys are tagged with the model name so embeddings from different models
+    never mix.
+    """
+
+    def __init__(self, model_name: str, max_entries: int = 4096, disk_path: Optional[str] = None):
+        """
+        Args:
+            model_name: Model the embeddings belong to
+            max_entries: Maximum embeddings kept in memory
+            disk_path: Optional sqlite file for the persistent tier
+        """
+        self.model_name = model_name
+        self.max_entries = max(0, max_entries)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.disk_path = disk_path or None
+        self._disk = None
+        if self.disk_path:
+            self._disk = SqliteStore(
+                self.disk_path,
+                'CREATE TABLE IF NOT EXISTS embeddings ('
+                'key TEXT PRIMARY KEY, dim INTEGER NOT NULL, vector BLOB NOT NULL)'
+            )
+
+    def key_for(self, image_bytes: bytes) -> str:
+        """Content hash of the raw image bytes, tagged with the model name"""
+        return f"{self.model_name}:{hashlib.blake2b(image_bytes, digest_size=20).hexdigest()}"
+
+    def get(self, key: str) -> Optional[torch.Tensor]:
+        """Look up an embedding, checking memory first and then disk"""
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return embedding
+
+            if self.disk_path is not None:
+                row = self._disk.db.execute('SELECT dim, vector FROM embeddings WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    embedding = torch.from_numpy(np.frombuffer(row[1], dtype=np.float32).reshape(row[0]).copy())
+                    self._remember(key, embedding)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return embedding
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, embedding: torch.Tensor) -> None:
+        """Store an embedding in every tier"""
+        embedding = embedding.detach().to('cpu', torch.float32)
+        with self._lock:
+            self._remember(key, embedding)
+            if self.disk_path is not None:
+                self._disk.db.execute(
+                    'INSERT OR REPLACE INTO embeddings (key, dim, vector) VALUES (?, ?, ?)',
+                    (key, embedding.numel(), embedding.numpy().tobytes())
+                )
+                self._disk.db.commit()
+
+    def _remember(self, key: str, embedding: torch.Tensor) -> None:
+        if self.max_entries == 0:
+            return
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict:
+        """Hit and miss counters for the cache"""
+        with self._lock:
+            return {
+                'model_name': self.model_name,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory_entries': len(self._memory),
+                'persistent': self.disk_path is not None
+            }
+
+
+class VisionTower(torch.nn.Module):
+    """Image half of a CLIP model: pixel values in, projected image embeddings out"""
+
+    def __init__(self, clip_model: torch.nn.Module):
+        super().__init__()
+        self.vision_model = clip_model.vision_model
+        self.visual_projection = clip_model.visual_projection
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.visual_projection(self.vision_model(pixel_values=pixel_values).pooler_output)
+
 
 class ImageSimilarityComparer:
-    def __init__(self, model_name: str = 'clip-ViT-B-32'):
+    def __init__(self, model_name: str = 'clip-ViT-B-32', cache: Optional[EmbeddingCache] = None):
         """Initialize the image similarity comparer with CLIP model"""
         print(f'Loading CLIP Model: {model_name}...')
+        self.model_name = model_name
         self.model = SentenceTransformer(model_name)
+        self.cache = cache or EmbeddingCache(
+            model_name,
+            max_entries=config.CLIP_CACHE_SIZE,
+            disk_path=config.CLIP_CACHE_PATH or None
+        )
         
         # Setup logging
         logging.basicConfig(level=logging.INFO)
@@ -19,70 +140,231 @@ class ImageSimilarityComparer:
         self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
         self.model.to(self.device)
         print(f'Using device: {self.device}')
+        
+        # The torch backend keeps sentence-transformers' own encode; other
+        # backends run only the vision tower on preprocessed pixels
+        self.vision_backend = None
+        if config.CLIP_BACKEND != 'torch':
+            self.vision_backend = self.build_vision_backend(config.CLIP_BACKEND, config.CLIP_ONNX_INT8)
+            self.logger.info(f"Using the {self.vision_backend.name} inference backend")
+        elif config.TORCH_COMPILE:
+            clip_model = self.model[0].model
+            clip_model.vision_model = torchRuntime.prepare_module(clip_model.vision_model, 'clip')
+        torchRuntime.register_warm_up('clip', self.warm_up)
+        
+        # Encodes from concurrent requests are merged into shared forward passes
+        self.scheduler = BatchScheduler(
+            'clip',
+            self._encode_batch,
+            max_batch_size=config.CLIP_BATCH_SIZE,
+            max_wait_ms=config.CLIP_BATCH_WAIT_MS
+        )
+        
+        # Uploads are decoded in parallel, ahead of the encoder
+        self.decode_pool = DecodePool(config.CLIP_DECODE_WORKERS, 'clip-decode')
     
-    def _bytes_to_image(self, image_bytes: bytes) -> Image.Image:
-        """Convert bytes to PIL Image and ensure RGB format"""
+    def _bytes_to_image(self, image_bytes: Union[bytes, DecodedImage]) -> Image.Image:
+        """
+        Convert bytes (or a DecodedImage) to PIL Image and ensure RGB format
+        
+        CLIP only sees a crop of the shortest side at its input size, so JPEGs
+        are decoded directly at the smallest scale that still covers it.
+        """
         try:
-            image = Image.open(BytesIO(image_bytes))
-            # Convert to RGB if needed (handles RGBA, P, etc.)
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            return image
+            # Converts to RGB if needed (handles RGBA, P, etc.)
+            if isinstance(image_bytes, DecodedImage):
+                return image_bytes.pil('RGB', short_side=config.CLIP_INPUT_SIZE)
+            return open_image(image_bytes, 'RGB', short_side=config.CLIP_INPUT_SIZE)
+        except ValueError as e:
+            # Decoder errors already carry the "Invalid image data" prefix
+            self.logger.error(f"Error converting bytes to image: {e}")
+            raise
         except Exception as e:
             self.logger.error(f"Error converting bytes to image: {e}")
             raise ValueError(f"Invalid image data: {e}")
     
-    def _encode_images(self, images: List[Image.Image], batch_size: int = 32) -> torch.Tensor:
-        """Encode images using CLIP model"""
-        try:
-            return self.model.encode(
+    def _load_for_encoding(self, image_bytes: Union[bytes, DecodedImage]) -> Image.Image:
+        """
+        Decode an image and shrink it to CLIP's input scale; runs on the decode pool
+        
+        CLIP resizes the shortest side to its input size before center cropping,
+        so doing that resize here moves the full-frame work off the encoder.
+        """
+        with metrics.stage('decode'):
+            image = self._bytes_to_image(image_bytes)
+        width, height = image.size
+        shortest = min(width, height)
+        if shortest > config.CLIP_INPUT_SIZE:
+            scale = config.CLIP_INPUT_SIZE / shortest
+            with metrics.stage('preprocess'):
+                image = image.resize(
+                    (max(config.CLIP_INPUT_SIZE, round(width * scale)), max(config.CLIP_INPUT_SIZE, round(height * scale))),
+                    Image.BICUBIC
+                )
+        return image
+    
+    def build_vision_backend(self, backend: str, int8: bool = False):
+        """
+        Inference backend running the CLIP vision tower
+        
+        Args:
+            backend: str - 'torch' or 'onnx'
+            int8: bool - Use the int8 quantized ONNX export
+            
+        Returns:
+            Callable from a [N, 3, H, W] pixel batch (see pixel_values) to [N, dim] embeddings on the CPU
+        """
+        clip_module = self.model[0]
+        size = clip_module.processor.image_processor.crop_size['height']
+        return load_backend(
+            f"clip-{self.model_name}",
+            VisionTower(clip_module.model),
+            torch.zeros((1, 3, size, size)),
+            backend,
+            device=self.device,
+            int8=int8
+        )
+    
+    def pixel_values(self, images: List[Image.Image]) -> torch.Tensor:
+        """CLIP's resize, center crop and normalization of a batch of images"""
+        return self.model[0].processor.image_processor(images, return_tensors='pt')['pixel_values']
+    
+    def _encode_batch(self, images: List[Image.Image]) -> List[torch.Tensor]:
+        """Run one CLIP forward pass; called only from the scheduler worker"""
+        if self.vision_backend is not None:
+            return list(self.vision_backend(self.pixel_values(images)))
+        with torch.inference_mode():
+            embeddings = self.model.encode(
                 images, 
-                batch_size=batch_size, 
+                batch_size=len(images), 
                 convert_to_tensor=True, 
-                show_progress_bar=len(images) > 10,
+                show_progress_bar=False,
                 device=self.device
             )
-        except Exception as e:
-            self.logger.error(f"Error encoding images: {e}")
-            raise
+        return list(embeddings)
+    
+    def warm_up(self):
+        """One encode of a blank image, so the first request runs at steady-state speed"""
+        self._encode_batch([Image.new('RGB', (config.CLIP_INPUT_SIZE, config.CLIP_INPUT_SIZE))])
+    
+    def _embed(self, images: List[Union[bytes, DecodedImage]]) -> torch.Tensor:
+        """
+        Embed raw images, only decoding and encoding the ones missing from the cache
+
+        Returns:
+            torch.Tensor - One embedding per input image, in input order
+        """
+        keys = [
+            self.cache.key_for(image.data if isinstance(image, DecodedImage) else image)
+            for image in images
+        ]
+        embeddings = {}
+        missing = {}
+        for key, image_bytes in zip(keys, images):
+            if key in embeddings or key in missing:
+                continue
+            embedding = self.cache.get(key)
+            if embedding is None:
+                missing[key] = image_bytes
+            else:
+                embeddings[key] = embedding
+
+        if missing:
+            self.logger.info(f"Encoding {len(missing)} uncached images ({len(embeddings)} cached)")
+            missing_keys = list(missing)
+            
+            # Decode everything on the pool up front; each batch is handed to the
+            # encoder as soon as it is decoded, so encoding batch i overlaps
+            # decoding batch i + 1
+            decoded = [
+                self.decode_pool.submit(metrics.in_current_context(self._load_for_encoding), missing[key])
+                for key in missing_keys
+            ]
+            encoded = []
+            try:
+                for start in range(0, len(decoded), self.scheduler.max_batch_size):
+                    images = [future.result() for future in decoded[start:start + self.scheduler.max_batch_size]]
+                    encoded.extend(self.scheduler.submit(image) for image in images)
+            except Exception:
+                # Drop the work still queued for images of this failed request
+                for future in decoded + encoded:
+                    future.cancel()
+                raise
+            
+            # Time spent waiting on the encoder; the forward pass itself is in
+            # the scheduler's batch duration histogram
+            with metrics.stage('model_wait'):
+                encoded = [future.result().cpu() for future in encoded]
+            for key, embedding in zip(missing_keys, encoded):
+                self.cache.put(key, embedding)
+                embeddings[key] = embedding
+
+        return torch.stack([embeddings[key] for key in keys]).to(self.device)
+
+    def embed(self, images: List[Union[bytes, DecodedImage]]) -> np.ndarray:
+        """
+        L2-normalized embeddings for raw images, through the embedding cache
+
+        Returns:
+            np.ndarray - float32 array of shape [len(images), dim]
+        """
+        embeddings = torch.nn.functional.normalize(self._embed(images).float(), dim=-1)
+        return embeddings.cpu().numpy()
+
+    def _similarities(self, target_image: Union[bytes, DecodedImage],
+                      comparison_images: List[Union[bytes, DecodedImage]]) -> torch.Tensor:
+        """Cosine similarity of the target against each comparison image, as a 1-D CPU tensor"""
+        self.logger.info(f"Processing 1 target image and {len(comparison_images)} comparison images")
+        
+        # Encode images (cached embeddings skip decoding and encoding)
+        self.logger.info("Encoding images...")
+        embeddings = self._embed([target_image] + list(comparison_images))
+        target_embedding = embeddings[:1]
+        comparison_embeddings = embeddings[1:]
+        
+        # Calculate similarities using cosine similarity
+        with metrics.stage('postprocess'):
+            return util.cos_sim(target_embedding, comparison_embeddings)[0].float().cpu()
     
-    def compare_images(self, target_image: bytes, comparison_images: List[bytes]) -> List[Dict]:
+    def compare_images(self, target_image: Union[bytes, DecodedImage],
+                       comparison_images: List[Union[bytes, DecodedImage]],
+                       top_k: Optional[int] = None,
+                       min_score: Optional[float] = None) -> List[Dict]:
         """
         Compare target image against comparison images
         
         Args:
-            target_image: bytes - Target image as bytes
-            comparison_images: List[bytes] - List of comparison images as bytes
+            target_image: bytes or DecodedImage - Target image
+            comparison_images: List[bytes or DecodedImage] - Comparison images
+            top_k: Optional[int] - Only return the k best matches (partial selection, no full sort)
+            min_score: Optional[float] - Drop matches scoring below this
             
         Returns:
             List[Dict] - Results sorted by similarity score (highest first)
                 Each dict contains: {'index': int, 'score': float}
         """
         try:
-            self.logger.info(f"Processing 1 target image and {len(comparison_images)} comparison images")
-            
-            # Convert bytes to PIL Images
-            target_img = self._bytes_to_image(target_image)
-            comparison_imgs = [self._bytes_to_image(img_bytes) for img_bytes in comparison_images]
+            similarities = self._similarities(target_image, comparison_images)
+            indices = torch.arange(len(similarities))
             
-            # Encode images
-            self.logger.info("Encoding images...")
-            target_embedding = self._encode_images([target_img])
-            comparison_embeddings = self._encode_images(comparison_imgs)
+            if min_score is not None:
+                keep = similarities >= min_score
+                similarities, indices = similarities[keep], indices[keep]
             
-            # Calculate similarities using cosine similarity
-            similarities = util.cos_sim(target_embedding, comparison_embeddings)[0]
+            # topk only orders the k it selects; without top_k every score is sorted
+            k = len(similarities) if top_k is None else min(top_k, len(similarities))
+            scores, order = torch.topk(similarities, k, sorted=True)
             
             # Create results
             results = [
-                {'index': idx, 'score': float(score)}
-                for idx, score in enumerate(similarities.cpu().numpy())
+                {'index': idx, 'score': score}
+                for idx, score in zip(indices[order].tolist(), scores.tolist())
             ]
             
-            # Sort by score (highest first)
-            results.sort(key=lambda x: x['score'], reverse=True)
-            
-            self.logger.info(f"Comparison complete. Best match: index {results[0]['index']} with score {results[0]['score']:.4f}")
+            if results:
+                self.logger.info(f"Comparison complete. Best match: index {results[0]['index']} with score {results[0]['score']:.4f}")
+            else:
+                self.logger.info("Comparison complete. No match above the minimum score")
             
             return results
             
@@ -90,20 +372,25 @@ class ImageSimilarityComparer:
             self.logger.error(f"Error in compare_images: {e}")
             raise
     
-    def get_best_match(self, target_image: bytes, comparison_images: List[bytes]) -> Dict:
+    def get_best_match(self, target_image: Union[bytes, DecodedImage],
+                       comparison_images: List[Union[bytes, DecodedImage]]) -> Dict:
         """
         Get the single best matching image
         
         Returns:
             Dict with keys: 'best_index', 'best_score'
         """
-        results = self.compare_images(target_image, comparison_images)
+        try:
+            similarities = self._similarities(target_image, comparison_images)
+        except Exception as e:
+            self.logger.error(f"Error in get_best_match: {e}")
+            raise
         
-        if not results:
+        if len(similarities) == 0:
             return {'best_index': None, 'best_score': 0.0}
         
-        best = results[0]
+        best_index = int(torch.argmax(similarities))
         return {
-            'best_index': best['index'],
-            'best_score': best['score']
-        }
\ No newline at end of file
+            'best_index': best_index,
+            'best_score': float(similarities[best_index])
+        }
@@ -0,0 +1,157 @@
+import os
+
+# Directory of the python services package, used to resolve bundled model files
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _env_str(name: str, default: str) -> str:
+    """Read a string setting from the environment"""
+    return os.environ.get(name, default)
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment"""
+    value = os.environ.get(name)
+    if value is None or value.strip() == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Environment variable {name} must be an integer, got {value!r}")
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Read a boolean setting from the environment ('1', 'true', 'yes', 'on')"""
+    value = os.environ.get(name)
+    if value is None or value.strip() == '':
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_list(name: str, default: list) -> list:
+    """Read a comma separated list setting from the environment"""
+    value = os.environ.get(name)
+    if value is None or value.strip() == '':
+        return list(default)
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+# Serving (serve.py)
+SERVER_HOST = _env_str('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = _env_int('SERVER_PORT', 5000)
+# Worker processes forked after the models are loaded
+SERVER_WORKERS = _env_int('SERVER_WORKERS', 1)
+# torch intra-op threads per worker; 0 splits the CPU cores evenly between workers
+TORCH_THREADS_PER_WORKER = _env_int('TORCH_THREADS_PER_WORKER', 0)
+
+# Model loading: 'eager' models load on a background thread at startup while the
+# server already answers requests, 'lazy' models load on their first request.
+# Models: clip, catalog_index, rmbg, cgc_identifier, image_to_text
+MODEL_LOAD_MODE = _env_str('MODEL_LOAD_MODE', 'eager')
+# Per model overrides as name=mode pairs, e.g. 'rmbg=lazy,image_to_text=lazy'
+MODEL_LOAD_MODES = dict(item.split('=', 1) for item in _env_list('MODEL_LOAD_MODES', []) if '=' in item)
+
+# Torch runtime tuning, applied at boot (python/torchRuntime.py)
+# Channels-last memory format for the RMBG convolutions
+TORCH_CHANNELS_LAST = _env_bool('TORCH_CHANNELS_LAST', True)
+# Compile the eager RMBG and CLIP models; slower startup, faster steady state
+TORCH_COMPILE = _env_bool('TORCH_COMPILE', False)
+TORCH_COMPILE_MODE = _env_str('TORCH_COMPILE_MODE', 'default')
+# Run a synthetic forward pass per model in each serving process before it takes traffic
+MODEL_WARMUP = _env_bool('MODEL_WARMUP', True)
+
+# CGC grade detection
+CGC_MODEL_PATH = _env_str(
+    'CGC_MODEL_PATH',
+    os.path.join(BASE_DIR, 'cgc_identifier', 'cgc_identifier_model2', 'weights', 'best.pt')
+)
+OCR_LANGUAGES = _env_list('OCR_LANGUAGES', ['en'])
+OCR_GPU = _env_bool('OCR_GPU', False)
+# Labels whose YOLO box is a tight single text line; OCR skips text detection for them
+OCR_RECOGNIZE_ONLY_LABELS = _env_list('OCR_RECOGNIZE_ONLY_LABELS', ['cgc_grade'])
+# Images whose crops the OCR worker takes at once, and how long to wait for more.
+# Their lines share one batched recognition pass only on the GPU (OCR_GPU); on the
+# CPU EasyOCR recognizes one line at a time
+OCR_BATCH_SIZE = _env_int('OCR_BATCH_SIZE', 8)
+OCR_BATCH_WAIT_MS = _env_int('OCR_BATCH_WAIT_MS', 5)
+# Cache of detections and grading results by image hash, bounded by entries and bytes
+GRADE_CACHE_SIZE = _env_int('GRADE_CACHE_SIZE', 1024)
+GRADE_CACHE_MAX_BYTES = _env_int('GRADE_CACHE_MAX_BYTES', 16 * 1024 * 1024)
+# Seconds a cached result stays valid; 0 keeps it until evicted
+GRADE_CACHE_TTL_SECONDS = _env_int('GRADE_CACHE_TTL_SECONDS', 7 * 24 * 3600)
+# sqlite file for the persistent tier; empty disables it
+GRADE_CACHE_PATH = _env_str('GRADE_CACHE_PATH', '')
+
+# Background removal
+# Upper bound on images stacked into one RMBG forward pass ([N, 3, 1024, 1024] float32 is ~12MB per image)
+RMBG_MAX_BATCH_SIZE = _env_int('RMBG_MAX_BATCH_SIZE', 4)
+# Emit per-image shape and size logs from the background remover
+RMBG_DEBUG_LOGGING = _env_bool('RMBG_DEBUG_LOGGING', False)
+
+# CLIP image similarity
+# Embeddings kept in the in-memory LRU tier
+CLIP_CACHE_SIZE = _env_int('CLIP_CACHE_SIZE', 4096)
+# sqlite file for the persistent embedding tier; empty disables it
+CLIP_CACHE_PATH = _env_str('CLIP_CACHE_PATH', '')
+# Threads decoding comparison images in parallel ahead of the encoder
+CLIP_DECODE_WORKERS = _env_int('CLIP_DECODE_WORKERS', min(4, os.cpu_count() or 1))
+
+# Dynamic request batching: how many items one forward pass may take and how
+# long the scheduler waits for more after the first arrives
+CLIP_BATCH_SIZE = _env_int('CLIP_BATCH_SIZE', 32)
+CLIP_BATCH_WAIT_MS = _env_int('CLIP_BATCH_WAIT_MS', 5)
+RMBG_BATCH_WAIT_MS = _env_int('RMBG_BATCH_WAIT_MS', 10)
+CGC_BATCH_SIZE = _env_int('CGC_BATCH_SIZE', 8)
+CGC_BATCH_WAIT_MS = _env_int('CGC_BATCH_WAIT_MS', 5)
+# Threads decoding the images of one /api/detect-grade-batch request in parallel
+CGC_DECODE_WORKERS = _env_int('CGC_DECODE_WORKERS', min(4, os.cpu_count() or 1))
+# Most images in one /api/detect-grade-batch request
+CGC_MAX_BATCH_IMAGES = _env_int('CGC_MAX_BATCH_IMAGES', 64)
+
+# Model input resolutions, used to decode uploads at the smallest scale each model needs
+CLIP_INPUT_SIZE = _env_int('CLIP_INPUT_SIZE', 224)
+CGC_IMAGE_SIZE = _env_int('CGC_IMAGE_SIZE', 640)
+
+# Staged grading: a low resolution YOLO pass screens for a slab, and only then a
+# second pass runs on the slab region, decoded so its longest side is at least
+# CGC_ROI_DECODE_SIZE (OCR crops are cut from the same decode)
+CGC_STAGED_PIPELINE = _env_bool('CGC_STAGED_PIPELINE', True)
+CGC_SCREEN_SIZE = _env_int('CGC_SCREEN_SIZE', 320)
+CGC_SCREEN_CONFIDENCE = float(_env_str('CGC_SCREEN_CONFIDENCE', '0.25'))
+CGC_ROI_DECODE_SIZE = _env_int('CGC_ROI_DECODE_SIZE', 1280)
+# Fraction of the slab box added on each side of the region of interest
+CGC_ROI_MARGIN = float(_env_str('CGC_ROI_MARGIN', '0.1'))
+
+# Inference backend per model: 'torch' runs the PyTorch model eagerly, 'onnx' runs
+# an ONNX export through ONNX Runtime on the CPU (exported on first load)
+INFERENCE_BACKEND = _env_str('INFERENCE_BACKEND', 'torch')
+RMBG_BACKEND = _env_str('RMBG_BACKEND', INFERENCE_BACKEND)
+CLIP_BACKEND = _env_str('CLIP_BACKEND', INFERENCE_BACKEND)
+# Run the ONNX export with dynamically quantized int8 weights
+RMBG_ONNX_INT8 = _env_bool('RMBG_ONNX_INT8', False)
+CLIP_ONNX_INT8 = _env_bool('CLIP_ONNX_INT8', False)
+# Operator types to quantize; empty quantizes every type ONNX Runtime supports
+ONNX_QUANTIZE_OP_TYPES = _env_list('ONNX_QUANTIZE_OP_TYPES', [])
+# Where exports are kept; delete them after changing a model or the quantization settings
+ONNX_MODEL_DIR = _env_str('ONNX_MODEL_DIR', os.path.join(os.path.dirname(BASE_DIR), 'data', 'onnx'))
+# ONNX Runtime threads per session; 0 intra-op threads follows torch's per-worker thread count
+ONNX_INTRA_OP_THREADS = _env_int('ONNX_INTRA_OP_THREADS', 0)
+ONNX_INTER_OP_THREADS = _env_int('ONNX_INTER_OP_THREADS', 1)
+
+# Catalog vector index behind /api/search
+CATALOG_INDEX_DIR = _env_str('CATALOG_INDEX_DIR', os.path.join(os.path.dirname(BASE_DIR), 'data', 'catalog_index'))
+# Catalogs up to this many images are searched exactly; larger ones use IVF lists
+CATALOG_EXACT_THRESHOLD = _env_int('CATALOG_EXACT_THRESHOLD', 20000)
+# IVF lists to build (0 picks about 4 * sqrt(rows)) and lists scored per query
+CATALOG_IVF_LISTS = _env_int('CATALOG_IVF_LISTS', 0)
+CATALOG_IVF_PROBES = _env_int('CATALOG_IVF_PROBES', 8)
+
+# Asynchronous jobs behind /api/jobs
+JOB_STORE_DIR = _env_str('JOB_STORE_DIR', os.path.join(os.path.dirname(BASE_DIR), 'data', 'jobs'))
+# Jobs run at the same time per worker process, and jobs allowed to wait
+JOB_WORKERS = _env_int('JOB_WORKERS', 2)
+JOB_MAX_QUEUE = _env_int('JOB_MAX_QUEUE', 100)
+# Seconds a finished job and its results are kept
+JOB_TTL_SECONDS = _env_int('JOB_TTL_SECONDS', 3600)
+# How often a server-sent event stream checks a job for progress
+JOB_POLL_INTERVAL_MS = _env_int('JOB_POLL_INTERVAL_MS', 250)
@@ -0,0 +1,253 @@
+import io
+import os
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+from PIL import Image
+import numpy as np
+
+try:
+    import cv2
+except ImportError:  # only the CGC pipeline decodes with OpenCV
+    cv2 = None
+
+logger = logging.getLogger(__name__)
+
+# JPEG DCT scaling reduces by powers of two, at most 8x
+REDUCTION_FACTORS = (8, 4, 2)
+
+
+def reduction_factor(size: Tuple[int, int], long_side: Optional[int] = None,
+                     short_side: Optional[int] = None) -> int:
+    """
+    Largest power of two reduction that keeps an image at or above the requested size
+
+    Args:
+        size: (width, height) of the full image
+        long_side: Minimum length of the longest side after reduction
+        short_side: Minimum length of the shortest side after reduction
+
+    Returns:
+        int: 1, 2, 4 or 8
+    """
+    if not long_side and not short_side:
+        return 1
+    longest, shortest = max(size), min(size)
+    for factor in REDUCTION_FACTORS:
+        # Decoders round the reduced size up
+        if long_side and -(-longest // factor) < long_side:
+            continue
+        if short_side and -(-shortest // factor) < short_side:
+            continue
+        return factor
+    return 1
+
+
+def open_image(image_bytes: bytes, mode: str = 'RGB', long_side: Optional[int] = None,
+               short_side: Optional[int] = None) -> Image.Image:
+    """
+    Decode image bytes with PIL, letting JPEGs decode straight at a reduced scale
+
+    JPEG draft mode makes libjpeg skip DCT coefficients, so a 12MP photo needed
+    at 1024px is decoded at a quarter of the work. Other formats decode at full
+    size. The result is never smaller than the requested sides.
+
+    Args:
+        image_bytes: Encoded image
+        mode: PIL mode of the result
+        long_side: Minimum longest side the consumer needs, or None for full size
+        short_side: Minimum shortest side the consumer needs, or None for full size
+
+    Returns:
+        PIL.Image: Decoded image in the requested mode
+
+    Raises:
+        ValueError: If the bytes are not a readable image
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        factor = reduction_factor(image.size, long_side, short_side)
+        if factor > 1 and image.format == 'JPEG':
+            width, height = image.size
+            image.draft(mode, (-(-width // factor), -(-height // factor)))
+        if image.mode != mode:
+            image = image.convert(mode)
+        image.load()
+        return image
+    except Exception as e:
+        raise ValueError(f"Invalid image data: {e}")
+
+
+def imdecode(image_bytes: bytes, long_side: Optional[int] = None,
+             factor: Optional[int] = None) -> Tuple[Optional[np.ndarray], int]:
+    """
+    Decode image bytes to a BGR array with OpenCV, at a reduced scale when possible
+
+    Args:
+        image_bytes: Encoded image
+        long_side: Minimum longest side the consumer needs, or None for full size
+        factor: Reduction factor to use when it is already known; skips reading the header
+
+    Returns:
+        tuple: (BGR array or None if decoding failed, reduction factor applied)
+    """
+    if factor is None:
+        factor = 1
+        if long_side:
+            try:
+                # Header only; no pixel data is decoded here
+                factor = reduction_factor(Image.open(io.BytesIO(image_bytes)).size, long_side)
+            except Exception:
+                factor = 1
+
+    flags = {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8,
+    }[factor]
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flags)
+    return image, factor
+
+
+class DecodedImage:
+    """
+    One uploaded image, parsed at most once per request.
+
+    The header (format, size, mode) is read on first access without decoding
+    pixels. Pixel decodes are made lazily at the scale each consumer asks for
+    and cached, so several consumers in one request share the same buffers.
+    """
+
+    def __init__(self, data: bytes):
+        """
+        Args:
+            data (bytes): Encoded image as uploaded
+        """
+        self.data = data
+        self._header = None
+        self._header_error = None
+        self._pil = {}
+        self._bgr = {}
+
+    def _open_header(self):
+        if self._header is None and self._header_error is None:
+            try:
+                self._header = Image.open(io.BytesIO(self.data))
+            except Exception as e:
+                self._header_error = e
+        return self._header
+
+    @property
+    def valid(self) -> bool:
+        """True when the bytes have a readable image header"""
+        return self._open_header() is not None
+
+    @property
+    def format(self) -> str:
+        """Lower case format name, or 'unknown'"""
+        header = self._open_header()
+        if header is None or not header.format:
+            return 'unknown'
+        return header.format.lower()
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        header = self._open_header()
+        if header is None:
+            raise ValueError(f"Invalid image data: {self._header_error}")
+        return header.size
+
+    @property
+    def mode(self) -> str:
+        header = self._open_header()
+        if header is None:
+            raise ValueError(f"Invalid image data: {self._header_error}")
+        return header.mode
+
+    def info(self) -> dict:
+        """Width, height, mode, format and byte size, from the header only"""
+        header = self._open_header()
+        if header is None:
+            return {'error': str(self._header_error)}
+        return {
+            'width': header.width,
+            'height': header.height,
+            'mode': header.mode,
+            'format': header.format,
+            'size_bytes': len(self.data)
+        }
+
+    def pil(self, mode: str = 'RGB', long_side: Optional[int] = None,
+            short_side: Optional[int] = None, take: bool = False) -> Image.Image:
+        """
+        Decoded pixels as a PIL image, at the smallest scale covering the requested sides
+
+        The returned image is shared with other consumers of this request and
+        must not be modified, unless take=True, which hands ownership to the
+        caller and drops it from the cache.
+
+        Raises:
+            ValueError: If the bytes are not a readable image
+        """
+        factor = reduction_factor(self.size, long_side, short_side)
+        key = (mode, factor)
+        image = self._pil.pop(key, None) if take else self._pil.get(key)
+        if image is None:
+            image = open_image(self.data, mode, long_side=long_side, short_side=short_side)
+            if not take:
+                self._pil[key] = image
+        return image
+
+    def bgr(self, long_side: Optional[int] = None) -> Tuple[Optional[np.ndarray], int]:
+        """
+        Decoded pixels as an OpenCV BGR array, shared with other consumers of this request
+
+        Returns:
+            tuple: (BGR array or None if decoding failed, reduction factor applied)
+        """
+        factor = reduction_factor(self.size, long_side) if self.valid else 1
+        if factor not in self._bgr:
+            self._bgr[factor] = imdecode(self.data, factor=factor)
+        return self._bgr[factor]
+
+
+def as_decoded(image) -> DecodedImage:
+    """Wrap raw bytes in a DecodedImage; DecodedImage instances pass through"""
+    if isinstance(image, DecodedImage):
+        return image
+    return DecodedImage(image if isinstance(image, bytes) else bytes(image))
+
+
+class DecodePool:
+    """
+    Thread pool decoding uploads in parallel; PIL and OpenCV release the GIL while decoding.
+
+    Pool threads do not survive fork, so each worker process builds its own
+    pool on first use.
+    """
+
+    def __init__(self, max_workers: int, name: str):
+        """
+        Args:
+            max_workers (int): Decoding threads
+            name (str): Prefix of the thread names
+        """
+        self.max_workers = max(1, max_workers)
+        self.name = name
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def submit(self, function: Callable, *args, **kwargs) -> Future:
+        return self.pool.submit(function, *args, **kwargs)
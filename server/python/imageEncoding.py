@@ -0,0 +1,124 @@
+import io
+from typing import Callable, Optional
+from PIL import Image
+
+# Output codecs for background removed images
+PNG = 'png'
+WEBP = 'webp'
+MASK = 'mask'
+CODECS = (PNG, WEBP, MASK)
+
+
+class OutputEncoding:
+    """
+    How a background removed image is encoded for the response
+
+    Codecs:
+        png  - RGBA PNG with a chosen zlib compress_level (0 fastest .. 9 smallest)
+        webp - RGBA WebP, lossless or lossy with alpha at a chosen quality
+        mask - only the 8-bit alpha mask, as a grayscale PNG
+    """
+
+    def __init__(self,
+                 codec: str = PNG,
+                 compress_level: int = 6,
+                 quality: int = 90,
+                 lossless: bool = False,
+                 max_dimension: Optional[int] = None):
+        """
+        Args:
+            codec (str): 'png', 'webp' or 'mask'
+            compress_level (int): PNG zlib level, 0-9. Defaults to 6 (the PIL default).
+            quality (int): WebP quality, 0-100. For lossless WebP this is the compression effort.
+            lossless (bool): Lossless WebP. Ignored for PNG and mask output.
+            max_dimension (int, optional): Downscale so the longest side is at most this many pixels
+
+        Raises:
+            ValueError: If an option is out of range
+        """
+        codec = (codec or PNG).lower()
+        if codec not in CODECS:
+            raise ValueError(f"output_codec must be one of {', '.join(CODECS)}")
+        if not 0 <= int(compress_level) <= 9:
+            raise ValueError("compress_level must be between 0 and 9")
+        if not 0 <= int(quality) <= 100:
+            raise ValueError("quality must be between 0 and 100")
+        if max_dimension is not None and int(max_dimension) < 1:
+            raise ValueError("max_dimension must be a positive integer")
+
+        self.codec = codec
+        self.compress_level = int(compress_level)
+        self.quality = int(quality)
+        self.lossless = bool(lossless)
+        self.max_dimension = int(max_dimension) if max_dimension is not None else None
+
+    @classmethod
+    def from_params(cls, get: Callable) -> 'OutputEncoding':
+        """
+        Build from request options
+
+        Args:
+            get (callable): Option getter taking (name, default), e.g. RequestPayload.get
+        """
+        def as_int(name, default):
+            value = get(name, default)
+            if value is None or value == '':
+                return default
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{name} must be an integer")
+
+        lossless = get('lossless', False)
+        if isinstance(lossless, str):
+            lossless = lossless.lower() == 'true'
+
+        return cls(
+            codec=get('output_codec', PNG),
+            compress_level=as_int('compress_level', 6),
+            quality=as_int('quality', 90),
+            lossless=lossless,
+            max_dimension=as_int('max_dimension', None)
+        )
+
+    @property
+    def mimetype(self) -> str:
+        return 'image/webp' if self.codec == WEBP else 'image/png'
+
+    @property
+    def extension(self) -> str:
+        return 'webp' if self.codec == WEBP else 'png'
+
+    def target_size(self, size):
+        """Size an image of the given size is encoded at, after max_dimension"""
+        width, height = size
+        if self.max_dimension is None or max(width, height) <= self.max_dimension:
+            return size
+        scale = self.max_dimension / max(width, height)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def encode(self, image: Image.Image) -> bytes:
+        """
+        Encode an RGBA image
+
+        Args:
+            image (PIL.Image): RGBA image, already at its target size
+
+        Returns:
+            bytes: Encoded image
+        """
+        buffer = io.BytesIO()
+        if self.codec == MASK:
+            image.getchannel('A').save(buffer, format='PNG', compress_level=self.compress_level)
+        elif self.codec == WEBP:
+            if self.lossless:
+                image.save(buffer, format='WEBP', lossless=True, quality=self.quality)
+            else:
+                image.save(buffer, format='WEBP', quality=self.quality, alpha_quality=self.quality)
+        else:
+            image.save(buffer, format='PNG', compress_level=self.compress_level)
+        return buffer.getvalue()
+
+
+# Encoding used when a caller does not ask for one
+DEFAULT_ENCODING = OutputEncoding()
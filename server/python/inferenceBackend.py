@@ -0,0 +1,194 @@
+import os
+import re
+import threading
+import logging
+from typing import List, Optional
+import numpy as np
+import torch
+from . import config
+from . import torchRuntime
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('torch', 'onnx')
+ONNX_OPSET = 17
+
+
+class TorchBackend:
+    """PyTorch forward pass of a module taking one batched tensor"""
+
+    def __init__(self, module: torch.nn.Module, device, name: str = 'model', channels_last: bool = False):
+        """
+        Args:
+            module (torch.nn.Module): Model to run
+            device: Device the model runs on
+            name (str): Model name for logs
+            channels_last (bool): Run convolutions channels-last (see torchRuntime.prepare_module)
+        """
+        self.module = torchRuntime.prepare_module(module, name, channels_last)
+        self.device = device
+        self.channels_last = channels_last and config.TORCH_CHANNELS_LAST
+        self.name = 'torch-compiled' if config.TORCH_COMPILE else 'torch'
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        # inference_mode also skips the version counter and view tracking no_grad keeps
+        with torch.inference_mode():
+            if self.channels_last:
+                batch = batch.to(self.device, memory_format=torch.channels_last)
+            else:
+                batch = batch.to(self.device)
+            return self.module(batch).cpu()
+
+
+class OnnxBackend:
+    """
+    ONNX Runtime CPU session running an exported module.
+
+    A session owns native thread pools that do not survive fork, so each
+    server worker process opens its own on first use.
+    """
+
+    def __init__(self, path: str, intra_op_threads: int = 0, inter_op_threads: int = 1):
+        """
+        Args:
+            path (str): Exported .onnx file
+            intra_op_threads (int): Threads per operator; 0 uses torch's thread count,
+                                    which serve.py sets from the worker layout
+            inter_op_threads (int): Operators run in parallel
+        """
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            raise RuntimeError("The onnx inference backend needs the onnxruntime package")
+
+        self.path = path
+        self.intra_op_threads = max(0, intra_op_threads)
+        self.inter_op_threads = max(1, inter_op_threads)
+        self.name = 'onnx-int8' if path.endswith('.int8.onnx') else 'onnx'
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+        self._input_name = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session_pid != os.getpid():
+            with self._session_lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    import onnxruntime
+
+                    options = onnxruntime.SessionOptions()
+                    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+                    options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+                    # ONNX Runtime's default of one thread per core oversubscribes the CPU
+                    # when several worker processes share it
+                    options.intra_op_num_threads = self.intra_op_threads or torch.get_num_threads()
+                    options.inter_op_num_threads = self.inter_op_threads
+                    session = onnxruntime.InferenceSession(
+                        self.path, options, providers=['CPUExecutionProvider']
+                    )
+                    self._input_name = session.get_inputs()[0].name
+                    self._session = session
+                    self._session_pid = os.getpid()
+        return self._session
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        session = self.session
+        inputs = batch.detach().cpu().numpy().astype(np.float32, copy=False)
+        return torch.from_numpy(session.run(None, {self._input_name: inputs})[0])
+
+
+def onnx_model_path(name: str, int8: bool = False) -> str:
+    """Where the export of a model is kept"""
+    safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '--', name)
+    return os.path.join(config.ONNX_MODEL_DIR, f"{safe_name}{'.int8' if int8 else ''}.onnx")
+
+
+def export_onnx(module: torch.nn.Module, example: torch.Tensor, path: str) -> None:
+    """
+    Export a module with one input and one output, both batched along dim 0
+
+    Args:
+        module (torch.nn.Module): Module to export, in eval mode
+        example (torch.Tensor): Example input of shape [1, ...] to trace with
+        path (str): Destination .onnx file
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written under a per-process name and moved into place, so processes
+    # exporting at the same time never read a partial file
+    temporary = f"{path}.{os.getpid()}.tmp"
+    options = dict(
+        input_names=['input'],
+        output_names=['output'],
+        dynamic_axes={'input': {0: 'batch'}, 'output': {0: 'batch'}},
+        opset_version=ONNX_OPSET,
+        do_constant_folding=True
+    )
+    with torch.no_grad():
+        try:
+            torch.onnx.export(module, (example,), temporary, dynamo=False, **options)
+        except TypeError:
+            # torch releases without the dynamo exporter take no dynamo argument
+            torch.onnx.export(module, (example,), temporary, **options)
+    os.replace(temporary, path)
+
+
+def quantize_int8(source: str, destination: str, op_types: Optional[List[str]] = None) -> None:
+    """
+    Write a copy of an ONNX model with dynamically quantized int8 weights
+
+    Weights are quantized ahead of time; activations are quantized per batch
+    at run time, so no calibration data is needed.
+
+    Args:
+        source (str): fp32 .onnx file
+        destination (str): Quantized .onnx file
+        op_types (list, optional): Operator types to quantize. Defaults to all supported types.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    temporary = f"{destination}.{os.getpid()}.tmp"
+    quantize_dynamic(source, temporary, weight_type=QuantType.QInt8, op_types_to_quantize=op_types or None)
+    os.replace(temporary, destination)
+
+
+def load_backend(name: str, module: torch.nn.Module, example: torch.Tensor, backend: str,
+                 device=None, int8: bool = False, channels_last: bool = False):
+    """
+    Inference backend for a model's batched forward pass
+
+    The ONNX backend exports the module (and quantizes the export) the first
+    time it is used and reuses the files from ONNX_MODEL_DIR afterwards.
+
+    Args:
+        name (str): Name of the exported files, e.g. 'rmbg-briaai/RMBG-1.4'
+        module (torch.nn.Module): Takes one [N, ...] float tensor and returns one tensor
+        example (torch.Tensor): Example input of shape [1, ...], for the export
+        backend (str): 'torch' or 'onnx'
+        device: Device the torch backend runs on
+        int8 (bool): Use the int8 quantized export (onnx only)
+        channels_last (bool): Run convolutions channels-last (torch only)
+
+    Returns:
+        TorchBackend or OnnxBackend: Callable from a batch tensor to an output tensor on the CPU
+    """
+    if backend == 'torch':
+        return TorchBackend(module, device, name, channels_last)
+    if backend != 'onnx':
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+    path = onnx_model_path(name, int8)
+    if not os.path.exists(path):
+        fp32_path = onnx_model_path(name)
+        if not os.path.exists(fp32_path):
+            logger.info(f"Exporting {name} to {fp32_path}")
+            parameter = next(module.parameters(), None)
+            export_onnx(module, example.to(parameter.device if parameter is not None else 'cpu'), fp32_path)
+        if int8:
+            logger.info(f"Quantizing {name} to int8 at {path}")
+            quantize_int8(fp32_path, path, config.ONNX_QUANTIZE_OP_TYPES)
+
+    onnx_backend = OnnxBackend(path, config.ONNX_INTRA_OP_THREADS, config.ONNX_INTER_OP_THREADS)
+    # Open the session now so a broken export fails at load rather than on a request
+    onnx_backend.session
+    return onnx_backend
@@ -0,0 +1,332 @@
+import os
+import re
+import json
+import time
+import uuid
+import queue
+import shutil
+import itertools
+import threading
+import logging
+from typing import Callable, Dict, Iterator, List, Optional
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Job states; the last two are terminal
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+TERMINAL_STATES = (COMPLETED, FAILED)
+
+_JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class JobStore:
+    """
+    Disk-backed store of job state and results, with TTL eviction.
+
+    Each job is a directory holding job.json (status, progress and per-item
+    result records) and one blob file per binary result. Every write replaces
+    job.json atomically, so any server worker process can read a job's
+    progress, whichever process is running it. Finished jobs are deleted
+    ttl_seconds after they finish.
+    """
+
+    def __init__(self, directory: str, ttl_seconds: int = 3600):
+        """
+        Args:
+            directory (str): Where job directories live; created if missing
+            ttl_seconds (int): How long a finished job is kept
+        """
+        self.directory = directory
+        self.ttl_seconds = max(0, ttl_seconds)
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _job_dir(self, job_id: str) -> str:
+        if not _JOB_ID.match(job_id or ''):
+            raise KeyError(job_id)
+        return os.path.join(self.directory, job_id)
+
+    def create(self, kind: str, total: int, priority: int = 0) -> Dict:
+        """Create a queued job and return its record"""
+        job_id = uuid.uuid4().hex
+        os.makedirs(self._job_dir(job_id))
+        job = {
+            'id': job_id,
+            'kind': kind,
+            'status': QUEUED,
+            'priority': priority,
+            'total': total,
+            'completed': 0,
+            'results': [],
+            'error': None,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'expires_at': None,
+            # The process whose in-memory queue holds the job
+            'worker_pid': os.getpid()
+        }
+        self.save(job)
+        return job
+
+    def save(self, job: Dict) -> None:
+        """Atomically replace a job's record"""
+        path = os.path.join(self._job_dir(job['id']), 'job.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(job, f)
+        os.replace(path + '.tmp', path)
+
+    def load(self, job_id: str) -> Optional[Dict]:
+        """A job's record, or None if it does not exist or has expired"""
+        try:
+            with open(os.path.join(self._job_dir(job_id), 'job.json')) as f:
+                job = json.load(f)
+        except (KeyError, FileNotFoundError):
+            return None
+        if job['expires_at'] is not None and job['expires_at'] < time.time():
+            return None
+        return job
+
+    def write_blob(self, job_id: str, index: int, data: bytes) -> None:
+        path = os.path.join(self._job_dir(job_id), f'{index}.bin')
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    def read_blob(self, job_id: str, index: int) -> Optional[bytes]:
+        try:
+            with open(os.path.join(self._job_dir(job_id), f'{int(index)}.bin'), 'rb') as f:
+                return f.read()
+        except (KeyError, FileNotFoundError):
+            return None
+
+    def finish(self, job: Dict, status: str, error: Optional[str] = None) -> None:
+        """Mark a job terminal and start its TTL"""
+        job['status'] = status
+        job['error'] = error
+        job['finished_at'] = time.time()
+        job['expires_at'] = job['finished_at'] + self.ttl_seconds
+        self.save(job)
+
+    def recover(self) -> int:
+        """
+        Fail jobs left queued or running by a previous server process
+
+        Only safe before any worker process has started taking jobs.
+        """
+        recovered = 0
+        for job_id in os.listdir(self.directory):
+            job = self.load(job_id)
+            if job is not None and job['status'] not in TERMINAL_STATES:
+                self.finish(job, FAILED, 'Server restarted before the job finished')
+                recovered += 1
+        return recovered
+
+    def fail_orphaned(self, pid: int) -> int:
+        """
+        Fail the unfinished jobs of a worker process that has exited
+
+        A job only lives in the in-memory queue of the process it was submitted
+        to, so once that process is gone nothing will ever run or finish it.
+        """
+        failed = 0
+        for job_id in os.listdir(self.directory):
+            job = self.load(job_id)
+            if job is not None and job['status'] not in TERMINAL_STATES and job.get('worker_pid') == pid:
+                self.finish(job, FAILED, 'Server worker exited before the job finished')
+                failed += 1
+        return failed
+
+    def purge_expired(self, force: bool = False) -> int:
+        """Delete expired jobs; without force, runs at most once a minute"""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_purge < 60:
+                return 0
+            self._last_purge = now
+
+        purged = 0
+        for job_id in os.listdir(self.directory):
+            try:
+                with open(os.path.join(self.directory, job_id, 'job.json')) as f:
+                    expires_at = json.load(f).get('expires_at')
+            except (OSError, ValueError):
+                continue
+            if expires_at is not None and expires_at < now:
+                shutil.rmtree(os.path.join(self.directory, job_id), ignore_errors=True)
+                purged += 1
+        if purged:
+            logger.info(f"Purged {purged} expired jobs")
+        return purged
+
+
+class JobContext:
+    """Handed to a running job's handler to report results as they are produced"""
+
+    def __init__(self, store: JobStore, job: Dict):
+        self.store = store
+        self.job = job
+        self.id = job['id']
+
+    def add_result(self, record: Dict, blob: Optional[bytes] = None) -> None:
+        """
+        Record one finished item and save progress
+
+        Args:
+            record (dict): JSON-safe result record; should carry its 'index'
+            blob (bytes, optional): Binary result, served from the job's results URL
+        """
+        if blob is not None:
+            self.store.write_blob(self.id, record['index'], blob)
+            record['has_blob'] = True
+        self.job['results'].append(record)
+        self.job['completed'] += 1
+        self.store.save(self.job)
+
+
+class JobManager:
+    """
+    Runs submitted jobs on a bounded pool of worker threads, highest priority first.
+
+    Jobs of equal priority run in submission order. Job handlers use the model
+    batch schedulers like any request thread, so concurrently running jobs
+    still share forward passes.
+    """
+
+    def __init__(self, store: JobStore, workers: int = 2, max_queue: int = 100):
+        """
+        Args:
+            store (JobStore): Where job state and results are kept
+            workers (int): Jobs run at the same time
+            max_queue (int): Jobs waiting to run before submit raises QueueFullError
+        """
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._pid = None
+
+        recovered = store.recover()
+        if recovered:
+            logger.warning(f"Marked {recovered} interrupted jobs as failed")
+        store.purge_expired(force=True)
+
+    def _ensure_workers(self) -> None:
+        # Threads do not survive fork, so a forked child starts its own pool
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.PriorityQueue()
+            self._threads = [
+                threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, kind: str, total: int, handler: Callable[[JobContext], None], priority: int = 0) -> Dict:
+        """
+        Queue a job and return its record without waiting for it to run
+
+        Args:
+            kind (str): Job type, reported back to clients
+            total (int): Number of result records the job will produce
+            handler (callable): Takes a JobContext and reports each result through it
+            priority (int): Higher runs first
+
+        Raises:
+            QueueFullError: If max_queue jobs are already waiting
+        """
+        self._ensure_workers()
+        self.store.purge_expired()
+        # Checked and queued under one lock so concurrent submits cannot overshoot max_queue
+        with self._lock:
+            if self._queue.qsize() >= self.max_queue:
+                raise QueueFullError(f"Job queue is full ({self.max_queue} jobs waiting)")
+            job = self.store.create(kind, total, priority)
+            # The worker updates its own copy; the caller gets the record as queued
+            queued = dict(job)
+            self._queue.put((-priority, next(self._sequence), job, handler))
+        logger.info(f"Queued {kind} job {job['id']} with {total} items at priority {priority}")
+        return queued
+
+    def queue_depth(self) -> int:
+        """Jobs waiting for a worker in this process"""
+        return self._queue.qsize()
+
+    def _run(self) -> None:
+        while True:
+            _, _, job, handler = self._queue.get()
+            metrics.start_trace(f"job:{job['kind']}")
+            job['status'] = RUNNING
+            job['started_at'] = time.time()
+            self.store.save(job)
+            try:
+                handler(JobContext(self.store, job))
+            except Exception as e:
+                logger.error(f"Job {job['id']} failed: {e}")
+                self.store.finish(job, FAILED, 'Internal server error occurred')
+                continue
+            finally:
+                metrics.end_trace()
+            self.store.finish(job, COMPLETED)
+            logger.info(f"Job {job['id']} completed in {job['finished_at'] - job['started_at']:.2f}s")
+
+
+def job_events(store: JobStore, job_id: str, poll_interval: float = 0.25,
+               heartbeat_seconds: float = 15.0) -> Iterator[str]:
+    """
+    Server-sent events for one job, read from the store so any worker process can serve them
+
+    Events:
+        progress - {'status', 'completed', 'total'} whenever either changes
+        result   - one per finished item record
+        done     - the final job record without its results, then the stream ends
+    """
+    def event(name, data):
+        return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+    sent_results = 0
+    last_progress = None
+    last_sent = time.monotonic()
+    while True:
+        job = store.load(job_id)
+        if job is None:
+            yield event('error', {'error': 'Job not found or expired'})
+            return
+
+        for record in job['results'][sent_results:]:
+            yield event('result', record)
+        sent_results = len(job['results'])
+
+        progress = {'status': job['status'], 'completed': job['completed'], 'total': job['total']}
+        if progress != last_progress:
+            yield event('progress', progress)
+            last_progress = progress
+            last_sent = time.monotonic()
+
+        if job['status'] in TERMINAL_STATES:
+            yield event('done', {key: value for key, value in job.items() if key != 'results'})
+            return
+
+        # Comment lines keep idle proxies from closing the connection
+        if time.monotonic() - last_sent >= heartbeat_seconds:
+            yield ': keep-alive\n\n'
+            last_sent = time.monotonic()
+        time.sleep(poll_interval)
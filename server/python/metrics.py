@@ -0,0 +1,222 @@
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Histogram upper bounds: seconds for latencies, items for batch sizes
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _label_string(names: Sequence[str], values: Sequence, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [(name, str(value)) for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Histogram:
+    """Cumulative histogram per label combination, in the Prometheus text format"""
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, List] = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{_label_string(self.label_names, labels, ("le", repr(float(bound))))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_label_string(self.label_names, labels, ("le", "+Inf"))} {count}')
+            lines.append(f'{self.name}_sum{_label_string(self.label_names, labels)} {total}')
+            lines.append(f'{self.name}_count{_label_string(self.label_names, labels)} {count}')
+        return lines
+
+
+class Gauge:
+    """Gauge whose values are read from callbacks when the metrics are scraped"""
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._functions: Dict[Tuple, Callable[[], float]] = {}
+
+    def set_function(self, function: Callable[[], float], *label_values) -> None:
+        self._functions[label_values] = function
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        for labels, function in sorted(self._functions.items()):
+            lines.append(f'{self.name}{_label_string(self.label_names, labels)} {function()}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The metrics of this process.
+
+    Each server worker process keeps its own, so with several workers a scrape
+    of /metrics reports whichever worker answered.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name: str, help: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, label_names, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, label_names: Sequence[str] = ()) -> Gauge:
+        metric = Gauge(name, help, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+REQUEST_SECONDS = registry.histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint', ('endpoint', 'method', 'status'))
+STAGE_SECONDS = registry.histogram(
+    'pipeline_stage_duration_seconds', 'Time spent in each pipeline stage by endpoint', ('endpoint', 'stage'))
+BATCH_SECONDS = registry.histogram(
+    'model_batch_duration_seconds', 'Duration of one batched model call', ('model',))
+BATCH_SIZE = registry.histogram(
+    'model_batch_size', 'Items per batched model call', ('model',), buckets=BATCH_SIZE_BUCKETS)
+QUEUE_DEPTH = registry.gauge(
+    'model_queue_depth', 'Items waiting for a model batch', ('model',))
+JOB_QUEUE_DEPTH = registry.gauge(
+    'job_queue_depth', 'Asynchronous jobs waiting for a worker')
+
+
+class Trace:
+    """Stage timings of one request, or of one background job"""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        # Set when the client asked for timings in the response
+        self.include_timings = False
+        self._stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        # Stages running on pool threads in parallel add up
+        with self._lock:
+            self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+
+    def timings(self) -> Dict[str, float]:
+        """Milliseconds per stage so far, plus the total"""
+        with self._lock:
+            timings = {f'{stage}_ms': round(seconds * 1000, 3) for stage, seconds in self._stages.items()}
+        timings['total_ms'] = round((time.perf_counter() - self.started) * 1000, 3)
+        return timings
+
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('trace', default=None)
+
+
+def start_trace(endpoint: str) -> Trace:
+    """Start timing a request; stages recorded in this context are attributed to it"""
+    trace = Trace(endpoint)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def end_trace() -> None:
+    _current_trace.set(None)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Record a stage duration against the current request, if any"""
+    trace = _current_trace.get()
+    STAGE_SECONDS.observe(seconds, trace.endpoint if trace is not None else 'none', stage)
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as one pipeline stage of the current request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def in_current_context(function: Callable) -> Callable:
+    """
+    Wrap a function to run in a copy of the caller's context
+
+    Work handed to a thread pool otherwise loses the request it belongs to.
+    Call once per task; a context cannot be entered by two threads at once.
+    """
+    return functools.partial(contextvars.copy_context().run, function)
+
+
+def iterate_in_current_context(iterable: Iterable, on_close: Optional[Callable[[], None]] = None) -> Iterator:
+    """
+    Wrap an iterable to be consumed in a copy of the caller's context
+
+    A streamed response body is generated after its request's handler and
+    after_request hooks have returned; this keeps its stages attributed to the
+    request. on_close runs in the same context once the iterable is exhausted
+    or closed.
+    """
+    context = contextvars.copy_context()
+    iterator = iter(iterable)
+
+    def generate():
+        try:
+            while True:
+                try:
+                    item = context.run(next, iterator)
+                except StopIteration:
+                    return
+                yield item
+        finally:
+            if hasattr(iterator, 'close'):
+                context.run(iterator.close)
+            if on_close is not None:
+                context.run(on_close)
+    return generate()
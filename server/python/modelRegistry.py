@@ -0,0 +1,170 @@
+import time
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional
+from . import config
+from . import torchRuntime
+
+logger = logging.getLogger(__name__)
+
+# Load modes: eager models load on the background loader at startup, lazy ones on first use
+EAGER = 'eager'
+LAZY = 'lazy'
+LOAD_MODES = (EAGER, LAZY)
+
+# Load states reported by status()
+UNLOADED = 'unloaded'  # lazy model that has not been used yet
+QUEUED = 'queued'      # eager model waiting for the background loader
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class ModelRegistry:
+    """
+    Process wide registry that loads each model at most once and shares
+    the instance across request threads.
+
+    Eager models are loaded one after another on a background thread, so the
+    server takes traffic (and answers health checks) while they load; lazy
+    models load on their first use. Each model's load state is tracked for
+    the readiness endpoint.
+    """
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._models: Dict[str, Any] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._status: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._loader_thread = None
+
+    def register(self, name: str, loader: Callable[[], Any], load_mode: Optional[str] = None) -> None:
+        """
+        Register a loader for a model
+
+        Args:
+            name (str): Registry key for the model
+            loader (callable): Zero argument callable that builds the model
+            load_mode (str, optional): 'eager' or 'lazy'. Defaults to the model's entry
+                                       in MODEL_LOAD_MODES, else MODEL_LOAD_MODE.
+        """
+        load_mode = load_mode or config.MODEL_LOAD_MODES.get(name, config.MODEL_LOAD_MODE)
+        if load_mode not in LOAD_MODES:
+            raise ValueError(f"Unknown load mode {load_mode!r} for model '{name}', expected eager or lazy")
+        with self._lock:
+            if name in self._loaders:
+                return
+            self._loaders[name] = loader
+            self._load_locks[name] = threading.Lock()
+            self._status[name] = {
+                'state': QUEUED if load_mode == EAGER else UNLOADED,
+                'load_mode': load_mode,
+                'load_seconds': None,
+                'error': None
+            }
+
+    def _set_state(self, name: str, state: str, **fields) -> None:
+        with self._lock:
+            self._status[name].update(state=state, **fields)
+
+    def get(self, name: str) -> Any:
+        """
+        Get a model, loading it on first use
+
+        Args:
+            name (str): Registry key for the model
+
+        Returns:
+            The shared model instance
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        if name not in self._loaders:
+            raise KeyError(f"No model registered under '{name}'")
+
+        # Only one thread loads a given model; the others wait for it
+        with self._load_locks[name]:
+            model = self._models.get(name)
+            if model is None:
+                logger.info(f"Loading model '{name}'...")
+                self._set_state(name, LOADING, error=None)
+                started = time.perf_counter()
+                try:
+                    model = self._loaders[name]()
+                    # Warmed before it is published, so no request reaches it mid warm-up
+                    torchRuntime.warm_up([name])
+                except Exception as e:
+                    self._set_state(name, FAILED, error=str(e))
+                    logger.error(f"Failed to load model '{name}': {e}")
+                    raise
+                self._models[name] = model
+                load_seconds = time.perf_counter() - started
+                self._set_state(name, READY, load_seconds=round(load_seconds, 3))
+                logger.info(f"Model '{name}' loaded in {load_seconds:.1f}s")
+        return model
+
+    def is_loaded(self, name: str) -> bool:
+        """Check whether a model has already been loaded"""
+        return name in self._models
+
+    def state(self, name: str) -> str:
+        """Load state of a model: unloaded, queued, loading, ready or failed"""
+        with self._lock:
+            return self._status[name]['state']
+
+    def status(self) -> Dict[str, Dict]:
+        """Load mode, state, load time and last error of every model"""
+        with self._lock:
+            return {name: dict(status) for name, status in self._status.items()}
+
+    def ready(self) -> bool:
+        """Whether every eager model has loaded"""
+        with self._lock:
+            return all(
+                status['state'] == READY for status in self._status.values() if status['load_mode'] == EAGER
+            )
+
+    def start_background_loading(self) -> None:
+        """
+        Load the eager models one after another on a background thread
+
+        The thread does not survive fork; a pre-fork parent must call
+        wait_until_loaded before forking its workers.
+        """
+        with self._lock:
+            if self._loader_thread is not None:
+                return
+            names = [name for name, status in self._status.items() if status['load_mode'] == EAGER]
+            self._loader_thread = threading.Thread(
+                target=self._load_all, args=(names,), name='model-loader', daemon=True
+            )
+            self._loader_thread.start()
+
+    def _load_all(self, names: List[str]) -> None:
+        started = time.perf_counter()
+        for name in names:
+            try:
+                self.get(name)
+            except Exception:
+                # Recorded in the model's status; its next use retries the load
+                continue
+        logger.info(f"Background loading of {len(names)} models finished in {time.perf_counter() - started:.1f}s")
+
+    def wait_until_loaded(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the background loader has finished
+
+        Returns:
+            bool: Whether every eager model is ready
+        """
+        thread = self._loader_thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.ready()
+
+
+# Shared registry used by the server process
+model_registry = ModelRegistry()
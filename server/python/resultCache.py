@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteStore:
+    """
+    sqlite file behind a cache's persistent tier, shared by every server worker process.
+
+    sqlite connections must not cross fork, so each process opens its own
+    connection on first use. Callers serialize access with their own lock.
+    """
+
+    def __init__(self, path: str, schema: str):
+        """
+        Args:
+            path: sqlite file
+            schema: CREATE TABLE IF NOT EXISTS statement for the cache's table
+        """
+        self.path = path
+        self._conn = None
+        self._conn_pid = None
+        db = self.db
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute(schema)
+        db.commit()
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn_pid = os.getpid()
+        return self._conn
+
+
+class ResultCache:
+    """
+    Content-addressed cache of JSON-serializable results, such as detections
+    and grading output, keyed by a hash of the input image bytes.
+
+    The in-memory tier is an LRU bounded by entry count and by the serialized
+    size of its values. Entries expire ttl_seconds after they are stored. When
+    a path is given, entries are also kept in a sqlite file shared by every
+    server worker process and surviving restarts.
+
+    get_or_compute deduplicates concurrent misses: while one thread computes
+    a key, other threads asking for the same key wait for its result.
+    """
+
+    def __init__(self, name: str, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024,
+                 ttl_seconds: int = 0, disk_path: Optional[str] = None):
+        """
+        Args:
+            name: Cache name, used in keys and stats
+            max_entries: Maximum entries kept in memory
+            max_bytes: Maximum serialized bytes kept in memory
+            ttl_seconds: Lifetime of an entry; 0 keeps entries until evicted
+            disk_path: Optional sqlite file for the persistent tier
+        """
+        self.name = name
+        self.max_entries = max(0, max_entries)
+        self.max_bytes = max(0, max_bytes)
+        self.ttl_seconds = max(0, ttl_seconds)
+        self._memory = OrderedDict()  # key -> (value, size, expires_at)
+        self._memory_bytes = 0
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.dedup_waits = 0
+        self.evictions = 0
+
+        self.disk_path = disk_path or None
+        self._disk = None
+        if self.disk_path:
+            self._disk = SqliteStore(
+                self.disk_path,
+                'CREATE TABLE IF NOT EXISTS results ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)'
+            )
+            db = self._disk.db
+            db.execute('DELETE FROM results WHERE expires_at IS NOT NULL AND expires_at < ?', (time.time(),))
+            db.commit()
+
+    def key_for(self, data: bytes, namespace: str = '') -> str:
+        """Content hash of the raw bytes, tagged with the cache name and a namespace"""
+        return f"{self.name}:{namespace}:{hashlib.blake2b(data, digest_size=20).hexdigest()}"
+
+    def get(self, key: str) -> Optional[Any]:
+        """Look up a live entry, checking memory first and then disk"""
+        with self._lock:
+            return self._lookup(key)
+
+    def _lookup(self, key: str) -> Optional[Any]:
+        # Called with self._lock held
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            if entry[2] is None or entry[2] > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self._forget(key)
+
+        if self.disk_path is not None:
+            row = self._disk.db.execute(
+                'SELECT value, expires_at FROM results WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+                (key, now)
+            ).fetchone()
+            if row is not None:
+                value = json.loads(row[0])
+                self._remember(key, value, len(row[0]), row[1])
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, value: Any) -> None:
+        """Store a result in every tier"""
+        serialized = json.dumps(value)
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._remember(key, value, len(serialized), expires_at)
+            if self.disk_path is not None:
+                self._disk.db.execute(
+                    'INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)',
+                    (key, serialized, expires_at)
+                )
+                self._disk.db.commit()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Cached result for key, computing and storing it on a miss
+
+        Only one caller computes a given key at a time; concurrent callers wait
+        for that result. A failed compute is not cached and fails every waiter.
+        """
+        # Looked up under the same lock that registers the pending compute, so a
+        # miss cannot slip in between another caller's put and its unregistering
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                return value
+            pending = self._pending.get(key)
+            if pending is None:
+                future = self._pending[key] = Future()
+            else:
+                self.dedup_waits += 1
+        if pending is not None:
+            return pending.result()
+
+        try:
+            value = compute()
+            self.put(key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _forget(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[1]
+
+    def _remember(self, key: str, value: Any, size: int, expires_at: Optional[float]) -> None:
+        if self.max_entries == 0 or size > self.max_bytes:
+            return
+        self._forget(key)
+        self._memory[key] = (value, size, expires_at)
+        self._memory_bytes += size
+        while len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        """Hit, miss and dedup counters for the cache"""
+        with self._lock:
+            return {
+                'name': self.name,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'dedup_waits': self.dedup_waits,
+                'evictions': self.evictions,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'in_flight': len(self._pending),
+                'persistent': self.disk_path is not None
+            }
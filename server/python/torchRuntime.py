@@ -0,0 +1,130 @@
+import os
+import time
+import threading
+import logging
+from typing import Callable, Dict, Iterable, Optional, Set
+import torch
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Warm-up passes of the loaded models, by name, and those already run in this process
+_warm_ups: Dict[str, Callable[[], None]] = {}
+_warmed: Set[str] = set()
+_warmed_pid = None
+_lock = threading.Lock()
+
+# Set in a pre-fork parent, which keeps torch single threaded and leaves warm-up to its workers
+_prefork_pid = None
+
+
+def threads_per_worker(workers: int, requested: int = 0) -> int:
+    """torch intra-op threads for each worker; 0 splits the CPU cores evenly"""
+    if requested and requested > 0:
+        return requested
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def prepare_prefork() -> None:
+    """
+    Mark this process as a pre-fork parent, before the models are loaded
+
+    An OpenMP thread pool started before fork is not usable in the children,
+    so the parent loads the models single threaded. Threads and warm-up are
+    applied in each worker by configure and warm_up after the fork.
+    """
+    global _prefork_pid
+    torch.set_num_threads(1)
+    _prefork_pid = os.getpid()
+
+
+def configure(threads: int = 0) -> None:
+    """
+    Apply process-wide torch settings; server.py calls this before loading the models
+
+    Args:
+        threads (int): torch intra-op threads. Defaults to the share of the CPU
+                       cores of one of SERVER_WORKERS workers.
+    """
+    # Denormal floats are far slower on x86 and make no difference to the outputs
+    torch.set_flush_denormal(True)
+    if torch.cuda.is_available():
+        # Input shapes are fixed per model, so cuDNN can pick the fastest kernels once
+        torch.backends.cudnn.benchmark = True
+
+    if _prefork_pid == os.getpid():
+        return
+    threads = threads or threads_per_worker(config.SERVER_WORKERS, config.TORCH_THREADS_PER_WORKER)
+    torch.set_num_threads(threads)
+    logger.info(f"torch using {threads} intra-op threads in process {os.getpid()}")
+
+
+def prepare_module(module: torch.nn.Module, name: str, channels_last: bool = False) -> torch.nn.Module:
+    """
+    Put an eager model in its inference configuration
+
+    Args:
+        module (torch.nn.Module): Model to prepare
+        name (str): Model name for logs
+        channels_last (bool): Store convolution weights channels-last, which oneDNN
+                              runs faster on CPU; ignored when TORCH_CHANNELS_LAST is off
+
+    Returns:
+        torch.nn.Module: The module, compiled with torch.compile when TORCH_COMPILE is on
+    """
+    module.eval()
+    if channels_last and config.TORCH_CHANNELS_LAST:
+        module.to(memory_format=torch.channels_last)
+    if config.TORCH_COMPILE:
+        try:
+            # Compilation happens lazily on the first call, i.e. in the warm-up pass
+            module = torch.compile(module, mode=config.TORCH_COMPILE_MODE)
+            logger.info(f"Compiling {name} with torch.compile (mode {config.TORCH_COMPILE_MODE})")
+        except Exception as e:
+            logger.warning(f"torch.compile unavailable for {name}, running eagerly: {e}")
+    return module
+
+
+def register_warm_up(name: str, warm_up_fn: Callable[[], None]) -> None:
+    """
+    Register a synthetic forward pass for a loaded model
+
+    Args:
+        name (str): Model name
+        warm_up_fn (callable): Runs the model once the way a request would
+    """
+    with _lock:
+        _warm_ups[name] = warm_up_fn
+
+
+def warm_up(names: Optional[Iterable[str]] = None) -> None:
+    """
+    Run the registered warm-up passes not yet run in this process
+
+    Lazy kernel selection, allocator growth, thread pool start-up and
+    torch.compile all happen on a model's first call, and none of it survives
+    fork, so each serving process warms up its own models. Skipped in a
+    pre-fork parent and when MODEL_WARMUP is off.
+
+    Args:
+        names (iterable, optional): Models to warm up. Defaults to all registered models.
+    """
+    global _warmed_pid
+    if not config.MODEL_WARMUP or _prefork_pid == os.getpid():
+        return
+    with _lock:
+        if _warmed_pid != os.getpid():
+            _warmed.clear()
+            _warmed_pid = os.getpid()
+        wanted = set(names) if names is not None else set(_warm_ups)
+        pending = [(name, fn) for name, fn in _warm_ups.items() if name in wanted and name not in _warmed]
+        _warmed.update(name for name, _ in pending)
+
+    for name, warm_up_fn in pending:
+        started = time.perf_counter()
+        try:
+            warm_up_fn()
+        except Exception as e:
+            logger.warning(f"Warm-up of {name} failed: {e}")
+            continue
+        logger.info(f"Warmed up {name} in {(time.perf_counter() - started) * 1000:.0f} ms")
@@ -0,0 +1,268 @@
+import base64
+import json
+import time
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+from flask import Response, stream_with_context
+from . import metrics
+
+try:
+    import msgpack
+except ImportError:  # msgpack support is optional
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# Wire formats understood by the image endpoints
+JSON = 'json'
+MULTIPART = 'multipart'
+OCTET_STREAM = 'octet-stream'
+MSGPACK = 'msgpack'
+
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def process_image_data(image_data):
+    """Convert various input formats to bytes"""
+    if isinstance(image_data, list):
+        # Convert list of integers to bytes
+        return bytes(image_data)
+    elif isinstance(image_data, str):
+        # Handle base64 encoded images
+        try:
+            return base64.b64decode(image_data)
+        except Exception:
+            raise ValueError("Invalid base64 image data")
+    elif isinstance(image_data, (bytes, bytearray, memoryview)):
+        return bytes(image_data)
+    else:
+        raise ValueError(f"Unsupported image data type: {type(image_data)}")
+
+
+def _is_msgpack(mimetype: Optional[str]) -> bool:
+    return bool(mimetype) and mimetype in MSGPACK_MIMETYPES
+
+
+class RequestPayload:
+    """
+    Fields and images of one request, independent of the wire format it arrived in.
+
+    Supported request bodies:
+        application/json          - images as lists of ints or base64 strings (legacy)
+        multipart/form-data       - images as file parts, options as form fields
+        application/octet-stream  - the raw bytes of a single image, options in the query string
+        application/msgpack       - a map whose image values are msgpack bin (or any JSON form)
+    """
+
+    def __init__(self, format: str, fields: Optional[Dict] = None,
+                 files: Optional[Dict[str, List[bytes]]] = None,
+                 body: Optional[bytes] = None, args: Optional[Dict] = None,
+                 field_lists: Optional[Dict[str, List]] = None):
+        self.format = format
+        self.fields = fields or {}
+        self.field_lists = field_lists or {}
+        self.files = files or {}
+        self.body = body
+        self.args = args or {}
+        self.parse_ms = 0.0
+
+    @property
+    def empty(self) -> bool:
+        """True when the request carried no fields, files or raw body"""
+        return not self.fields and not self.files and not self.body
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """Get an option from the body fields, falling back to the query string"""
+        if name in self.fields:
+            return self.fields[name]
+        return self.args.get(name, default)
+
+    def get_bool(self, name: str, default: bool = False) -> bool:
+        """Get a boolean option; form and query values arrive as strings"""
+        value = self.get(name, default)
+        if isinstance(value, str):
+            return value.lower() == 'true'
+        return bool(value)
+
+    def get_list(self, name: str) -> Optional[List]:
+        """Get a list option: a JSON/msgpack list, or a repeated form field"""
+        if name in self.field_lists:
+            return list(self.field_lists[name])
+        value = self.fields.get(name)
+        if value is None:
+            return None
+        return value if isinstance(value, list) else [value]
+
+    def image(self, name: str) -> Optional[bytes]:
+        """
+        Get a single image by field name
+
+        For octet-stream requests the whole body is the image, whatever the name.
+        """
+        if self.format == OCTET_STREAM:
+            return self.body or None
+        if self.files.get(name):
+            return self.files[name][0]
+        value = self.fields.get(name)
+        if not value:
+            return None
+        return process_image_data(value)
+
+    def images(self, name: str) -> Optional[List[bytes]]:
+        """Get a list of images by field name, or None if the field is missing or not a list"""
+        if self.files.get(name):
+            return list(self.files[name])
+        value = self.fields.get(name)
+        if not isinstance(value, list):
+            return None
+        return [process_image_data(item) for item in value]
+
+
+def parse_request(request) -> RequestPayload:
+    """
+    Parse a Flask request into a RequestPayload, recording how long parsing took
+
+    Raises:
+        ValueError: If the body cannot be decoded in its declared format
+    """
+    started = time.perf_counter()
+    mimetype = request.mimetype or ''
+    args = request.args.to_dict()
+
+    if mimetype == 'multipart/form-data':
+        files = {}
+        for name in request.files:
+            contents = [f.read() for f in request.files.getlist(name) if f.filename != '']
+            if contents:
+                files[name] = contents
+        payload = RequestPayload(MULTIPART, fields=request.form.to_dict(), files=files, args=args,
+                                 field_lists=request.form.to_dict(flat=False))
+
+    elif mimetype == 'application/octet-stream' or mimetype.startswith('image/'):
+        payload = RequestPayload(OCTET_STREAM, body=request.get_data(), args=args)
+
+    elif _is_msgpack(mimetype):
+        if msgpack is None:
+            raise ValueError("msgpack request bodies require the msgpack package")
+        try:
+            fields = msgpack.unpackb(request.get_data(), raw=False)
+        except Exception as e:
+            raise ValueError(f"Invalid msgpack body: {e}")
+        if fields is not None and not isinstance(fields, dict):
+            raise ValueError("msgpack body must be a map")
+        payload = RequestPayload(MSGPACK, fields=fields, args=args)
+
+    else:
+        fields = request.get_json(silent=True)
+        if fields is not None and not isinstance(fields, dict):
+            raise ValueError("JSON body must be an object")
+        payload = RequestPayload(JSON, fields=fields, args=args)
+
+    payload.parse_ms = (time.perf_counter() - started) * 1000
+    metrics.record_stage('parse', payload.parse_ms / 1000)
+    trace = metrics.current_trace()
+    if trace is not None and payload.get_bool('timings', False):
+        trace.include_timings = True
+    logger.debug(f"Parsed {payload.format} request in {payload.parse_ms:.2f}ms")
+    return payload
+
+
+def wants_msgpack(request) -> bool:
+    """True when the client prefers a msgpack response over JSON"""
+    if msgpack is None:
+        return False
+    best = request.accept_mimetypes.best_match(('application/json',) + MSGPACK_MIMETYPES)
+    return _is_msgpack(best) and request.accept_mimetypes[best] > request.accept_mimetypes['application/json']
+
+
+def _jsonable(value: Any) -> Any:
+    """Replace bytes with lists of ints, the legacy JSON encoding for images"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return list(bytes(value))
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    return value
+
+
+def _server_timing(payload: Optional[RequestPayload], serialize_ms: float) -> str:
+    entries = []
+    if payload is not None:
+        entries.append(f'parse;desc="{payload.format}";dur={payload.parse_ms:.3f}')
+    trace = metrics.current_trace()
+    if trace is not None:
+        for name, ms in trace.timings().items():
+            stage = name[:-len('_ms')]
+            if stage not in ('parse', 'serialize'):
+                entries.append(f'{stage};dur={ms:.3f}')
+    entries.append(f'serialize;dur={serialize_ms:.3f}')
+    return ', '.join(entries)
+
+
+def make_response(request, data: Any, status: int = 200, payload: Optional[RequestPayload] = None) -> Response:
+    """
+    Serialize a response as msgpack or JSON, following the request's Accept header
+
+    Bytes values are sent as msgpack bin, or as lists of ints in JSON. Stage
+    times are reported in the Server-Timing header, and in a 'timings' field
+    when the request asked for timings=true.
+    """
+    trace = metrics.current_trace()
+    if trace is not None and trace.include_timings and isinstance(data, dict) and 'timings' not in data:
+        data = dict(data, timings=trace.timings())
+    started = time.perf_counter()
+    if wants_msgpack(request):
+        body = msgpack.packb(data, use_bin_type=True)
+        mimetype = 'application/msgpack'
+    else:
+        body = json.dumps(_jsonable(data))
+        mimetype = 'application/json'
+    serialize_ms = (time.perf_counter() - started) * 1000
+    metrics.record_stage('serialize', serialize_ms / 1000)
+
+    response = Response(body, status=status, mimetype=mimetype)
+    response.headers['Server-Timing'] = _server_timing(payload, serialize_ms)
+    logger.debug(f"Serialized {mimetype} response in {serialize_ms:.2f}ms")
+    return response
+
+
+def make_binary_response(data: bytes, mimetype: str, headers: Optional[Dict] = None,
+                         payload: Optional[RequestPayload] = None) -> Response:
+    """Return raw bytes as the response body, with metadata carried in headers"""
+    response = Response(data, mimetype=mimetype)
+    for key, value in (headers or {}).items():
+        response.headers[key] = str(value)
+    response.headers['Server-Timing'] = _server_timing(payload, 0.0)
+    return response
+
+
+def wants_stream(request, payload: RequestPayload) -> bool:
+    """True when the client asked for a streamed NDJSON response"""
+    if payload.get_bool('stream', False):
+        return True
+    best = request.accept_mimetypes.best_match(('application/json', NDJSON_MIMETYPE))
+    return best == NDJSON_MIMETYPE and request.accept_mimetypes[best] > request.accept_mimetypes['application/json']
+
+
+def make_stream_response(records: Iterable[Dict], payload: Optional[RequestPayload] = None) -> Response:
+    """
+    Stream records as newline delimited JSON, one line per record as it is produced
+
+    If the producer fails part way, a final {'done': True, 'error': ...} line is sent
+    since the status code has already gone out.
+    """
+    def generate():
+        try:
+            for record in records:
+                yield json.dumps(_jsonable(record)) + '\n'
+        except Exception as e:
+            logger.error(f"Streamed response failed: {e}")
+            yield json.dumps({'done': True, 'success': False, 'error': 'Internal server error occurred'}) + '\n'
+
+    response = Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+    response.headers['Server-Timing'] = _server_timing(payload, 0.0)
+    # Stop reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
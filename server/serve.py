@@ -0,0 +1,220 @@
+"""
+Production entry point: a pre-fork multi-process server.
+
+The Flask app, and with it every model, is imported once in the parent
+process. Worker processes are forked afterwards and share the model weights
+copy-on-write, so N workers cost roughly one copy of the weights plus their
+own activations instead of N copies. Each worker serves the same listening
+socket with a threaded WSGI server, and the parent restarts workers that die.
+
+The socket is bound before the models load. Until the workers start, the parent
+itself answers: /healthz with 200, everything else (including /readyz, with
+each model's load state) with 503. Lazy models (MODEL_LOAD_MODES) are not
+loaded before the fork; each worker loads its own copy on first use.
+
+Per-worker torch threads default to the CPU cores split evenly between the
+workers, so workers do not oversubscribe the machine.
+
+Usage:
+    python serve.py [--workers 4] [--threads-per-worker 2] [--host 0.0.0.0] [--port 5000]
+
+Settings also come from SERVER_WORKERS, TORCH_THREADS_PER_WORKER, SERVER_HOST
+and SERVER_PORT. To run under gunicorn instead:
+    gunicorn -c gunicorn.conf.py server:app
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+
+from python import config
+from python import torchRuntime
+from python.jobQueue import JobStore
+from python.modelRegistry import model_registry, FAILED
+from python.torchRuntime import threads_per_worker
+
+logger = logging.getLogger('serve')
+
+# A worker that dies sooner than this after starting is not restarted in a tight loop
+RESTART_BACKOFF_SECONDS = 1.0
+
+
+def init_worker(threads: int) -> None:
+    """Per-process setup run in each worker right after fork, before it takes requests"""
+    torchRuntime.configure(threads)
+    torchRuntime.warm_up()
+    logger.info(f"Worker {os.getpid()} started with {threads} torch threads")
+
+
+def fail_orphaned_jobs(pid: int) -> None:
+    """Fail the jobs an exited worker had queued or running; its in-memory queue went with it"""
+    failed = JobStore(config.JOB_STORE_DIR, ttl_seconds=config.JOB_TTL_SECONDS).fail_orphaned(pid)
+    if failed:
+        logger.warning(f"Marked {failed} jobs of worker {pid} as failed")
+
+
+def starting_app(environ, start_response):
+    """WSGI app the parent answers with while it loads the models, before any worker exists"""
+    path = environ.get('PATH_INFO', '')
+    if path == '/healthz':
+        status, body = '200 OK', {'status': 'ok'}
+    elif path == '/readyz':
+        status, body = '503 Service Unavailable', {'ready': False, 'models': model_registry.status()}
+    else:
+        status, body = '503 Service Unavailable', {'error': 'Server is starting'}
+    data = json.dumps(body).encode()
+    start_response(status, [
+        ('Content-Type', 'application/json'),
+        ('Content-Length', str(len(data))),
+        ('Retry-After', '5')
+    ])
+    return [data]
+
+
+def preload_app():
+    """
+    Import the Flask app and wait for its eager models, in the parent before any fork
+
+    The parent keeps torch single threaded while loading: an OpenMP thread pool
+    started before fork is not usable in the children. Model warm-up also runs
+    in the children, in init_worker.
+    """
+    torchRuntime.prepare_prefork()
+    started = time.perf_counter()
+    from server import app
+    # The background loader thread does not survive fork
+    if not model_registry.wait_until_loaded():
+        failed = [name for name, status in model_registry.status().items() if status['state'] == FAILED]
+        logger.warning(f"Models failed to load and will be retried on first use: {', '.join(failed)}")
+    logger.info(f"Models loaded in {time.perf_counter() - started:.1f}s")
+    return app
+
+
+class PreforkServer:
+    """
+    Parent process that binds the socket, forks the workers and supervises them
+    """
+
+    def __init__(self, app, host: str, port: int, workers: int, threads: int):
+        """
+        Args:
+            app: WSGI application; starting_app until preload swaps in the real one
+            host (str): Interface to bind
+            port (int): Port to bind
+            workers (int): Number of worker processes
+            threads (int): torch intra-op threads per worker
+        """
+        from werkzeug.serving import make_server
+
+        self.workers = max(1, workers)
+        self.threads = threads
+        # Bound once in the parent; every worker accepts from the inherited socket
+        self.server = make_server(host, port, app, threaded=True)
+        self._children = {}
+        self._stopping = False
+
+    def preload(self, load_app) -> None:
+        """
+        Answer requests with the current app while load_app runs, then switch to the app it returns
+
+        The parent stops accepting before the workers are forked; from then on
+        only the workers serve the socket.
+        """
+        # socketserver's loop rather than werkzeug's, which closes the socket when it returns
+        thread = threading.Thread(
+            target=socketserver.BaseServer.serve_forever, args=(self.server,), name='starting-server', daemon=True
+        )
+        thread.start()
+        try:
+            app = load_app()
+        finally:
+            self.server.shutdown()
+            thread.join()
+        self.server.app = app
+
+    def _spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            status = 0
+            try:
+                init_worker(self.threads)
+                self.server.serve_forever()
+            except BaseException as e:
+                logger.error(f"Worker {os.getpid()} failed: {e}")
+                status = 1
+            finally:
+                os._exit(status)
+        self._children[pid] = time.monotonic()
+
+    def _stop(self, signum, frame) -> None:
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> None:
+        """Fork the workers and restart any that exit until SIGTERM or SIGINT"""
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        # Objects allocated while loading never need collecting; freezing them keeps the
+        # collector from writing to their pages and breaking copy-on-write sharing
+        gc.freeze()
+
+        host, port = self.server.server_address[:2]
+        logger.info(f"Serving on http://{host}:{port} with {self.workers} workers, "
+                    f"{self.threads} torch threads each")
+        for _ in range(self.workers):
+            self._spawn()
+
+        while self._children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            started = self._children.pop(pid, None)
+            if started is None:
+                continue
+            fail_orphaned_jobs(pid)
+            if self._stopping:
+                continue
+            logger.warning(f"Worker {pid} exited with status {status}; restarting")
+            if time.monotonic() - started < RESTART_BACKOFF_SECONDS:
+                time.sleep(RESTART_BACKOFF_SECONDS)
+            self._spawn()
+
+        self.server.server_close()
+        logger.info("All workers stopped")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=config.SERVER_HOST)
+    parser.add_argument('--port', type=int, default=config.SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=config.SERVER_WORKERS)
+    parser.add_argument('--threads-per-worker', type=int, default=config.TORCH_THREADS_PER_WORKER,
+                        help='torch intra-op threads per worker (0 splits the CPU cores evenly)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    threads = threads_per_worker(args.workers, args.threads_per_worker)
+    server = PreforkServer(starting_app, args.host, args.port, args.workers, threads)
+    server.preload(preload_app)
+    server.run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
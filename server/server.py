@@ -1,9 +1,24 @@
-from flask import Flask, request, jsonify
+import time
+# Taken before the model libraries are imported, which is much of the startup time
+startup_started = time.perf_counter()
+
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
+import functools
 from python.compareImages import ImageSimilarityComparer
 from python.backgroundRemover import BackgroundRemover  # Import the new class
-from python.cgc_identifier.cgc_controller import GrabcgcGrading
+from python.cgc_identifier.cgc_controller import GrabcgcGrading, GRADE_CONFIDENCE
+from python.modelRegistry import model_registry, QUEUED, LOADING
+from python.imageEncoding import OutputEncoding
+from python.imageDecoding import DecodedImage
+from python.catalogIndex import CatalogIndex
+from python.jobQueue import JobStore, JobManager, QueueFullError, job_events
+from python import metrics
+from python import config
+from python import torchRuntime
+from python.wireFormat import JSON, parse_request, make_response, make_binary_response, make_stream_response, wants_stream
 import logging
 import base64
+import io
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -11,63 +26,195 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-# Initialize services once at startup
-print("Initializing services...")
-
-print("Loading Image Similarity Comparer...")
-comparer = ImageSimilarityComparer(model_name='clip-ViT-B-32')
-
-print("Loading Background Remover...")
-bg_remover = BackgroundRemover(model_name='briaai/RMBG-1.4')
-
-print("Server ready!")
-
-def process_image_data(image_data):
-    """Convert various input formats to bytes"""
-    if isinstance(image_data, list):
-        # Convert list of integers to bytes
-        return bytes(image_data)
-    elif isinstance(image_data, str):
-        # Handle base64 encoded images
-        try:
-            return base64.b64decode(image_data)
-        except:
-            raise ValueError("Invalid base64 image data")
-    elif isinstance(image_data, bytes):
-        return image_data
+# Initialize services once at startup. Models are registered here and loaded by
+# the registry: eager ones on a background thread, lazy ones on first use
+torchRuntime.configure()
+
+model_registry.register('clip', lambda: ImageSimilarityComparer(model_name='clip-ViT-B-32'))
+model_registry.register('catalog_index', lambda: CatalogIndex(model_registry.get('clip'), config.CATALOG_INDEX_DIR))
+model_registry.register('rmbg', lambda: BackgroundRemover(model_name='briaai/RMBG-1.4'))
+# The CGC identifier and OCR reader are registered by cgc_controller
+grade_detector = GrabcgcGrading()
+
+def comparer():
+    """The CLIP ImageSimilarityComparer, loading it if it is lazy"""
+    return model_registry.get('clip')
+
+def catalog_index():
+    """The CatalogIndex, loading it (and CLIP) if it is lazy"""
+    return model_registry.get('catalog_index')
+
+def bg_remover():
+    """The RMBG BackgroundRemover, loading it if it is lazy"""
+    return model_registry.get('rmbg')
+
+job_manager = JobManager(
+    JobStore(config.JOB_STORE_DIR, ttl_seconds=config.JOB_TTL_SECONDS),
+    workers=config.JOB_WORKERS,
+    max_queue=config.JOB_MAX_QUEUE
+)
+metrics.JOB_QUEUE_DEPTH.set_function(job_manager.queue_depth)
+
+model_registry.start_background_loading()
+logger.info(f"Server started in {time.perf_counter() - startup_started:.2f}s; eager models are loading in the background")
+
+# Endpoints whose first request has been answered in this process
+first_requests_seen = set()
+
+def requires_models(*names):
+    """Answer 503 instead of blocking while a model the endpoint needs loads in the background"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            for name in names:
+                state = model_registry.state(name)
+                if state in (QUEUED, LOADING):
+                    response = jsonify({'error': 'Model is still loading', 'model': name, 'state': state})
+                    response.headers['Retry-After'] = '5'
+                    return response, 503
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@app.before_request
+def start_request_trace():
+    # Stages recorded while handling the request are attributed to its route
+    trace = metrics.start_trace(request.url_rule.rule if request.url_rule else 'unmatched')
+    if request.args.get('timings', '').lower() == 'true':
+        trace.include_timings = True
+
+@app.after_request
+def record_request_latency(response):
+    trace = metrics.current_trace()
+    if trace is None:
+        return response
+    method, status = request.method, str(response.status_code)
+
+    def finish():
+        elapsed = time.perf_counter() - trace.started
+        metrics.REQUEST_SECONDS.observe(elapsed, trace.endpoint, method, status)
+        if trace.endpoint not in first_requests_seen:
+            first_requests_seen.add(trace.endpoint)
+            logger.info(f"First request to {trace.endpoint} took {elapsed * 1000:.0f} ms "
+                        f"({time.perf_counter() - startup_started:.1f}s after startup)")
+
+    if response.is_streamed and not response.direct_passthrough:
+        # Streamed bodies (NDJSON, server-sent events) are generated after this hook;
+        # keep the trace for their stages and time the request until the stream ends
+        response.response = metrics.iterate_in_current_context(response.response, on_close=finish)
     else:
-        raise ValueError(f"Unsupported image data type: {type(image_data)}")
+        finish()
+    metrics.end_trace()
+    return response
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and answering, whether or not the models have loaded"""
+    return jsonify({'status': 'ok', 'uptime_seconds': round(time.perf_counter() - startup_started, 1)})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: 200 once every eager model has loaded, 503 before, with each model's load state"""
+    ready = model_registry.ready()
+    return jsonify({'ready': ready, 'models': model_registry.status()}), 200 if ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Latency histograms, batch sizes and queue depths in the Prometheus text format"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+def missing_body_error(payload):
+    """Error response for a request without a usable body"""
+    if payload.format == JSON:
+        return jsonify({'error': 'No JSON data provided'}), 400
+    return jsonify({'error': 'No data provided'}), 400
+
+def parse_top_k(payload, default=10):
+    """Read and validate the top_k option; a default of None means no limit"""
+    value = payload.get('top_k', default)
+    if value is None or value == '':
+        return default
+    try:
+        top_k = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("top_k must be an integer")
+    if top_k < 1:
+        raise ValueError("top_k must be at least 1")
+    return top_k
+
+def parse_n_lists(data):
+    """Read and validate the IVF list count option; None keeps the index default"""
+    value = data.get('n_lists')
+    if value is None or value == '':
+        return None
+    try:
+        n_lists = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("n_lists must be an integer")
+    if n_lists < 1:
+        raise ValueError("n_lists must be at least 1")
+    return n_lists
+
+def parse_priority(payload):
+    """Read and validate the job priority option; higher runs first"""
+    value = payload.get('priority', 0)
+    if value is None or value == '':
+        return 0
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError("priority must be an integer")
+
+def parse_min_score(payload):
+    """Read and validate the optional min_score option"""
+    value = payload.get('min_score')
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError("min_score must be a number")
 
 @app.route('/api/compare', methods=['POST'])
+@requires_models('clip')
 def compare_images():
-    """Compare target image against multiple comparison images"""
+    """
+    Compare target image against multiple comparison images
+    
+    Optional top_k limits the response to the k best matches and min_score
+    drops weaker ones; by default every comparison is returned, best first.
+    """
     try:
-        data = request.json
+        payload = parse_request(request)
         
         # Validate input
-        if not data:
-            return jsonify({'error': 'No JSON data provided'}), 400
+        if payload.empty:
+            return missing_body_error(payload)
         
-        target_image = data.get('target_image')
-        comparison_images = data.get('comparison_images')
+        target_bytes = payload.image('target_image')
+        comparison_bytes = payload.images('comparison_images')
         
-        if not target_image:
+        if not target_bytes:
             return jsonify({'error': 'target_image is required'}), 400
-        if not comparison_images or not isinstance(comparison_images, list):
+        if not comparison_bytes:
             return jsonify({'error': 'comparison_images must be a non-empty list'}), 400
         
-        # Process images
-        target_bytes = process_image_data(target_image)
-        comparison_bytes = [process_image_data(img) for img in comparison_images]
+        top_k = parse_top_k(payload, default=None)
+        min_score = parse_min_score(payload)
         
         # Compare images
-        results = comparer.compare_images(target_bytes, comparison_bytes)
-        
-        return jsonify({
+        results = comparer().compare_images(
+            DecodedImage(target_bytes),
+            [DecodedImage(image) for image in comparison_bytes],
+            top_k=top_k,
+            min_score=min_score
+        )
+        
+        return make_response(request, {
             'success': True,
             'results': results,
-            'total_comparisons': len(comparison_images)
-        })
+            'total_comparisons': len(comparison_bytes)
+        }, payload=payload)
         
     except ValueError as e:
         logger.error(f"Validation error: {e}")
@@ -77,35 +224,35 @@ def compare_images():
         return jsonify({'error': 'Internal server error occurred'}), 500
 
 @app.route('/api/best-match', methods=['POST'])
+@requires_models('clip')
 def best_match():
     """Get the single best matching image"""
     try:
-        data = request.json
+        payload = parse_request(request)
         
         # Validate input
-        if not data:
-            return jsonify({'error': 'No JSON data provided'}), 400
+        if payload.empty:
+            return missing_body_error(payload)
         
-        target_image = data.get('target_image')
-        comparison_images = data.get('comparison_images')
+        target_bytes = payload.image('target_image')
+        comparison_bytes = payload.images('comparison_images')
         
-        if not target_image:
+        if not target_bytes:
             return jsonify({'error': 'target_image is required'}), 400
-        if not comparison_images or not isinstance(comparison_images, list):
+        if not comparison_bytes:
             return jsonify({'error': 'comparison_images must be a non-empty list'}), 400
         
-        # Process images
-        target_bytes = process_image_data(target_image)
-        comparison_bytes = [process_image_data(img) for img in comparison_images]
-        
         # Get best match
-        result = comparer.get_best_match(target_bytes, comparison_bytes)
+        result = comparer().get_best_match(
+            DecodedImage(target_bytes),
+            [DecodedImage(image) for image in comparison_bytes]
+        )
         
-        return jsonify({
+        return make_response(request, {
             'success': True,
             'best_match': result,
-            'total_comparisons': len(comparison_images)
-        })
+            'total_comparisons': len(comparison_bytes)
+        }, payload=payload)
         
     except ValueError as e:
         logger.error(f"Validation error: {e}")
@@ -114,56 +261,138 @@ def best_match():
         logger.error(f"Server error in best_match: {e}")
         return jsonify({'error': 'Internal server error occurred'}), 500
 
+
+@app.route('/api/search', methods=['POST'])
+@requires_models('catalog_index')
+def search_catalog():
+    """Find the catalog images most similar to a target image"""
+    try:
+        payload = parse_request(request)
+        
+        # Validate input
+        if payload.empty:
+            return missing_body_error(payload)
+        
+        target_bytes = payload.image('target_image') or payload.image('image')
+        if not target_bytes:
+            return jsonify({'error': 'target_image is required'}), 400
+        
+        top_k = parse_top_k(payload)
+        exact = payload.get('exact')
+        if exact is not None:
+            exact = payload.get_bool('exact')
+        
+        result = catalog_index().search(DecodedImage(target_bytes), top_k=top_k, exact=exact)
+        
+        return make_response(request, {
+            'success': True,
+            'results': result['matches'],
+            'method': result['method'],
+            'candidates_scored': result['candidates'],
+            'catalog_size': catalog_index().count
+        }, payload=payload)
+        
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        return jsonify({'error': f'Invalid input: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Server error in search_catalog: {e}")
+        return jsonify({'error': 'Internal server error occurred'}), 500
+
+@app.route('/api/catalog/ingest', methods=['POST'])
+@requires_models('catalog_index')
+def ingest_catalog():
+    """Add catalog images with their ids to the search index"""
+    try:
+        payload = parse_request(request)
+        
+        # Validate input
+        if payload.empty:
+            return missing_body_error(payload)
+        
+        images = payload.images('images')
+        ids = payload.get_list('ids')
+        
+        if not images:
+            return jsonify({'error': 'images must be a non-empty list'}), 400
+        if not ids or len(ids) != len(images):
+            return jsonify({'error': 'ids must be a list with one id per image'}), 400
+        
+        result = catalog_index().add([(catalog_id, DecodedImage(image)) for catalog_id, image in zip(ids, images)])
+        
+        return make_response(request, dict(success=True, **result), payload=payload)
+        
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        return jsonify({'error': f'Invalid input: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Server error in ingest_catalog: {e}")
+        return jsonify({'error': 'Internal server error occurred'}), 500
+
+@app.route('/api/catalog/build', methods=['POST'])
+@requires_models('catalog_index')
+def build_catalog_index():
+    """Rebuild the approximate (IVF) search lists over the whole catalog"""
+    try:
+        data = request.get_json(silent=True) or {}
+        result = catalog_index().build_ivf(n_lists=parse_n_lists(data))
+        return jsonify(dict(success=True, **result))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid input: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Server error in build_catalog_index: {e}")
+        return jsonify({'error': 'Internal server error occurred'}), 500
+
+@app.route('/api/catalog/stats', methods=['GET'])
+@requires_models('catalog_index')
+def catalog_stats():
+    """Report the size and layout of the catalog index"""
+    return jsonify({
+        'success': True,
+        'catalog': catalog_index().stats()
+    })
+
 @app.route('/api/remove-background', methods=['POST'])
+@requires_models('rmbg')
 def remove_background():
-    """Remove background from a single image (supports both JSON and form data)"""
+    """Remove background from a single image (supports JSON, form data, msgpack and raw bytes)"""
     try:
-        # Handle form data (multipart/form-data)
-        if request.content_type and 'multipart/form-data' in request.content_type:
-            if 'image' not in request.files:
-                return jsonify({'error': 'No image file provided'}), 400
-            
-            file = request.files['image']
-            if file.filename == '':
-                return jsonify({'error': 'No file selected'}), 400
-            
-            # Read binary data
-            image_bytes = file.read()
-            return_format = request.form.get('format', 'base64')
-            include_info = request.form.get('include_info', 'false').lower() == 'true'
-            
-        # Handle JSON data
-        else:
-            data = request.json
-            
-            # Validate input
-            if not data:
-                return jsonify({'error': 'No JSON data provided'}), 400
-            
-            image_data = data.get('image')
-            return_format = data.get('format', 'base64')
-            include_info = data.get('include_info', False)
-            
-            if not image_data:
-                return jsonify({'error': 'image is required'}), 400
-            
-            # Process image
-            image_bytes = process_image_data(image_data)
+        payload = parse_request(request)
+        
+        # Validate input
+        if payload.empty:
+            return missing_body_error(payload)
+        
+        image_bytes = payload.image('image')
+        return_format = payload.get('format', 'base64')
+        include_info = payload.get_bool('include_info', False)
+        
+        if not image_bytes:
+            return jsonify({'error': 'image is required'}), 400
         
-        if return_format not in ['base64', 'bytes', 'file']:
-            return jsonify({'error': 'format must be "base64", "bytes", or "file"'}), 400
+        if return_format not in ['base64', 'bytes', 'file', 'binary']:
+            return jsonify({'error': 'format must be "base64", "bytes", "file", or "binary"'}), 400
+        
+        # Output codec: output_codec, compress_level, quality, lossless, max_dimension
+        encoding = OutputEncoding.from_params(payload.get)
+        
+        # Header and pixels are parsed at most once for info, format and removal
+        image = DecodedImage(image_bytes)
         
         # Get image info if requested
         image_info = None
         if include_info:
-            image_info = bg_remover.get_image_info(image_bytes)
+            image_info = BackgroundRemover.get_image_info(image)
+        original_format = BackgroundRemover.detect_image_format(image)
         
         # Remove background
-        result = bg_remover.remove_background(image_bytes, return_format='bytes')
+        result = bg_remover().remove_background(image, return_format='bytes', encoding=encoding)
         
         response_data = {
             'success': True,
-            'original_format': bg_remover.detect_image_format(image_bytes)
+            'original_format': original_format,
+            'output_codec': encoding.codec,
+            'mimetype': encoding.mimetype
         }
         
         if include_info:
@@ -174,20 +403,30 @@ def remove_background():
             result_b64 = base64.b64encode(result).decode('utf-8')
             response_data['format'] = 'base64'
             response_data['image'] = result_b64
-            return jsonify(response_data)
+            return make_response(request, response_data, payload=payload)
             
         elif return_format == 'bytes':
+            # Sent as msgpack bin, or as a list of ints for JSON clients
             response_data['format'] = 'bytes'
-            response_data['image'] = list(result)  # Convert bytes to list for JSON
-            return jsonify(response_data)
+            response_data['image'] = result
+            return make_response(request, response_data, payload=payload)
+            
+        elif return_format == 'binary':
+            # Raw image body, metadata in headers
+            return make_binary_response(
+                result,
+                encoding.mimetype,
+                headers={'X-Original-Format': original_format},
+                payload=payload
+            )
             
         else:  # return_format == 'file'
             # Return as downloadable file
             return send_file(
                 io.BytesIO(result),
-                mimetype='image/png',
+                mimetype=encoding.mimetype,
                 as_attachment=True,
-                download_name='background_removed.png'
+                download_name=f'background_removed.{encoding.extension}'
             )
         
     except ValueError as e:
@@ -198,49 +437,71 @@ def remove_background():
         return jsonify({'error': 'Internal server error occurred'}), 500
 
 @app.route('/api/remove-background-batch', methods=['POST'])
+@requires_models('rmbg')
 def remove_background_batch():
-    """Remove background from multiple images (supports both JSON and form data)"""
+    """
+    Remove background from multiple images (supports form data, JSON and msgpack)
+    
+    With stream=true (or Accept: application/x-ndjson) each result is sent as
+    one NDJSON line as soon as it is ready, followed by a final 'done' line.
+    """
     try:
-        # Handle form data (multipart/form-data)
-        files = request.files.getlist('images')
-        if not files:
+        payload = parse_request(request)
+        
+        # Validate input
+        if payload.empty:
             return jsonify({'error': 'No image files provided'}), 400
         
-        # Read all files
-        image_bytes_list = []
-        for file in files:
-            if file.filename != '':
-                image_bytes_list.append(file.read())
+        image_list = [DecodedImage(image) for image in (payload.images('images') or []) if image]
         
-        if not image_bytes_list:
+        if not image_list:
             return jsonify({'error': 'No valid files provided'}), 400
         
-        return_format = request.form.get('format', 'base64')
-        include_info = request.form.get('include_info', 'false').lower() == 'true'
+        return_format = payload.get('format', 'base64')
+        include_info = payload.get_bool('include_info', False)
         
         if return_format not in ['base64', 'bytes']:
             return jsonify({'error': 'format must be "base64" or "bytes" for batch processing'}), 400
         
-        # Remove backgrounds
-        results = bg_remover.process_multiple_images(image_bytes_list, return_format=return_format)
+        # Output codec: output_codec, compress_level, quality, lossless, max_dimension
+        encoding = OutputEncoding.from_params(payload.get)
         
-        # Add image info and format results for JSON response
-        for i, result in enumerate(results):
+        def finish(result):
+            # Add image info and format the result for the response
             if result['success']:
-                result['original_format'] = bg_remover.detect_image_format(image_bytes_list[i])
+                i = result['index']
+                result['original_format'] = BackgroundRemover.detect_image_format(image_list[i])
+                result['mimetype'] = encoding.mimetype
                 
                 if include_info:
-                    result['image_info'] = bg_remover.get_image_info(image_bytes_list[i])
+                    result['image_info'] = BackgroundRemover.get_image_info(image_list[i])
                 
-                if return_format == 'bytes':
-                    result['image'] = list(result['image'])  # Convert bytes to list for JSON
+                if return_format == 'base64':
+                    result['image'] = base64.b64encode(result['image']).decode('utf-8')
+            return result
+        
+        # Stream each result as one NDJSON line as soon as it is ready
+        if wants_stream(request, payload):
+            def records():
+                for result in bg_remover().iter_multiple_images(image_list, return_format='bytes', encoding=encoding):
+                    yield finish(result)
+                yield {
+                    'done': True,
+                    'success': True,
+                    'total_processed': len(image_list),
+                    'format': return_format
+                }
+            return make_stream_response(records(), payload=payload)
+        
+        # Remove backgrounds
+        results = [finish(result) for result in bg_remover().process_multiple_images(image_list, return_format='bytes', encoding=encoding)]
         
-        return jsonify({
+        return make_response(request, {
             'success': True,
             'results': results,
-            'total_processed': len(image_bytes_list),
+            'total_processed': len(image_list),
             'format': return_format
-        })
+        }, payload=payload)
         
     except ValueError as e:
         logger.error(f"Validation error: {e}")
@@ -253,32 +514,19 @@ def remove_background_batch():
 def get_image_info():
     """Get information about an image without processing it"""
     try:
-        # Handle form data
-        if request.content_type and 'multipart/form-data' in request.content_type:
-            if 'image' not in request.files:
-                return jsonify({'error': 'No image file provided'}), 400
-            
-            file = request.files['image']
-            if file.filename == '':
-                return jsonify({'error': 'No file selected'}), 400
-            
-            image_bytes = file.read()
-            
-        # Handle JSON data
-        else:
-            data = request.json
-            if not data or not data.get('image'):
-                return jsonify({'error': 'image is required'}), 400
-            
-            image_bytes = process_image_data(data.get('image'))
+        payload = parse_request(request)
+        image_bytes = payload.image('image')
+        
+        if not image_bytes:
+            return jsonify({'error': 'image is required'}), 400
         
         # Get image info
-        image_info = bg_remover.get_image_info(image_bytes)
+        image_info = BackgroundRemover.get_image_info(DecodedImage(image_bytes))
         
-        return jsonify({
+        return make_response(request, {
             'success': True,
             'image_info': image_info
-        })
+        }, payload=payload)
         
     except ValueError as e:
         logger.error(f"Validation error: {e}")
@@ -288,14 +536,196 @@ def get_image_info():
         return jsonify({'error': 'Internal server error occurred'}), 500
 
 @app.route('/api/detect-grade', methods=["POST"])
+@requires_models('cgc_identifier', 'image_to_text')
 def detect_grade():
-    data = request.json
-    if not data or not data.get('image'):
+    try:
+        payload = parse_request(request)
+        image_bytes = payload.image('image')
+    except ValueError as e:
+        return jsonify({'error': f'Invalid input: {str(e)}'}), 400
+    if not image_bytes:
         return jsonify({'error': 'image is required'}), 400
-    image_bytes = process_image_data(data.get('image'))
-    grade_detector = GrabcgcGrading()
-    results = grade_detector.process_image(image_bytes)
-    return jsonify(results)
+    # timings=true adds per-stage milliseconds to the response
+    timings = {} if payload.get_bool('timings', False) else None
+    results = grade_detector.process_image(DecodedImage(image_bytes), timings=timings)
+    if timings is not None:
+        results = dict(results, timings=timings)
+    return make_response(request, results, payload=payload)
+
+def job_accepted(job):
+    """202 response for a newly queued job, with where to follow it"""
+    return jsonify({
+        'success': True,
+        'job_id': job['id'],
+        'status': job['status'],
+        'total': job['total'],
+        'status_url': f"/api/jobs/{job['id']}",
+        'events_url': f"/api/jobs/{job['id']}/events"
+    }), 202
+
+@app.route('/api/jobs/remove-background-batch', methods=['POST'])
+def submit_background_removal_job():
+    """
+    Queue background removal of multiple images and return a job id right away
+    
+    Accepts the same images and output options as /api/remove-background-batch,
+    plus an integer priority (higher runs first). Each output image is fetched
+    from /api/jobs/<job_id>/results/<index> once its result record is in.
+    """
+    try:
+        payload = parse_request(request)
+        
+        if payload.empty:
+            return jsonify({'error': 'No image files provided'}), 400
+        
+        image_list = [DecodedImage(image) for image in (payload.images('images') or []) if image]
+        
+        if not image_list:
+            return jsonify({'error': 'No valid files provided'}), 400
+        
+        include_info = payload.get_bool('include_info', False)
+        encoding = OutputEncoding.from_params(payload.get)
+        priority = parse_priority(payload)
+        
+        def run(job):
+            for result in bg_remover().iter_multiple_images(image_list, return_format='bytes', encoding=encoding):
+                image = result.pop('image', None)
+                if result['success']:
+                    i = result['index']
+                    result['original_format'] = BackgroundRemover.detect_image_format(image_list[i])
+                    result['mimetype'] = encoding.mimetype
+                    result['url'] = f"/api/jobs/{job.id}/results/{i}"
+                    if include_info:
+                        result['image_info'] = BackgroundRemover.get_image_info(image_list[i])
+                job.add_result(result, blob=image)
+        
+        job = job_manager.submit('remove-background-batch', len(image_list), run, priority=priority)
+        return job_accepted(job)
+        
+    except QueueFullError as e:
+        logger.warning(str(e))
+        return jsonify({'error': 'Job queue is full, try again later'}), 503
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        return jsonify({'error': f'Invalid input: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Server error in submit_background_removal_job: {e}")
+        return jsonify({'error': 'Internal server error occurred'}), 500
+
+@app.route('/api/jobs/detect-grade', methods=['POST'])
+def submit_grade_job():
+    """Queue grade detection of one image and return a job id right away"""
+    try:
+        payload = parse_request(request)
+        image_bytes = payload.image('image')
+        
+        if not image_bytes:
+            return jsonify({'error': 'image is required'}), 400
+        
+        image = DecodedImage(image_bytes)
+        priority = parse_priority(payload)
+        
+        def run(job):
+            job.add_result({'index': 0, 'success': True, 'result': grade_detector.process_image(image)})
+        
+        job = job_manager.submit('detect-grade', 1, run, priority=priority)
+        return job_accepted(job)
+        
+    except QueueFullError as e:
+        logger.warning(str(e))
+        return jsonify({'error': 'Job queue is full, try again later'}), 503
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        return jsonify({'error': f'Invalid input: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Server error in submit_grade_job: {e}")
+        return jsonify({'error': 'Internal server error occurred'}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status, progress and the result records received so far for a job"""
+    job = job_manager.store.load(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return make_response(request, {'success': True, 'job': job})
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_event_stream(job_id):
+    """Server-sent events with a job's progress and each result as it finishes"""
+    if job_manager.store.load(job_id) is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    events = job_events(job_manager.store, job_id, poll_interval=config.JOB_POLL_INTERVAL_MS / 1000.0)
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/jobs/<job_id>/results/<int:index>', methods=['GET'])
+def get_job_result(job_id, index):
+    """Raw output image of one finished item of a job"""
+    job = job_manager.store.load(job_id)
+    record = next((r for r in job['results'] if r['index'] == index), None) if job else None
+    if record is None or not record.get('has_blob'):
+        return jsonify({'error': 'Result not found'}), 404
+    data = job_manager.store.read_blob(job_id, index)
+    if data is None:
+        return jsonify({'error': 'Result not found'}), 404
+    return make_binary_response(data, record.get('mimetype', 'application/octet-stream'))
+
+@app.route('/api/detect-grade-batch', methods=['POST'])
+@requires_models('cgc_identifier', 'image_to_text')
+def detect_grade_batch():
+    """
+    Detect CGC grades for multiple images (supports form data, JSON and msgpack)
+    
+    With detections_only=true the raw YOLO detections of each image are
+    returned instead of the graded text. timings=true adds per-stage
+    milliseconds for each image.
+    """
+    try:
+        payload = parse_request(request)
+        
+        if payload.empty:
+            return jsonify({'error': 'No image files provided'}), 400
+        
+        image_list = [DecodedImage(image) for image in (payload.images('images') or []) if image]
+        
+        if not image_list:
+            return jsonify({'error': 'No valid files provided'}), 400
+        if len(image_list) > config.CGC_MAX_BATCH_IMAGES:
+            return jsonify({'error': f'At most {config.CGC_MAX_BATCH_IMAGES} images per batch'}), 400
+        
+        if payload.get_bool('detections_only', False):
+            detections = grade_detector.identifier.identify_cgc_batch(image_list, conf_threshold=GRADE_CONFIDENCE)
+            results = [{'detections': image_detections} for image_detections in detections]
+        else:
+            timings = [] if payload.get_bool('timings', False) else None
+            results = grade_detector.process_images(image_list, timings=timings)
+            if timings is not None:
+                results = [dict(result, timings=image_timings) for result, image_timings in zip(results, timings)]
+        
+        return make_response(request, {
+            'success': True,
+            'results': results,
+            'total_processed': len(image_list)
+        }, payload=payload)
+        
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        return jsonify({'error': f'Invalid input: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Server error in detect_grade_batch: {e}")
+        return jsonify({'error': 'Internal server error occurred'}), 500
+
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    """Report hit, miss and dedup counters for the CLIP embedding and grading caches"""
+    return jsonify({
+        'success': True,
+        'embedding_cache': comparer().cache.stats() if model_registry.is_loaded('clip') else None,
+        'grade_cache': grade_detector.cache.stats()
+    })
 
 @app.errorhandler(413)
 def too_large(e):
@@ -306,9 +736,10 @@ def not_found(e):
     return jsonify({'error': 'Endpoint not found'}), 404
 
 if __name__ == '__main__':
+    # Single process development server; use serve.py for multi-worker production serving
     app.run(
         debug=False,  # Set to False for production
-        host='0.0.0.0',  # Allow external connections
-        port=5000,
+        host=config.SERVER_HOST,  # Allow external connections
+        port=config.SERVER_PORT,
         threaded=True  # Handle multiple requests
     )
\ No newline at end of file